@@ -51,6 +51,8 @@ class App:
             self.bt_connection_monitor(),
             self.batt_monitor(),
             self.flip_monitor(),
+            readings.background_task(),
+            self.display.refresh_task(),
         ]
         self.current_task: Optional[asyncio.Task] = None
         self.exception_context = {}
@@ -178,13 +180,18 @@ class App:
 
     async def flip_monitor(self):
         logger.debug("Starting flip monitor")
+        axes = None
+        axes_name = None
         while True:
             await asyncio.sleep(0.3)
             grav = self.devices.accelerometer.acceleration
-            if self.config.calib is not None:
-                grav = self.config.calib.grav.apply(grav)
+            fused_calib = self.config.fused_calib
+            if fused_calib is not None:
+                grav = fused_calib.grav.apply(grav)
             else:
-                axes = mag_cal.Axes(self.config.mag_axes)
+                if axes_name != self.config.mag_axes:
+                    axes_name = self.config.mag_axes
+                    axes = mag_cal.Axes(axes_name)
                 grav = axes.fix_axes(grav)
                 grav /= 9.81
             if self.display.inverted and grav[0] < -0.5:
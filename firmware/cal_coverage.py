@@ -0,0 +1,199 @@
+"""
+Keep track of how well a set of calibration shots covers the possible orientations, so the user
+can be told what is still needed while taking them, and collection can stop once there are
+enough.
+
+The direction of each reading, in the device's axes, is put into one of 14 regions of a sphere:
+six around the ends of the axes and eight around the corners of a cube. This is done separately
+for the magnetometer and the accelerometer. A provisional ellipsoid fit is updated after each
+shot from the running sums in `ellipsoid.EllipsoidAccumulator`, which also gives a rough
+accuracy estimate without keeping any readings.
+"""
+import math
+
+try:
+    from . import ellipsoid
+except ImportError:
+    # running on the host, not as part of the firmware package
+    import ellipsoid
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import List, Optional, Sequence, Tuple
+except ImportError:
+    pass
+
+_C = 1 / math.sqrt(3)
+REGIONS = (
+    (1.0, 0.0, 0.0), (-1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, -1.0, 0.0), (0.0, 0.0, 1.0), (0.0, 0.0, -1.0),
+    (_C, _C, _C), (_C, _C, -_C), (_C, -_C, _C), (_C, -_C, -_C),
+    (-_C, _C, _C), (-_C, _C, -_C), (-_C, -_C, _C), (-_C, -_C, -_C),
+)
+"""Centres of the regions of the sphere that readings are put into"""
+
+ORIENTATION_NAMES = ("left side", "right side", "point up", "point down", "flat", "upside down")
+"""How the device is held when up is along each of the first six regions"""
+
+TARGET_COVERAGE = 0.8
+"""Fraction of regions, over both sensors, that must have a shot in before collection ends"""
+
+TARGET_ACCURACY = 0.5
+"""Estimated accuracy, in degrees, needed before collection ends"""
+
+MIN_SHOTS = 24
+"""Least number of shots to take"""
+
+MIN_RUNS = 2
+"""Least number of runs of shots taken in the same direction"""
+
+MIN_RUN_LENGTH = 4
+"""Least number of shots in a run, as for ``Calibration.find_similar_shots``"""
+
+RUN_TOLERANCE = 0.25
+"""Largest change in the forward component of each reading, as a fraction of its length, between
+shots in a run"""
+
+DISPLAY_COLUMNS = 21
+"""Characters that fit across the display, 128 pixels in the 6 pixel wide terminal font"""
+
+PLAUSIBLE_UNIFORMITY = 0.05
+"""The provisional centre is only used to sort magnetometer readings into regions once the fit is
+this good, as fits to the first few shots can be far out"""
+
+
+def region(vector: Sequence[float]) -> int:
+    """
+    :param vector: Direction, need not be normalised
+    :return: Index of the region in `REGIONS` nearest to the direction
+    """
+    x, y, z = vector
+    best = 0
+    best_dot = None
+    for i, (rx, ry, rz) in enumerate(REGIONS):
+        dot = x * rx + y * ry + z * rz
+        if best_dot is None or dot > best_dot:
+            best = i
+            best_dot = dot
+    return best
+
+
+def _length(vector: Sequence[float]) -> float:
+    x, y, z = vector
+    return math.sqrt(x * x + y * y + z * z)
+
+
+class CoverageTracker:
+    """
+    Follows the shots taken for a calibration
+    """
+
+    def __init__(self, mag_axes: str = "+X+Y+Z", grav_axes: str = "+X+Y+Z"):
+        """
+        :param mag_axes: How the magnetometer is mounted, as for ``Sensor``
+        :param grav_axes: How the accelerometer is mounted, as for ``Sensor``
+        """
+        self.fits = (ellipsoid.EllipsoidAccumulator(mag_axes), ellipsoid.EllipsoidAccumulator(grav_axes))
+        self.mag_regions = bytearray(len(REGIONS))
+        self.grav_regions = bytearray(len(REGIONS))
+        self.count = 0
+        self.runs = 0
+        self.accuracy: Optional[float] = None
+        self._mag_centre = (0.0, 0.0, 0.0)
+        self._grav_centre = (0.0, 0.0, 0.0)
+        self._run_start: Optional[Tuple[Sequence[float], Sequence[float]]] = None
+        self._run_length = 0
+
+    def add(self, mag: Sequence[float], grav: Sequence[float]):
+        """
+        Include a shot
+
+        :param mag: Raw magnetometer reading
+        :param grav: Raw accelerometer reading
+        """
+        mag_fit, grav_fit = self.fits
+        mag_fit.add(mag)
+        grav_fit.add(grav)
+        self.count += 1
+        mag = mag_fit.fix_axes(mag)
+        grav = grav_fit.fix_axes(grav)
+        self._follow_run(mag, grav)
+        self.mag_regions[region(self._centred(mag, self._mag_centre))] = 1
+        # the accelerometer measures down, regions are for up so they match ORIENTATION_NAMES
+        self.grav_regions[region([-x for x in self._centred(grav, self._grav_centre)])] = 1
+        if self.count >= ellipsoid.MIN_READINGS:
+            self._update_fit()
+
+    @staticmethod
+    def _centred(reading: Sequence[float], centre: Sequence[float]) -> Tuple[float, float, float]:
+        return reading[0] - centre[0], reading[1] - centre[1], reading[2] - centre[2]
+
+    def _follow_run(self, mag: Sequence[float], grav: Sequence[float]):
+        # when the device is turned about its forward axis, the forward component of both raw
+        # readings stays the same whatever their offsets, so this follows
+        # Calibration.find_similar_shots without needing a calibration
+        if self._run_start is not None:
+            start_mag, start_grav = self._run_start
+            if self._same_direction(mag, start_mag) and self._same_direction(grav, start_grav):
+                self._run_length += 1
+                if self._run_length == MIN_RUN_LENGTH:
+                    self.runs += 1
+                return
+        self._run_start = (mag, grav)
+        self._run_length = 1
+
+    @staticmethod
+    def _same_direction(reading: Sequence[float], start: Sequence[float]) -> bool:
+        return abs(reading[1] - start[1]) <= RUN_TOLERANCE * _length(start)
+
+    def _update_fit(self):
+        try:
+            mag_centre, mag_uniformity = self.fits[0].estimate()
+            grav_centre, grav_uniformity = self.fits[1].estimate()
+        except (ValueError, ArithmeticError):
+            # readings so far do not fit an ellipsoid yet
+            self.accuracy = None
+            return
+        if mag_uniformity < PLAUSIBLE_UNIFORMITY:
+            self._mag_centre = tuple(float(x) for x in mag_centre)
+        if grav_uniformity < PLAUSIBLE_UNIFORMITY:
+            self._grav_centre = tuple(float(x) for x in grav_centre)
+        # a reading off the unit sphere by a small fraction is out by that many radians
+        self.accuracy = math.degrees(math.sqrt(mag_uniformity ** 2 + grav_uniformity ** 2))
+
+    @property
+    def coverage(self) -> float:
+        """Fraction of regions with a shot in, over both sensors"""
+        return (sum(self.mag_regions) + sum(self.grav_regions)) / (2 * len(REGIONS))
+
+    def missing(self) -> List[str]:
+        """
+        :return: Names of device orientations that have no shots yet
+        """
+        return [name for name, seen in zip(ORIENTATION_NAMES, self.grav_regions) if not seen]
+
+    @property
+    def complete(self) -> bool:
+        """True once enough shots have been taken to calibrate well"""
+        return (self.count >= MIN_SHOTS and self.runs >= MIN_RUNS and self.coverage >= TARGET_COVERAGE and
+                self.accuracy is not None and self.accuracy <= TARGET_ACCURACY)
+
+    def summary(self) -> str:
+        """
+        :return: Progress report for the display
+        """
+        accuracy = "--" if self.accuracy is None else f"{self.accuracy:.2f}°"
+        lines = [f"Shots: {self.count} Runs: {self.runs}",
+                 f"Coverage: {self.coverage * 100:.0f}%",
+                 f"Est. acc: {accuracy}"]
+        missing = self.missing()
+        if missing:
+            # as many of the missing orientations as fit on one line
+            hint = "Try: " + missing[0]
+            for name in missing[1:]:
+                if len(hint) + 2 + len(name) > DISPLAY_COLUMNS:
+                    break
+                hint += ", " + name
+            lines.append(hint)
+        elif self.runs < MIN_RUNS:
+            lines.append(f"Need {MIN_RUNS} runs of {MIN_RUN_LENGTH}")
+        return "\r\n".join(line[:DISPLAY_COLUMNS] for line in lines)
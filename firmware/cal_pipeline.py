@@ -0,0 +1,362 @@
+"""
+Sensor calibration as a series of stages, saving progress to flash after each one. If the device
+runs out of memory or the watchdog fires part way through, it is reset and `calibrate_if_due`
+carries on from the stage that failed rather than starting again.
+
+The progress file holds the stage to run next, the calibration so far and the runs of shots found,
+along with a fingerprint of the readings so that progress is only used for the same readings.
+
+Stages that take time in proportion to the number of readings work through them a shot at a time,
+so `CalibrationPipeline.run_async` can let other tasks run, including feeding the watchdog, every
+few milliseconds.
+"""
+import asyncio
+import json
+import math
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    from ulab import numpy as np
+
+try:
+    from . import calibrate_roll
+    from . import ellipsoid
+    from . import storage
+except ImportError:
+    # running on the host, not as part of the firmware package
+    import calibrate_roll
+    import ellipsoid
+    import storage
+
+import mag_cal
+import mag_cal.rbf
+from mag_cal.utils import solve_least_squares
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Callable, Iterator, List, Optional, Sequence
+except ImportError:
+    pass
+
+PROGRESS_FILE = "/calibration_progress.json"
+
+STAGES = (
+    ("ellipsoid", "Fitting Ellipsoid"),
+    ("runs", "Finding runs"),
+    ("axes", "Fitting Axes"),
+    ("roll", "Aligning rolls"),
+    ("non_linear", "Non-linear adjust"),
+    ("field", "Checking accuracy"),
+)
+"""Name and description of each stage, in the order they are run"""
+
+SLICE_MS = 20
+"""Longest time `CalibrationPipeline.run_async` works before letting other tasks run"""
+
+REPORT_MS = 250
+"""Shortest time between progress reports from `CalibrationPipeline.run_async`"""
+
+RUN_PRECISION = 30
+"""Degrees within which shots must be to count as a run, as for ``Calibration.find_similar_shots``"""
+
+MIN_RUN = 4
+"""Least number of shots in a run, as for ``Calibration.find_similar_shots``"""
+
+NON_LINEAR_PARAMS = 3
+"""Parameters per axis for the non-linear fit, as for ``Calibration.fit_non_linear_quick``"""
+
+
+def fingerprint(mag_data, grav_data, mag_axes: str, grav_axes: str) -> list:
+    """
+    :return: Summary of a set of readings and sensor axes, to tell whether saved progress is for them
+    """
+    return [len(mag_data), float(np.sum(mag_data)), float(np.sum(grav_data)), mag_axes, grav_axes]
+
+
+def _same_fingerprint(a: list, b: list) -> bool:
+    if len(a) != len(b) or a[0] != b[0] or a[3:] != b[3:]:
+        return False
+    # sums may differ in the last place after the readings are saved and loaded again
+    return all(abs(x - y) <= 1e-5 * max(abs(x), abs(y), 1.0) for x, y in zip(a[1:3], b[1:3]))
+
+
+def remove_progress(fname: str = PROGRESS_FILE):
+    """
+    Remove saved progress, once the calibration has been saved or discarded
+    """
+    storage.remove(fname)
+
+
+class CalibrationPipeline:
+    """
+    Runs the calibration one stage at a time. Create it, then call `run_stage` until `done`, or
+    await `run_async` to run every stage while letting other tasks carry on
+    """
+
+    def __init__(self, mag_data, grav_data, mag_axes: str = "+X+Y+Z", grav_axes: str = "+X+Y+Z",
+                 fits: Optional[Sequence[ellipsoid.EllipsoidAccumulator]] = None,
+                 progress_file: str = PROGRESS_FILE, weights: Optional[Sequence[float]] = None,
+                 breaks: Optional[Sequence[int]] = None):
+        """
+        :param mag_data: Magnetometer readings, shape (N, 3)
+        :param grav_data: Accelerometer readings, shape (N, 3)
+        :param mag_axes: How the magnetometer is mounted, as for ``Calibration``
+        :param grav_axes: How the accelerometer is mounted, as for ``Calibration``
+        :param fits: Magnetometer and accelerometer ellipsoid sums, if they were built up as the
+          readings were taken. They are worked out from the readings if not given
+        :param progress_file: Where to save progress
+        :param weights: How much each reading counts towards the ellipsoid fits, if not equally.
+          Only used when ``fits`` is not given
+        :param breaks: Index after the last reading of each session, when readings from several
+          sessions are combined, as from `cal_store.merge`. Runs are not looked for across them
+        """
+        self.mag_data = mag_data
+        self.grav_data = grav_data
+        self.mag_axes = mag_axes
+        self.grav_axes = grav_axes
+        self.fits = fits
+        self.weights = weights
+        self.breaks = breaks
+        self.progress_file = progress_file
+        self.fingerprint = fingerprint(mag_data, grav_data, mag_axes, grav_axes)
+        self.stage = 0
+        self.cal = mag_cal.Calibration(mag_axes=mag_axes, grav_axes=grav_axes)
+        self.runs: List[List[int]] = []
+        self.accuracy: Optional[float] = None
+        self.resumed = self._load()
+
+    @property
+    def done(self) -> bool:
+        """True once every stage has been run"""
+        return self.stage >= len(STAGES)
+
+    @property
+    def description(self) -> str:
+        """Description of the next stage to run"""
+        return STAGES[self.stage][1]
+
+    def run_stage(self):
+        """
+        Run the next stage and save progress
+
+        :raises ValueError: if the readings do not contain any runs of shots in the same direction
+        """
+        for _ in self.steps():
+            pass
+
+    def steps(self) -> Iterator[float]:
+        """
+        Run the next stage a piece at a time, then save progress
+
+        :return: Iterator giving the fraction of the stage done after each piece
+        :raises ValueError: if the readings do not contain any runs of shots in the same direction
+        """
+        pieces = getattr(self, "_" + STAGES[self.stage][0])()
+        if pieces is not None:
+            for fraction in pieces:
+                yield fraction
+        self.stage += 1
+        self._save()
+
+    def run(self) -> float:
+        """
+        Run all remaining stages
+
+        :return: Accuracy of the calibration, as from ``Calibration.accuracy``
+        """
+        while not self.done:
+            self.run_stage()
+        return self.accuracy
+
+    async def run_async(self, report: Optional[Callable[[str, float], None]] = None,
+                        slice_ms: int = SLICE_MS, report_ms: int = REPORT_MS) -> float:
+        """
+        Run all remaining stages, letting other tasks run at least every ``slice_ms``
+
+        :param report: Called with the description of the current stage and the fraction of it done
+        :param slice_ms: Longest time to work without letting other tasks run
+        :param report_ms: Shortest time between calls to ``report``, other than at the start of each
+          stage
+        :return: Accuracy of the calibration, as from ``Calibration.accuracy``
+        """
+        slice_ns = slice_ms * 1000000
+        report_ns = report_ms * 1000000
+        while not self.done:
+            description = self.description
+            if report is not None:
+                report(description, 0.0)
+            await asyncio.sleep(0)
+            now = time.monotonic_ns()
+            next_yield = now + slice_ns
+            next_report = now + report_ns
+            for fraction in self.steps():
+                now = time.monotonic_ns()
+                if now < next_yield:
+                    continue
+                if report is not None and now >= next_report:
+                    report(description, fraction)
+                    next_report = now + report_ns
+                await asyncio.sleep(0)
+                next_yield = time.monotonic_ns() + slice_ns
+        return self.accuracy
+
+    def _paired_data(self) -> list:
+        return [(self.mag_data[a:b], self.grav_data[a:b]) for a, b in self.runs]
+
+    def _ellipsoid(self):
+        fits = self.fits
+        if fits is None:
+            fits = (ellipsoid.EllipsoidAccumulator(self.mag_axes), ellipsoid.EllipsoidAccumulator(self.grav_axes))
+            count = len(self.mag_data)
+            for i in range(count):
+                weight = 1.0 if self.weights is None else self.weights[i]
+                fits[0].add(self.mag_data[i], weight)
+                fits[1].add(self.grav_data[i], weight)
+                yield (i + 1) / count
+        fits[0].fit(self.cal.mag)
+        fits[1].fit(self.cal.grav)
+
+    def _runs(self):
+        # Calibration.find_similar_shots, a shot at a time
+        if getattr(mag_cal.Calibration, "_is_a_run", None) is None:
+            # this version of mag_cal does not have the check for a run used below
+            for fraction in self._runs_by_session():
+                yield fraction
+            return
+        count = len(self.mag_data)
+        azimuths = []
+        inclinations = []
+        for i in range(count):
+            azimuth, inclination, _ = self.cal.get_angles(self.mag_data[i], self.grav_data[i])
+            azimuths.append(float(azimuth))
+            inclinations.append(float(inclination))
+            yield 0.5 * (i + 1) / count
+        runs = []
+        i = 0
+        while i < count - MIN_RUN:
+            end = count
+            if self.breaks:
+                end = min([b for b in self.breaks if b > i] or [count])
+            for j in reversed(range(i + MIN_RUN, end + 1)):
+                yield 0.5 + 0.5 * i / count
+                # noinspection PyProtectedMember
+                if self.cal._is_a_run(azimuths[i:j], inclinations[i:j], RUN_PRECISION):
+                    runs.append([i, j])
+                    i = j
+                    break
+            else:
+                i += 1
+        if len(runs) == 0:
+            raise ValueError("No runs of shots all in the same direction found")
+        self.runs = runs
+
+    def _runs_by_session(self):
+        count = len(self.mag_data)
+        ends = [b for b in (self.breaks or []) if b < count] + [count]
+        runs = []
+        start = 0
+        for end in ends:
+            found = self.cal.find_similar_shots(self.mag_data[start:end], self.grav_data[start:end],
+                                                RUN_PRECISION, MIN_RUN)
+            runs.extend([a + start, b + start] for a, b in found)
+            start = end
+            yield end / count
+        if len(runs) == 0:
+            raise ValueError("No runs of shots all in the same direction found")
+        self.runs = runs
+
+    def _axes(self):
+        self.cal.fit_to_axis(self._paired_data())
+
+    def _roll(self):
+        align = getattr(mag_cal.Calibration, "align_sensor_roll", calibrate_roll.align_sensor_roll)
+        if align is not calibrate_roll.align_sensor_roll:
+            # mag_cal has its own
+            self.cal.align_sensor_roll(self.mag_data, self.grav_data)
+            return
+        # calibrate_roll.align_sensor_roll, a shot at a time
+        fit = calibrate_roll.RollFit(1)
+        count = len(self.mag_data)
+        for i in range(count):
+            fit.add(self.cal.mag.apply(self.mag_data[i]), self.cal.grav.apply(self.grav_data[i]))
+            yield (i + 1) / count
+        fit.solve()
+        calibrate_roll.apply_roll(self.cal, fit.rotation())
+
+    def _non_linear(self):
+        # Calibration.fit_non_linear_quick, a shot at a time
+        sensor = self.cal.mag
+        sensor.set_linear()
+        total = sum(b - a for a, b in self.runs)
+        param_count = NON_LINEAR_PARAMS
+        rbf = mag_cal.rbf.RBF(np.zeros(param_count))
+        input_data = np.zeros((total * 2, param_count * 2))
+        output_data = np.zeros((total * 2,))
+        row = 0
+        done = 0
+        for start, end in self.runs:
+            # remove the effect of roll from each reading, and find the average for the run
+            rolls = []
+            raw_mags = []
+            average = np.zeros(3)
+            for i in range(start, end):
+                _, _, roll = self.cal.get_angles(self.mag_data[i], self.grav_data[i])
+                c = math.cos(math.radians(roll))
+                s = math.sin(math.radians(roll))
+                raw = sensor.apply(self.mag_data[i])
+                average += np.array([c * raw[0] + s * raw[2], raw[1], c * raw[2] - s * raw[0]])
+                rolls.append((c, s))
+                raw_mags.append(raw)
+                done += 1
+                yield done / (total * 2)
+            average /= end - start
+            # then put the roll back to find the reading each shot should have given
+            for (c, s), raw in zip(rolls, raw_mags):
+                expected_x = average[0] * c - average[2] * s
+                expected_z = average[0] * s + average[2] * c
+                factors = rbf.get_gaussians(raw).transpose()
+                input_data[row, :param_count] = factors[0]
+                input_data[row + 1, -param_count:] = factors[2]
+                output_data[row] = expected_x - raw[0]
+                output_data[row + 1] = expected_z - raw[2]
+                row += 2
+                done += 1
+                yield done / (total * 2)
+        params = solve_least_squares(input_data, output_data)
+        all_params = np.zeros(param_count * 3)
+        all_params[:param_count] = params[:param_count]
+        all_params[-param_count:] = params[-param_count:]
+        sensor.set_non_linear_params(all_params)
+
+    def _field(self):
+        self.cal.set_field_characteristics(self.mag_data, self.grav_data)
+        self.accuracy = float(self.cal.accuracy(self._paired_data()))
+
+    def _save(self):
+        dct = {
+            "fingerprint": self.fingerprint,
+            "stage": self.stage,
+            "calib": self.cal.as_dict(),
+            "runs": self.runs,
+            "accuracy": self.accuracy,
+        }
+        try:
+            storage.write_atomic(self.progress_file, json.dumps(dct).encode())
+        except OSError:
+            # progress only saves time if the device resets, so carry on without it
+            pass
+
+    def _load(self) -> bool:
+        try:
+            dct = json.loads(storage.read_atomic(self.progress_file).decode())
+        except (OSError, ValueError):
+            return False
+        if not _same_fingerprint(dct["fingerprint"], self.fingerprint):
+            return False
+        self.stage = dct["stage"]
+        self.cal = mag_cal.Calibration.from_dict(dct["calib"])
+        self.runs = dct["runs"]
+        self.accuracy = dct["accuracy"]
+        return True
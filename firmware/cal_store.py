@@ -0,0 +1,142 @@
+"""
+Calibration shots from every session, so that a calibration can be refreshed with a few new shots
+rather than starting from scratch.
+
+The store is a text file with one line of JSON per session, giving its id, the time it was taken
+and its magnetometer and accelerometer readings. Sessions are only ever appended, each on a line
+of its own, so losing power while one is being written can only damage that session. Once there
+are more than `MAX_SESSIONS` the oldest are dropped.
+
+`merge` combines the most recent sessions for `cal_pipeline.CalibrationPipeline`, weighting
+older sessions less, as the sensors drift and the magnetic environment changes.
+"""
+import json
+import time
+
+try:
+    from . import storage
+except ImportError:
+    # running on the host, not as part of the firmware package
+    import storage
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import List, Optional, Sequence, Tuple
+except ImportError:
+    pass
+
+STORE_FILE = "/calibration_sessions.jsonl"
+
+MAX_SESSIONS = 8
+"""Sessions kept in the store"""
+
+MERGE_SESSIONS = 4
+"""Most recent sessions to calibrate from"""
+
+MAX_SHOTS = 120
+"""Older sessions are left out of a merge once it has this many shots"""
+
+DECAY = 0.5
+"""Weight of each session relative to the one after it"""
+
+
+def _read(fname: str):
+    try:
+        f = open(fname)
+    except OSError:
+        return
+    with f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                session = json.loads(line)
+            except ValueError:
+                # only written in part when the power went
+                continue
+            yield session
+
+
+def load_sessions(fname: str = STORE_FILE, limit: Optional[int] = None) -> List[dict]:
+    """
+    :param fname: Store to read
+    :param limit: Only return this many of the most recent sessions
+    :return: Sessions, oldest first, each a dict with ``id``, ``time``, ``mag`` and ``grav``
+    """
+    sessions = []
+    for session in _read(fname):
+        sessions.append(session)
+        if limit is not None and len(sessions) > limit:
+            sessions.pop(0)
+    return sessions
+
+
+def recent_sessions(unsaved: Optional[dict] = None, fname: str = STORE_FILE,
+                    limit: int = MERGE_SESSIONS) -> List[dict]:
+    """
+    :param unsaved: Session that could not be added to the store, with ``mag`` and ``grav``, to
+      include as the most recent
+    :param fname: Store to read
+    :param limit: Number of sessions to return, including ``unsaved``
+    :return: Sessions to calibrate from, oldest first, as for `merge`
+    """
+    if unsaved is None:
+        return load_sessions(fname, limit)
+    sessions = load_sessions(fname, limit - 1)
+    sessions.append(unsaved)
+    return sessions
+
+
+def append_session(mag: Sequence, grav: Sequence, fname: str = STORE_FILE) -> int:
+    """
+    Add a session to the store, dropping the oldest if there are more than `MAX_SESSIONS`
+
+    :param mag: Magnetometer readings
+    :param grav: Accelerometer readings
+    :param fname: Store to add to
+    :return: Id of the new session
+    :raises OSError: if the store cannot be written
+    """
+    ids = [session["id"] for session in _read(fname)]
+    session_id = max(ids) + 1 if ids else 1
+    line = json.dumps({"id": session_id, "time": int(time.time()),
+                       "mag": [list(m) for m in mag], "grav": [list(g) for g in grav]})
+    if len(ids) < MAX_SESSIONS:
+        # start with a newline in case the last session was not finished
+        with open(fname, "a") as f:
+            f.write("\n" + line)
+    else:
+        lines = [json.dumps(session) for session in load_sessions(fname, MAX_SESSIONS - 1)]
+        lines.append(line)
+        storage.write_atomic(fname, "\n".join(lines).encode())
+    return session_id
+
+
+def merge(sessions: Sequence[dict], decay: float = DECAY,
+          max_shots: int = MAX_SHOTS) -> Tuple[list, list, list, list]:
+    """
+    Combine sessions to calibrate from, newest first. The newest session has weight 1, and each
+    one before it `DECAY` times the weight of the next. Older sessions are left out once there are
+    ``max_shots``, though the newest is always included
+
+    :param sessions: Sessions, oldest first, as from `load_sessions`
+    :param decay: Weight of each session relative to the one after it
+    :param max_shots: Shots to stop at
+    :return: Magnetometer readings, accelerometer readings, the weight of each, and the index
+      after the last shot of each session included
+    """
+    mag = []
+    grav = []
+    weights = []
+    breaks = []
+    weight = 1.0
+    for session in reversed(sessions):
+        if breaks and len(mag) + len(session["mag"]) > max_shots:
+            break
+        mag.extend(session["mag"])
+        grav.extend(session["grav"])
+        weights.extend([weight] * len(session["mag"]))
+        breaks.append(len(mag))
+        weight *= decay
+    return mag, grav, weights, breaks
@@ -17,6 +17,10 @@ except ImportError:
 
 from . import utils
 from . import config
+from . import cal_coverage
+from . import cal_pipeline
+from . import cal_store
+from . import sampling
 from .debug import logger
 
 if not hasattr(mag_cal.Calibration,"align_sensor_roll"):
@@ -50,43 +54,98 @@ async def calibrate_sensors(devices: hardware.HardwareBase, cfg: config.Config,
     prelude = "Take a series of\r\nreadings, press\r\nA for a leg,\r\nB to finish"
     reminder = "Ideally at least 24\r\nWith two groups\r\nin same direction"
     fname = CAL_DATA_FILE
-    mags, gravs = await measure.take_multiple_readings(devices, disp, fname, prelude, reminder)
+    tracker = cal_coverage.CoverageTracker(cfg.mag_axes, cfg.grav_axes)
+    mags, gravs = await measure.take_multiple_readings(devices, disp, fname, prelude, reminder, tracker,
+                                                      cfg.sensor_samples, cfg.laser_guard)
+    store_session(mags, gravs)
     mags = np.array(mags)
     gravs = np.array(gravs)
-    await live_calibration(mags, gravs, devices, cfg, disp)
+    await live_calibration(mags, gravs, tracker.fits, devices, cfg, disp)
+
+
+async def top_up_calibration(devices: hardware.HardwareBase, cfg: config.Config, disp: display.DisplayBase):
+    from . import measure
+    if not cal_store.load_sessions(limit=1):
+        disp.show_info("No saved sessions\r\nCalibrate sensors\r\nfirst\r\nPress A to exit")
+        await devices.button_a.wait(Button.SINGLE)
+        return
+    prelude = "Take a few readings\r\nto add to earlier\r\nones, press A for\r\na leg, B to finish"
+    reminder = "Ideally a run of 4\r\nin same direction"
+    mags, gravs = await measure.take_multiple_readings(devices, disp, CAL_DATA_FILE, prelude, reminder, None,
+                                                      cfg.sensor_samples, cfg.laser_guard)
+    if not mags:
+        return
+    if store_session(mags, gravs):
+        del mags, gravs
+        await calibrate_from_store(devices, cfg, disp)
+    else:
+        await calibrate_from_store(devices, cfg, disp, {"mag": mags, "grav": gravs})
 
 
 async def cal_from_saved(devices: hardware.HardwareBase, cfg: config.Config, disp: display.DisplayBase):
-    global cal, accuracy
+    if cal_store.load_sessions(limit=1):
+        await calibrate_from_store(devices, cfg, disp)
+        return
+    # readings taken before sessions were stored
+    mag_data, grav_data, weights, breaks = load_cal_data()
+    await live_calibration(mag_data, grav_data, None, devices, cfg, disp, weights, breaks)
+
+
+async def calibrate_from_store(devices: hardware.HardwareBase, cfg: config.Config, disp: display.DisplayBase,
+                               unsaved: Optional[dict] = None):
+    """
+    Calibrate from the most recent sessions in the store
+
+    :param unsaved: Session that could not be added to the store, as a dict with ``mag`` and
+      ``grav``, to use as the newest session
+    """
+    mags, gravs, weights, breaks = cal_store.merge(cal_store.recent_sessions(unsaved))
+    try:
+        # so calibrate_if_due can carry on with the same readings after a reset
+        with open(CAL_DATA_FILE, "w") as f:
+            json.dump({"mag": mags, "grav": gravs, "weights": weights, "breaks": breaks}, f)
+    except OSError:
+        pass
+    await live_calibration(np.array(mags), np.array(gravs), None, devices, cfg, disp, weights, breaks)
+
+
+def store_session(mags, gravs) -> bool:
+    """
+    Add a session to the store
+
+    :return: False if it could not be saved, as when connected to a computer
+    """
+    try:
+        cal_store.append_session(mags, gravs)
+    except OSError:
+        logger.warning("Unable to save calibration session")
+        return False
+    return True
+
+
+def load_cal_data():
+    """
+    :return: Magnetometer and accelerometer readings from the last calibration, and their weights
+      and session breaks if it combined several sessions
+    """
     with open(CAL_DATA_FILE) as f:
         data = json.load(f)
-    mag_data, grav_data = np.array(data['mag']), np.array(data['grav'])
-    del data
-    await live_calibration(mag_data, grav_data, devices, cfg, disp)
+    return np.array(data['mag']), np.array(data['grav']), data.get('weights'), data.get('breaks')
 
 
-async def live_calibration(mag_data, grav_data, devices, cfg, disp):
+async def live_calibration(mag_data, grav_data, fits, devices, cfg, disp, weights=None, breaks=None):
     updater = utils.Updater(disp)
     global cal, accuracy
     try:
         await updater.update("Starting calibration")
-        cal = mag_cal.Calibration(mag_axes=cfg.mag_axes, grav_axes=cfg.grav_axes)
-        await updater.update("Fitting Ellipsoid")
-        cal.fit_ellipsoid(mag_data, grav_data)
-        await updater.update("Finding runs")
-        runs = cal.find_similar_shots(mag_data, grav_data)
-        if len(runs) == 0:
-            raise ValueError("No runs of shots all in the same direction found")
-        paired_data = [(mag_data[a:b], grav_data[a:b]) for a, b in runs]
-        await updater.update("Fitting Axes")
-        cal.fit_to_axis(paired_data)
-        await updater.update("Aligning rolls")
-        cal.align_sensor_roll(mag_data,grav_data)
-        await updater.update("Non-linear adjust")
-        cal.fit_non_linear_quick(paired_data)
-        cal.set_field_characteristics(mag_data, grav_data)
-        accuracy = cal.accuracy(paired_data)
+        pipeline = cal_pipeline.CalibrationPipeline(mag_data, grav_data, cfg.mag_axes, cfg.grav_axes, fits,
+                                                    weights=weights, breaks=breaks)
+        disp.clear_memory()
+        await pipeline.run_async(disp.show_progress)
+        cal = pipeline.cal
+        accuracy = pipeline.accuracy
     except (MemoryError, WatchDogTimeout):
+        # progress so far has been saved, calibrate_if_due will carry on from the failed stage
         await reset_to_calibrate(devices, cfg, disp)
     else:
         await show_cal_results(devices, cfg, disp)
@@ -117,6 +176,7 @@ async def show_cal_results(devices: hardware.HardwareBase, cfg: config.Config, d
     elif button == "b":
         pass
     cal = None
+    cal_pipeline.remove_progress()
 
 
 # noinspection PyUnusedLocal
@@ -148,12 +208,12 @@ def calibrate_if_due():
     try:
         logger.debug("Loading calibration data")
         cfg = config.Config.load()
-        with open(CAL_DATA_FILE) as f:
-            data = json.load(f)
-        logger.debug("Running calibration")
-        cal = mag_cal.Calibration(mag_axes=cfg.mag_axes, grav_axes=cfg.grav_axes)
-        logger.debug("Checking accuracy")
-        accuracy = cal.calibrate(np.array(data['mag']), np.array(data['grav']))
+        mag_data, grav_data, weights, breaks = load_cal_data()
+        pipeline = cal_pipeline.CalibrationPipeline(mag_data, grav_data, cfg.mag_axes, cfg.grav_axes,
+                                                    weights=weights, breaks=breaks)
+        logger.debug(f"Running calibration from stage {pipeline.stage}")
+        accuracy = pipeline.run()
+        cal = pipeline.cal
     except Exception as e:
         cal = e
         return
@@ -165,23 +225,27 @@ async def calibrate_distance(devices: hardware.HardwareBase, cfg: config.Config,
     await devices.button_a.wait(Button.SINGLE)
     disp.show_info("Measuring...\r\nDo not touch\r\ndevice")
     await asyncio.sleep(1)
-    dist = 0
-    for i in range(10):
-        dist += await devices.laser_measure()
+
+    def show_reading(count, reading):
         devices.beep_bip()
-    dist /= 10.0
-    dist = 1000 - dist
+        disp.show_info(f"Measuring...\r\nDo not touch\r\ndevice\r\nReading {count}: {reading}mm", live=True)
+
+    result = await sampling.measure_distance(devices.laser_measure, on_reading=show_reading)
+    dist = 1000 - result.distance
+    summary = f"Offset is {dist:.1f}mm\r\n±{result.error:.1f}mm"
     if dist > 200:
-        disp.show_info(f"Offset is {dist}mm\r\nThis seems very long\r\nAre you sure?\r\nA: Yes B: No")
-        btn, _ = await devices.both_buttons.wait(a=Button.SINGLE, b=Button.SINGLE)
-        if btn == "b":
-            return
+        warning = "This seems very long"
     elif dist < -50:
-        text = f"Offset is {dist}mm\r\nThis seems very short\r\nAre you sure?\r\nA: Yes B: No"
-        disp.show_info(text)
+        warning = "This seems very short"
+    elif result.error > sampling.TARGET_DISTANCE_ERROR:
+        warning = "Readings vary a lot"
+    else:
+        warning = None
+    if warning is not None:
+        disp.show_info(f"{summary}\r\n{warning}\r\nAre you sure?\r\nA: Yes B: No")
         btn, _ = await devices.both_buttons.wait(a=Button.SINGLE, b=Button.SINGLE)
         if btn == "b":
             return
-    cfg.laser_cal = dist / 1000
+    cfg.set_var("laser_cal", dist / 1000)
     cfg.save()
-    disp.show_info("Calibration complete")
+    disp.show_info(f"Calibration complete\r\n{summary}\r\n{result.count} readings")
@@ -1,10 +1,12 @@
+import math
+
 try:
     import numpy as np
 except ImportError:
     # noinspection PyUnresolvedReferences
     from ulab import numpy as np
-from .debug import logger
-from . import utils
+# calibrate.py points this at utils.lstsq on the device
+from mag_cal.utils import solve_least_squares
 
 def rot3Dsc(s, c, ax):
     """
@@ -61,8 +63,6 @@ def calib_fit_rotM_cstdip(mcorr, gcorr, axis=0, verbose=True):
     rot = np.eye(3)
     prevrotsin = None
     for it in range(3):
-        logger.debug(rot.shape)
-        logger.debug(mcorr.shape)
         m = np.dot(rot, mcorr.transpose()).transpose()
         xb = np.sum(m * gcorr, axis=-1)
         xa = m[:, oa[0]] * gcorr[:, oa[1]] - m[:, oa[1]] * gcorr[:, oa[0]]
@@ -73,7 +73,7 @@ def calib_fit_rotM_cstdip(mcorr, gcorr, axis=0, verbose=True):
             ),
             axis=-1,
         )
-        coeffs, _ = utils.lstsq(D, xb)
+        coeffs = solve_least_squares(D, xb)
         s = coeffs[0]
         if prevrotsin is not None and abs(s) > prevrotsin:
             raise (
@@ -87,9 +87,164 @@ def calib_fit_rotM_cstdip(mcorr, gcorr, axis=0, verbose=True):
     # rot = rot @ np.array([[1,0,0],[0,c,s],[0,-s,c]])
     return rot
 
+class RollFit:
+    """
+    Same fit as `calib_fit_rotM_cstdip`, from sums built up one reading at a time.
+
+    Rotating the magnetic readings about ``axis`` only mixes the two components across it, so the
+    dot and cross products of those components with the gravity reading, and the part of the dot
+    product along the axis, give every sum the least squares fit needs at any roll. They are kept
+    as a handful of floats, and each iteration of the fit is then a 2x2 solve in closed form.
+    """
+
+    def __init__(self, axis: int = 0):
+        """
+        :param axis: Axis to rotate the magnetic readings about, as for `calib_fit_rotM_cstdip`
+        """
+        self.axis = axis
+        self.others = tuple(i for i in range(3) if i != axis)
+        self.count = 0
+        # sums of w, p and q, and of their products, where w is the dot product along the axis, and
+        # p and q the dot and cross products of the other components
+        self.w = self.p = self.q = 0.0
+        self.ww = self.pp = self.qq = self.pq = self.wp = self.wq = 0.0
+        # cosine and sine of the roll found so far
+        self.cos = 1.0
+        self.sin = 0.0
+
+    def add(self, mcorr, gcorr):
+        """
+        Include a reading in the fit
+
+        :param mcorr: Magnetic reading, corrected except for roll
+        :param gcorr: Gravity reading, corrected except for roll
+        """
+        a, b = self.others
+        w = mcorr[self.axis] * gcorr[self.axis]
+        p = mcorr[a] * gcorr[a] + mcorr[b] * gcorr[b]
+        q = mcorr[a] * gcorr[b] - mcorr[b] * gcorr[a]
+        self.count += 1
+        self.w += w
+        self.p += p
+        self.q += q
+        self.ww += w * w
+        self.pp += p * p
+        self.qq += q * q
+        self.pq += p * q
+        self.wp += w * p
+        self.wq += w * q
+
+    def add_all(self, mcorr, gcorr):
+        """
+        Include several readings in the fit, a whole array at a time. This is faster, but needs
+        memory in proportion to the number of readings
+
+        :param mcorr: Magnetic readings, shape (N, 3)
+        :param gcorr: Gravity readings, shape (N, 3)
+        """
+        a, b = self.others
+        w = mcorr[:, self.axis] * gcorr[:, self.axis]
+        p = mcorr[:, a] * gcorr[:, a] + mcorr[:, b] * gcorr[:, b]
+        q = mcorr[:, a] * gcorr[:, b] - mcorr[:, b] * gcorr[:, a]
+        self.count += len(w)
+        self.w += float(np.sum(w))
+        self.p += float(np.sum(p))
+        self.q += float(np.sum(q))
+        self.ww += float(np.sum(w * w))
+        self.pp += float(np.sum(p * p))
+        self.qq += float(np.sum(q * q))
+        self.pq += float(np.sum(p * q))
+        self.wp += float(np.sum(w * p))
+        self.wq += float(np.sum(w * q))
+
+    def solve(self, iterations: int = 3):
+        """
+        Find the roll, in the same way as `calib_fit_rotM_cstdip`
+
+        :param iterations: Number of times to refine the roll
+        :raises ValueError: if the roll does not get smaller at each iteration, or the readings
+          do not determine it
+        """
+        # sign of the sine of each step, as calib_fit_rotM_cstdip builds its rotation
+        a, b = self.others
+        direction = rot3Dsc((1, -1, -1)[self.axis], 0, self.axis)[b, a]
+        n = self.count
+        cos, sin = 1.0, 0.0
+        prevrotsin = None
+        for _ in range(iterations):
+            # xa = cos.q - sin.p and xb = w + cos.p + sin.q for the readings rotated so far
+            sum_xa = cos * self.q - sin * self.p
+            sum_xb = self.w + cos * self.p + sin * self.q
+            sum_xaxa = cos * cos * self.qq - 2 * cos * sin * self.pq + sin * sin * self.pp
+            sum_xaxb = (cos * self.wq - sin * self.wp + (cos * cos - sin * sin) * self.pq +
+                        cos * sin * (self.qq - self.pp))
+            det = n * sum_xaxa - sum_xa * sum_xa
+            if det <= 0:
+                raise ValueError("Readings do not vary enough in roll to align the sensors")
+            s = (n * sum_xaxb - sum_xa * sum_xb) / det
+            if prevrotsin is not None and abs(s) > prevrotsin:
+                raise ValueError("rotation must decrease at each iteration, maybe rotation direction issue ?")
+            prevrotsin = abs(s)
+            c = math.sqrt(1 - s * s)
+            s *= direction
+            cos, sin = cos * c - sin * s, sin * c + cos * s
+        self.cos = cos
+        self.sin = sin
+
+    def rotation(self):
+        """
+        :return: Rotation matrix correcting the magnetic sensor roll, as from `calib_fit_rotM_cstdip`
+        """
+        a, b = self.others
+        rot = np.eye(3)
+        rot[a, a] = self.cos
+        rot[a, b] = -self.sin
+        rot[b, a] = self.sin
+        rot[b, b] = self.cos
+        return rot
+
+    def residual(self) -> float:
+        """
+        :return: Standard deviation of the dot product of the magnetic and gravity readings after
+          correcting the roll, which is zero when the dip is constant
+        """
+        cos, sin = self.cos, self.sin
+        n = self.count
+        mean = (self.w + cos * self.p + sin * self.q) / n
+        mean_sq = (self.ww + cos * cos * self.pp + sin * sin * self.qq + 2 * cos * self.wp +
+                   2 * sin * self.wq + 2 * cos * sin * self.pq) / n
+        return math.sqrt(max(mean_sq - mean * mean, 0.0))
+
+
+def fit_roll_axes(mcorr, gcorr, axes=(0, 1, 2)) -> list:
+    """
+    Fit the roll about each of several axes, a whole array at a time, to compare them on the host
+
+    :param mcorr: magn sensor readings corrected (except roll)
+    :param gcorr: grav sensor readings corrected (except roll)
+    :param axes: Axes to try
+    :return: Fitted `RollFit` for each axis
+    """
+    fits = []
+    for axis in axes:
+        fit = RollFit(axis)
+        fit.add_all(mcorr, gcorr)
+        fit.solve()
+        fits.append(fit)
+    return fits
+
+
+def apply_roll(self, rot):
+    """
+    Correct a calibration's magnetic sensor by the rotation from `RollFit.rotation`
+    """
+    self.mag.transform = np.dot(self.mag.transform, rot.transpose())
+
+
 #this is a function that can be monkey patched into mag_cal
 def align_sensor_roll(self, mag_data, grav_data):
-    mag_data = self.mag.apply(mag_data)
-    grav_data = self.grav.apply(grav_data)
-    rot = calib_fit_rotM_cstdip(mag_data, grav_data, 1, False)
-    self.mag.transform = np.dot(self.mag.transform, rot.transpose())
+    fit = RollFit(1)
+    for m, g in zip(mag_data, grav_data):
+        fit.add(self.mag.apply(m), self.grav.apply(g))
+    fit.solve()
+    apply_roll(self, fit.rotation())
@@ -1,5 +1,10 @@
+import binascii
 import json
+import os
+from . import formatters
+from . import storage
 from . import version
+from .fused_cal import FusedCalibration
 
 try:
     # noinspection PyUnresolvedReferences
@@ -11,8 +16,11 @@ except ImportError:
 from mag_cal import Calibration, Strictness
 
 _GRADS_PER_DEGREE = 400 / 360.0
-_CONFIG_FILE = "/config.json"
+_LEGACY_FILE = "/config.json"
+_SETTINGS_FILE = "/settings.json"
+_CALIB_FILE = "/calib.bin"
 _FEET_PER_METRE = 3.28084
+_FORMAT_SETTINGS = ("angles", "units", "low_precision")
 
 HARD_STRICTNESS = Strictness(mag=2.0, grav=1.5, dip=3.0)
 
@@ -39,7 +47,12 @@ class Config:
                  low_precision: bool = False,
                  extended: bool = False,
                  calib: dict = None,
-                 timer: int = 0):
+                 timer: int = 0,
+                 sensor_samples: int = 5,
+                 laser_guard: Optional[float] = None,
+                 shot_timing: bool = False,
+                 leg_shots: int = 3,
+                 leg_window: int = 3):
         self.timeout = timeout
         self.angles = angles
         self.units = units
@@ -53,14 +66,83 @@ class Config:
         self.save_readings = save_readings
         self.low_precision = low_precision
         self.extended = extended
-        self._dirty = False
+        self._formatters = {}
         if calib:
-            self.calib: Optional[Calibration] = Calibration.from_dict(calib)
+            self._set_calib_data(calib)
         else:
-            self.calib: Optional[Calibration] = None
+            self.calib = None
         self.timer = timer
+        self.sensor_samples = sensor_samples
+        self.laser_guard = laser_guard
+        """Seconds after triggering the laser before the sensors are read with it still on, or None
+        to switch it off and read them afterwards. Used for calibration shots as well as survey
+        shots, so that both see the same interference from the laser. Set from the Sensor Timing
+        menu item"""
+        self.shot_timing = shot_timing
+        self.leg_shots = leg_shots
+        """Number of shots to the same point needed to count as a leg"""
+        self.leg_window = leg_window
+        """Number of recent shots that ``leg_shots`` are taken from"""
+        self._dirty = False
+        self._calib_dirty = False
+
+    @property
+    def calib(self) -> Optional[Calibration]:
+        if self._calib is None and self._calib_data is not None:
+            # first use since loading
+            self._calib = Calibration.from_dict(self._calib_data)
+            self._calib_data = None
+        return self._calib
+
+    @calib.setter
+    def calib(self, value: Optional[Calibration]):
+        self._calib = value
+        self._calib_data = None
+        self._fused_calib = None
+        self._calib_dirty = True
+        if value is None:
+            self._calib_blob = None
+            self._calib_id = 0
+        else:
+            self._calib_blob = storage.pack_calibration(value.as_dict())
+            self._calib_id = binascii.crc32(self._calib_blob) & 0xFFFF
+
+    def _set_calib_data(self, dct: dict, blob: Optional[bytes] = None):
+        """
+        Keep a loaded calibration as plain data; the `Calibration` is only created when first needed
+
+        :param dct: Calibration as from ``Calibration.as_dict``
+        :param blob: The same calibration as stored on flash, if loaded from there
+        """
+        self._calib = None
+        self._calib_data = dct
+        self._fused_calib = None
+        if blob is None:
+            blob = storage.pack_calibration(dct)
+        self._calib_blob = blob
+        self._calib_id = binascii.crc32(blob) & 0xFFFF
 
-    def as_dict(self):
+    @property
+    def has_calib(self) -> bool:
+        """True if calibrated. Unlike checking `calib`, this does not create the calibration"""
+        return self._calib is not None or self._calib_data is not None
+
+    @property
+    def fused_calib(self) -> Optional[FusedCalibration]:
+        """Current calibration compiled for taking readings quickly, or None if not calibrated"""
+        if self._fused_calib is None and self.has_calib:
+            if self._calib_data is not None:
+                self._fused_calib = FusedCalibration(self._calib_data)
+            else:
+                self._fused_calib = FusedCalibration(self._calib.as_dict())
+        return self._fused_calib
+
+    @property
+    def calib_id(self) -> int:
+        """Short identifier for the current calibration, stored with each saved reading"""
+        return self._calib_id
+
+    def as_dict(self, with_calib: bool = True):
         dct = {}
         for k, v in self.__dict__.items():
             if isinstance(v, Strictness):
@@ -72,29 +154,88 @@ class Config:
                     dct[k] = v.as_dict()
                 else:
                     dct[k] = v
+        if with_calib:
+            if self._calib_data is not None:
+                dct["calib"] = self._calib_data
+            else:
+                dct["calib"] = None if self._calib is None else self._calib.as_dict()
         return dct
 
     def save_if_changed(self):
-        if self._dirty:
+        if self._dirty or self._calib_dirty:
             self.save()
 
     def save(self):
-        with open(_CONFIG_FILE, "w") as f:
-            json.dump(self.as_dict(), f)
-        self._dirty = False
+        """
+        Write settings and calibration to flash, each only if it has changed since last saved
+        """
+        if self._dirty:
+            storage.write_atomic(_SETTINGS_FILE, json.dumps(self.as_dict(with_calib=False)).encode())
+            self._dirty = False
+        if self._calib_dirty:
+            if self._calib_blob is None:
+                storage.remove(_CALIB_FILE)
+            else:
+                storage.write_atomic(_CALIB_FILE, self._calib_blob)
+            self._calib_dirty = False
 
     @classmethod
-    def load(cls, fname=_CONFIG_FILE) -> "Config":
+    def load(cls) -> "Config":
+        """
+        Load settings and calibration. If there is a ``config.json`` from older firmware (or one
+        that has been copied back onto the device), it is used instead and converted.
+        """
         try:
-            with open(fname, "r") as f:
+            with open(_LEGACY_FILE, "r") as f:
                 dct = json.load(f)
+        except (OSError, ValueError):
+            dct = None
+        if dct is not None:
+            cfg = cls(**dct)
+            cfg._dirty = True
+            cfg._calib_dirty = True
+            try:
+                cfg.save()
+                os.remove(_LEGACY_FILE)
+            except OSError:
+                # filesystem is read only while connected over USB, try again next time
+                pass
+            return cfg
+        try:
+            dct = json.loads(storage.read_atomic(_SETTINGS_FILE).decode())
         except (OSError, ValueError):
             dct = {}
-        return cls(**dct)
+        cfg = cls(**dct)
+        try:
+            blob = storage.read_atomic(_CALIB_FILE)
+            cfg._set_calib_data(storage.unpack_calibration(blob), blob)
+        except (OSError, storage.StorageError):
+            pass
+        return cfg
 
     def set_var(self, varname, value):
         setattr(self, varname, value)
         self._dirty = True
+        if varname in _FORMAT_SETTINGS:
+            self._formatters.clear()
+
+    def _get_formatter(self, kind, decimals: Optional[int], with_unit: bool) -> formatters.Formatter:
+        key = (kind, decimals, with_unit)
+        formatter = self._formatters.get(key)
+        if formatter is None:
+            if kind is formatters.distance_formatter:
+                if decimals is None:
+                    decimals = self.get_distance_precision()
+                unit = self.get_distance_unit() if with_unit else ""
+                factor = self.convert_distance(1.0)
+            else:
+                if decimals is None:
+                    decimals = self.get_angle_precision()
+                unit = self.get_angle_unit() if with_unit else ""
+                factor = self.convert_angle(1.0)
+            formatter = kind(decimals, unit, factor)
+            self._formatters[key] = formatter
+        return formatter
 
     def get_angle_precision(self):
         if self.low_precision:
@@ -109,43 +250,13 @@ class Config:
             return 3
 
     def get_azimuth_text(self, azimuth: float, decimals: Optional[int] = None, with_unit=True) -> str:
-        if decimals is None:
-            decimals = self.get_angle_precision()
-        if decimals > 0:
-            chars = decimals + 4
-        else:
-            chars = 3
-        azimuth = azimuth % 360  # move to proper range
-        if with_unit:
-            unit = self.get_angle_unit()
-        else:
-            unit = ""
-        azimuth = self.convert_angle(azimuth)
-        return f"{azimuth:0{chars}.{decimals}f}{unit}"
+        return self._get_formatter(formatters.azimuth_formatter, decimals, with_unit)(azimuth)
 
     def get_inclination_text(self, inclination: float, decimals: Optional[int] = None, with_unit=True) -> str:
-        if decimals is None:
-            decimals = self.get_angle_precision()
-        if decimals > 0:
-            chars = decimals + 4
-        else:
-            chars = 3
-        if with_unit:
-            unit = self.get_angle_unit()
-        else:
-            unit = ""
-        inclination = self.convert_angle(inclination)
-        return f"{inclination:+0{chars}.{decimals}f}{unit}"
+        return self._get_formatter(formatters.inclination_formatter, decimals, with_unit)(inclination)
 
     def get_distance_text(self, distance: float, decimals: Optional[int] = None, with_unit=True) -> str:
-        if decimals is None:
-            decimals = self.get_distance_precision()
-        if with_unit:
-            unit = self.get_distance_unit()
-        else:
-            unit = ""
-        distance = self.convert_distance(distance)
-        return f"{distance:.{decimals}f}{unit}"
+        return self._get_formatter(formatters.distance_formatter, decimals, with_unit)(distance)
 
     def get_angle_unit(self):
         if self.angles == self.DEGREES:
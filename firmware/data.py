@@ -1,23 +1,27 @@
 import os
-import re
 from collections import namedtuple
 import atexit
 try:
     # noinspection PyUnresolvedReferences
-    from typing import Optional, TextIO
+    from typing import Optional, BinaryIO
+    from .sampling import Vector
 except ImportError:
     pass
 
 
+from . import tripfile
 from .config import Config
-import mag_cal
-from mag_cal.utils import np
-from .discarding_queue import DiscardingQueue
+from .discarding_queue import ArrayQueue
+from .legs import LegDetector
+from .tripindex import TripIndex
+from .triplog import TripLog
 
 Leg = namedtuple("Leg", ("azimuth", "inclination", "distance"))
 
 READINGS_DIR = "/readings/"
 
+HISTORY_LENGTH = 200
+
 
 class Readings:
     """
@@ -25,8 +29,10 @@ class Readings:
     taken recently, and what is the current viewed reading
     """
 
-    def __init__(self, max_len=10):
-        self._queue = DiscardingQueue([], max_len)
+    def __init__(self, max_len=HISTORY_LENGTH):
+        self._queue = ArrayQueue(None, max_len, columns=3, factory=Leg)
+        self._legs = LegDetector()
+        self._is_leg = False
         self.current_reading = None
         """None if no readings taken yet, otherwise last reading is -1, previous to that is -2 
         etc"""
@@ -34,18 +40,26 @@ class Readings:
             os.mkdir(READINGS_DIR)
         except OSError:
             pass
-        self._trip_file: Optional[TextIO] = None
+        self.trips = TripIndex(READINGS_DIR)
+        self._trip_log = TripLog(self._open_trip_file, on_flush=self.trips.record)
+        atexit.register(self._trip_log.close)
+
+    def store_reading(self, leg: Leg, cfg: Config, mag: Vector, grav: Vector):
+        """
+        Add a reading to the history, and save it to the current trip file if ``save_readings`` is set
 
-    def store_reading(self, leg: Leg, cfg: Config):
+        :param leg: Calibrated reading
+        :param mag: Raw magnetometer reading the leg was calculated from
+        :param grav: Raw accelerometer reading the leg was calculated from
+        """
         self._queue.append(leg)
+        self._legs.configure(cfg.leg_shots, cfg.leg_window)
+        self._is_leg = self._legs.add(leg.azimuth, leg.inclination, leg.distance)
         self.current_reading = -1
-        if cfg.save_readings and self.trip_file:
-            texts = (
-                cfg.get_distance_text(leg.distance, decimals=3, with_unit=False),
-                cfg.get_azimuth_text(leg.azimuth, decimals=1, with_unit=False),
-                cfg.get_inclination_text(leg.inclination, decimals=1, with_unit=False),
-            )
-            self.trip_file.write(f"{', '.join(texts)}\n")
+        if cfg.save_readings:
+            # write a completed leg straight away, rather than once shots stop
+            self._trip_log.write(tripfile.pack(mag, grav, leg.distance, leg.azimuth, leg.inclination,
+                                               cfg.calib_id), commit=self._is_leg)
 
     def is_first_reading(self):
         return self.current_reading == -1
@@ -66,56 +80,33 @@ class Readings:
     def current(self) -> Leg:
         return self._queue[self.current_reading]
 
-    @property
-    def trip_file(self):
-        if self._trip_file:
-            return self._trip_file
+    def _open_trip_file(self) -> Optional[BinaryIO]:
         try:
-            max_trip = 0
-            for fname in os.listdir(READINGS_DIR):
-                match = re.match(r"Trip(\d\d\d\d\d).csv", fname)
-                if match:
-                    max_trip = max(max_trip, int(match.group(1)))
-            f: TextIO = open(f"{READINGS_DIR}Trip{(max_trip + 1):05}.csv", "w")
-            f.write("Distance, Compass, Clino\n")
-            atexit.register(f.close)
-            self._trip_file = f
-            return f
+            return self.trips.new_trip()
         except OSError:
             return None
 
-    def flush(self):
-        # not using the property because we don't want to create a file if not already existing here...
-        if self._trip_file:
-            self._trip_file.flush()
-
-    # noinspection PyTypeChecker
-    @staticmethod
-    def _same_shots(a: Leg, b: Leg) -> bool:
+    async def background_task(self):
         """
-        Determines if two shots were to the same point.
-        :param Leg a: First leg to compare
-        :param Leg b: Second leg to compare
-        :return: True if <5cm distance change and less than 3% error in measurement
+        Writes saved readings to flash in the background, so taking a reading never waits for the flash
         """
-        if abs(a.distance-b.distance) > 0.05:
-            return False
-        vec_a = mag_cal.Calibration.angles_to_matrix(a.azimuth, a.inclination, 0)[:, 1]
-        vec_b = mag_cal.Calibration.angles_to_matrix(b.azimuth, b.inclination, 0)[:, 1]
-        angular_variation = np.linalg.norm(vec_a-vec_b)
-        return angular_variation < 0.03
-
-    def triple_shot(self) -> bool:
+        await self._trip_log.background_task()
+
+    def flush(self):
+        # does not create a trip file unless there are readings waiting to be saved
+        self._trip_log.flush()
+
+    def is_leg(self) -> bool:
         """
-        Determines if last three shots taken were all to the same point.
-        :return: True if <5cm distance change and less than 3% error in measurement
+        Determines if the last shot completed a leg: by default this is if the last three shots were
+        all to the same point. Set ``leg_shots`` and ``leg_window`` in the config to require a
+        different number of agreeing shots out of a larger number of recent shots.
+        :return: True if every pair of those shots has <5cm distance change and less than 3% error in
+          direction
         """
-        if len(self._queue) < 3:
-            return False
         # spic17: we need to compare all three pairs of measurements instead of just 1+2 and 2+3 here
         # in order to ensure that first and third shots are near enough each other, too
         # (otherwise the sap would recognize legs that sexytopo does not).
-        return self._same_shots(self._queue[-1], self._queue[-2]) and self._same_shots(self._queue[-2], self._queue[-3]) and self._same_shots(self._queue[-1], self._queue[-3])
-
+        return self._is_leg
 
 readings = Readings()
@@ -1,8 +1,8 @@
+from array import array
+
 try:
     # noinspection PyUnresolvedReferences
-    from typing import Optional, Sequence, Iterator
-    # noinspection PyUnresolvedReferences
-    from typing_extensions import SupportsIndex
+    from typing import Optional, Sequence, Iterator, Callable
 except ImportError:
     pass
 
@@ -10,14 +10,47 @@ except ImportError:
 class DiscardingQueue:
     """
     This implements a queue that will only go up to max_len items long, and then
-    will discard the oldest elements. Used because circuitpython Deque is very limited
+    will discard the oldest elements. Used because circuitpython Deque is very limited.
+
+    Storage is a preallocated ring buffer, so appending is O(1) and never moves existing items
     """
 
     def __init__(self, it: Optional[Sequence] = None, max_len: int = 10):
         self.max_len = max_len
         """Maximum number of items within the queue"""
+        self._start = 0
+        self._len = 0
+        self._allocate()
         if it is not None:
-            self.queue = list(it[-max_len:])
+            for obj in it[-max_len:]:
+                self.append(obj)
+
+    def _allocate(self):
+        """Create storage for ``max_len`` items"""
+        self._items = [None] * self.max_len
+
+    def _store(self, slot: int, obj) -> None:
+        self._items[slot] = obj
+
+    def _fetch(self, slot: int):
+        return self._items[slot]
+
+    def _release(self, slot: int) -> None:
+        # drop our reference so the item can be garbage collected
+        self._items[slot] = None
+
+    def _slot(self, i: int) -> int:
+        """
+        Convert a queue index (negative indices allowed) into a position in the ring buffer
+
+        :param i: Index into the queue, 0 is oldest, -1 is newest
+        :return: position in underlying storage
+        """
+        if i < 0:
+            i += self._len
+        if i < 0 or i >= self._len:
+            raise IndexError("DiscardingQueue index out of range")
+        return (self._start + i) % self.max_len
 
     def append(self, obj) -> None:
         """
@@ -26,25 +59,80 @@ class DiscardingQueue:
         :param obj: Object to add to the queue
         :return:
         """
-        if len(self.queue) == self.max_len:
-            self.pop()
-        self.queue.append(obj)
+        if self._len == self.max_len:
+            self._start = (self._start + 1) % self.max_len
+        else:
+            self._len += 1
+        self._store(self._slot(-1), obj)
 
     def pop(self):
         """
         Pop oldest item off the queue, remove that item from the queue
         :return: Oldest item
         """
-        return self.queue.pop(0)
+        if self._len == 0:
+            raise IndexError("pop from empty DiscardingQueue")
+        obj = self._fetch(self._start)
+        self._release(self._start)
+        self._start = (self._start + 1) % self.max_len
+        self._len -= 1
+        return obj
 
-    def index(self, __value, __start: SupportsIndex = ..., __stop: SupportsIndex = ...) -> int:
-        return self.queue.index(__value, __start, __stop)
+    def index(self, value, start: int = 0, stop: Optional[int] = None) -> int:
+        if stop is None:
+            stop = self._len
+        for i in range(start, min(stop, self._len)):
+            if self[i] == value:
+                return i
+        raise ValueError(f"{value} is not in queue")
 
     def __len__(self) -> int:
-        return len(self.queue)
+        return self._len
 
     def __iter__(self) -> Iterator:
-        return iter(self.queue)
+        for i in range(self._len):
+            yield self[i]
 
     def __getitem__(self, i: int):
-        return self.queue[i]
+        return self._fetch(self._slot(i))
+
+
+class ArrayQueue(DiscardingQueue):
+    """
+    A `DiscardingQueue` of fixed length records of floats, e.g. ``Leg`` namedtuples. Each field
+    is stored in its own preallocated ``array('f')`` column, so no memory is allocated when an
+    item is appended. Items are rebuilt using ``factory`` when they are read back.
+    """
+
+    def __init__(self, it: Optional[Sequence] = None, max_len: int = 10,
+                 columns: int = 3, factory: Optional[Callable] = None):
+        self.columns = columns
+        """Number of fields in each record"""
+        self.factory = factory
+        """Called with the fields as separate arguments to rebuild a record, or None for a tuple"""
+        super().__init__(it, max_len)
+
+    def _allocate(self):
+        self._data = [array('f', (0.0 for _ in range(self.max_len))) for _ in range(self.columns)]
+
+    def _store(self, slot: int, obj) -> None:
+        for column, value in zip(self._data, obj):
+            column[slot] = value
+
+    def _fetch(self, slot: int):
+        if self.factory is None:
+            return tuple(column[slot] for column in self._data)
+        return self.factory(*(column[slot] for column in self._data))
+
+    def _release(self, slot: int) -> None:
+        pass
+
+    def field(self, i: int, column: int) -> float:
+        """
+        Get a single field from a record without building the whole record
+
+        :param i: Index into the queue, 0 is oldest, -1 is newest
+        :param column: Which field to retrieve
+        :return: Value of the field
+        """
+        return self._data[column][self._slot(i)]
@@ -22,6 +22,14 @@ class DisplayBase:
     def refresh(self):
         pass
 
+    @abstractmethod
+    def refresh_now(self):
+        pass
+
+    @abstractmethod
+    def refresh_task(self):
+        pass
+
     @abstractmethod
     def show_start_screen(self):
         pass
@@ -46,7 +54,7 @@ class DisplayBase:
         return Menu(self.oled, self.oled.height, self.oled.width, False, "Menu")
 
     @abstractmethod
-    def show_info(self, text, clean=False):
+    def show_info(self, text, clean=False, live=False):
         pass
 
     @abstractmethod
@@ -61,6 +69,10 @@ class DisplayBase:
     def show_big_info(self, text):
         pass
 
+    @abstractmethod
+    def show_progress(self, text, fraction):
+        pass
+
     @abstractmethod
     def clear_memory(self):
         pass
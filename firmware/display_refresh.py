@@ -0,0 +1,87 @@
+"""
+Coalesce display refreshes. Each refresh sends a whole frame to the display, so when several tasks
+change what is shown within a few milliseconds of each other they should share one refresh.
+"""
+import asyncio
+import time
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Awaitable, Callable, Optional
+except ImportError:
+    pass
+
+FRAME_MS = 100
+"""Shortest time between refreshes requested with `RefreshScheduler.request`"""
+
+
+class RefreshScheduler:
+    """
+    Marks the display as needing a refresh, and refreshes it from `run` at most once per frame
+    """
+
+    def __init__(self, refresh: Callable[[], None], frame_ms: int = FRAME_MS,
+                 clock: Callable[[], int] = time.monotonic_ns,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        """
+        :param refresh: Sends the current frame to the display
+        :param frame_ms: Shortest time between refreshes, other than those from `now`
+        :param clock: Returns the time in nanoseconds
+        :param sleep: Coroutine function that waits for a number of seconds on the same clock
+        """
+        self._refresh = refresh
+        self._clock = clock
+        self._sleep = sleep
+        self.frame_ns = frame_ms * 1000000
+        self.dirty = False
+        self.running = False
+        self.refreshes = 0
+        self._last: Optional[int] = None
+        self._event = asyncio.Event()
+
+    def request(self):
+        """
+        Refresh the display within the next frame. If `run` is not running, such as before the
+        main program has started, refresh straight away
+        """
+        if not self.running:
+            self.now()
+            return
+        self.dirty = True
+        self._event.set()
+
+    def now(self):
+        """
+        Refresh the display straight away, along with anything already requested
+        """
+        self.dirty = False
+        self._last = self._clock()
+        self.refreshes += 1
+        self._refresh()
+
+    def flush(self):
+        """
+        Refresh the display straight away if a refresh has been requested but not done
+        """
+        if self.dirty:
+            self.now()
+
+    async def run(self):
+        """
+        Task that carries out requested refreshes
+        """
+        self.running = True
+        try:
+            while True:
+                await self._event.wait()
+                self._event.clear()
+                if self._last is not None:
+                    wait = self._last + self.frame_ns - self._clock()
+                    if wait > 0:
+                        await self._sleep(wait / 1000000000)
+                # a refresh from now() while waiting will have done this one too
+                if self.dirty:
+                    self.now()
+        finally:
+            self.running = False
+            self.flush()
@@ -0,0 +1,159 @@
+"""
+Fit an ellipsoid to sensor readings one reading at a time. ``Sensor.fit_ellipsoid`` builds an
+N x 9 matrix of quadratic terms and solves it by least squares. Solving that with
+``utils.lstsq`` only ever uses the 9 x 9 matrix AᵀA and the 9 element vector AᵀB, so those sums
+are kept up to date as each reading arrives. The solve at the end then takes the same time and
+memory however many readings were taken.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    from ulab import numpy as np
+
+from mag_cal import Axes
+from mag_cal.utils import solve_least_squares
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Sequence, Tuple
+    # noinspection PyUnresolvedReferences
+    from mag_cal.sensor import Sensor
+except ImportError:
+    pass
+
+TERMS = 9
+"""Number of quadratic terms in the ellipsoid equation"""
+
+MIN_READINGS = TERMS
+"""Fewer readings than this can not determine an ellipsoid"""
+
+
+class EllipsoidAccumulator:
+    """
+    Running sums for an ellipsoid fit to one sensor's readings
+    """
+
+    def __init__(self, axes: str = "+X+Y+Z"):
+        """
+        :param axes: How the sensor is mounted, as for ``Sensor``
+        """
+        self.axes = Axes(axes)
+        self.count = 0
+        self.weight = 0.0
+        # only the upper triangle of AᵀA is kept up to date, as it is symmetric
+        self.ata = [[0.0] * TERMS for _ in range(TERMS)]
+        self.atb = [0.0] * TERMS
+
+    def fix_axes(self, reading: Sequence[float]) -> Tuple[float, float, float]:
+        """
+        :param reading: Raw sensor reading
+        :return: Reading in the device's axes, as from ``Axes.fix_axes``
+        """
+        indices = self.axes.indices
+        polarities = self.axes.polarities
+        return (reading[indices[0]] * polarities[0],
+                reading[indices[1]] * polarities[1],
+                reading[indices[2]] * polarities[2])
+
+    def add(self, reading: Sequence[float], weight: float = 1.0):
+        """
+        Include a reading in the fit
+
+        :param reading: Raw sensor reading
+        :param weight: How much the reading counts towards the fit, relative to others
+        """
+        x, y, z = self.fix_axes(reading)
+        # same terms as Sensor.fit_ellipsoid, each of which should sum to 1
+        row = (x * x, y * y, z * z, 2 * x * y, 2 * x * z, 2 * y * z, 2 * x, 2 * y, 2 * z)
+        ata = self.ata
+        atb = self.atb
+        for i in range(TERMS):
+            value = row[i] * weight
+            atb[i] += value
+            ata_row = ata[i]
+            for j in range(i, TERMS):
+                ata_row[j] += value * row[j]
+        self.count += 1
+        self.weight += weight
+
+    def add_all(self, readings: Sequence[Sequence[float]]):
+        """
+        Include several readings in the fit
+
+        :param readings: Raw sensor readings
+        """
+        for reading in readings:
+            self.add(reading)
+
+    def normal_equations(self):
+        """
+        :return: AᵀA and AᵀB as arrays, where A and B are the matrices ``Sensor.fit_ellipsoid``
+          would build from the readings so far
+        """
+        ata = np.zeros((TERMS, TERMS))
+        for i in range(TERMS):
+            for j in range(i, TERMS):
+                ata[i, j] = self.ata[i][j]
+                ata[j, i] = self.ata[i][j]
+        return ata, np.array(self.atb)
+
+    def solve(self) -> np.ndarray:
+        """
+        :return: The nine ellipsoid coefficients, as ``utils.lstsq`` would give for the readings
+        :raises ValueError: if there are too few readings
+        """
+        if self.count < MIN_READINGS:
+            raise ValueError(f"At least {MIN_READINGS} readings are needed, only have {self.count}")
+        ata, atb = self.normal_equations()
+        r = np.linalg.cholesky(ata)
+        # forward and back substitution with the lower triangular factor
+        y = [0.0] * TERMS
+        for i in range(TERMS):
+            y[i] = (atb[i] - sum(r[i, k] * y[k] for k in range(i))) / r[i, i]
+        coeff = [0.0] * TERMS
+        for i in range(TERMS - 1, -1, -1):
+            coeff[i] = (y[i] - sum(r[k, i] * coeff[k] for k in range(i + 1, TERMS))) / r[i, i]
+        return np.array(coeff)
+
+    def estimate(self) -> Tuple[np.ndarray, float]:
+        """
+        Quick estimate of the fit, without working out the transform
+
+        :return: Centre of the ellipsoid, and the root mean square difference of calibrated
+          readings from unit length, approximately as ``Sensor.uniformity`` would give
+        :raises ValueError: if there are too few readings
+        """
+        coeff = self.solve()
+        a4, centre = self._centre(coeff)
+        # sum of squared residuals of the least squares problem, (A.coeff - 1)^2, from the sums
+        ata, atb = self.normal_equations()
+        rss = float(np.dot(coeff, np.dot(ata, coeff))) - 2 * float(np.dot(coeff, atb)) + self.weight
+        # residuals are r^2 - 1 scaled by this, where r is the calibrated length of a reading
+        scale = 1 - float(np.dot(centre, a4[3, 0:3]))
+        return centre, math.sqrt(max(rss, 0.0) / self.weight) / (2 * abs(scale))
+
+    @staticmethod
+    def _centre(coeff: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        a, b, c, d, e, f, g, h, i = coeff
+        a4 = np.array([[a, d, e, g], [d, b, f, h], [e, f, c, i], [g, h, i, -1]])
+        a3 = a4[0:3, 0:3]
+        vghi = np.array([-g, -h, -i])
+        return a4, solve_least_squares(a3, vghi)
+
+    def fit(self, sensor: Sensor):
+        """
+        Set a sensor's centre and transform from the readings, in the same way as
+        ``Sensor.fit_ellipsoid``. The sensor's axes should match those given to this accumulator
+
+        :param sensor: Sensor to update
+        :raises ValueError: if there are too few readings
+        """
+        a4, sensor.centre = self._centre(self.solve())
+        t = np.eye(4)
+        t[3, 0:3] = sensor.centre
+        b4 = np.dot(np.dot(t, a4), t.transpose())
+        b3 = b4[0:3, 0:3] / -b4[3, 3]
+        e, v = np.linalg.eig(b3)
+        sensor.transform = np.dot(np.dot(v, np.sqrt(np.diag(e))), v.transpose())
@@ -0,0 +1,73 @@
+"""
+Number formatters for displayed readings. Each formatter works out its format string once, so
+formatting a value is a single ``str.format`` call.
+"""
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Optional
+except ImportError:
+    pass
+
+
+class Formatter:
+    """
+    Formats a number using a fixed template. The last result is kept and returned again if the
+    same value is formatted next, as the display and info screens often redraw unchanged readings.
+    """
+
+    def __init__(self, template: str, factor: float = 1.0, modulo: Optional[float] = None):
+        """
+        :param template: Format string with a single replacement field, e.g. ``"{:.3f}m"``
+        :param factor: Multiply values by this before formatting, to convert units
+        :param modulo: If given, values are first reduced modulo this, e.g. 360 for azimuths
+        """
+        self.template = template
+        self.factor = factor
+        self.modulo = modulo
+        self._last_value = None
+        self._last_text = ""
+
+    def __call__(self, value: float) -> str:
+        if value == self._last_value:
+            return self._last_text
+        self._last_value = value
+        if self.modulo is not None:
+            value = value % self.modulo
+        self._last_text = self.template.format(value * self.factor)
+        return self._last_text
+
+
+def _angle_width(decimals: int) -> int:
+    if decimals > 0:
+        return decimals + 4
+    return 3
+
+
+def azimuth_formatter(decimals: int, unit: str = "", factor: float = 1.0) -> Formatter:
+    """
+    :param decimals: Number of decimal places
+    :param unit: Text to put after the number
+    :param factor: Factor to convert from degrees
+    :return: Formatter for azimuths in degrees, zero-padded e.g. ``"005.0°"``
+    """
+    return Formatter(f"{{:0{_angle_width(decimals)}.{decimals}f}}{unit}", factor, 360)
+
+
+def inclination_formatter(decimals: int, unit: str = "", factor: float = 1.0) -> Formatter:
+    """
+    :param decimals: Number of decimal places
+    :param unit: Text to put after the number
+    :param factor: Factor to convert from degrees
+    :return: Formatter for inclinations in degrees, always signed e.g. ``"+05.0°"``
+    """
+    return Formatter(f"{{:+0{_angle_width(decimals)}.{decimals}f}}{unit}", factor)
+
+
+def distance_formatter(decimals: int, unit: str = "", factor: float = 1.0) -> Formatter:
+    """
+    :param decimals: Number of decimal places
+    :param unit: Text to put after the number
+    :param factor: Factor to convert from metres
+    :return: Formatter for distances in metres e.g. ``"1.234m"``
+    """
+    return Formatter(f"{{:.{decimals}f}}{unit}", factor)
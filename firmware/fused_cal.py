@@ -0,0 +1,195 @@
+"""
+A `mag_cal.Calibration` compiled into a form that is quick to apply to a single shot. Each sensor's
+axis fix-up, centre offset and transform are folded into one 3x3 matrix and offset, and any
+non-linear correction is replaced by a lookup table, so a shot needs only a few dozen float
+operations and no array temporaries.
+"""
+import math
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    from ulab import numpy as np
+
+# noinspection PyProtectedMember
+from mag_cal import Axes, Strictness, MagneticAnomalyError, GravityAnomalyError, DipAnomalyError
+from mag_cal.rbf import RBF
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Optional, Sequence, Tuple
+except ImportError:
+    pass
+
+LUT_RANGE = 1.5
+"""Non-linear corrections are tabulated for normalised readings between -LUT_RANGE and +LUT_RANGE"""
+
+LUT_SIZE = 129
+"""Number of points in each non-linear lookup table"""
+
+Reading = namedtuple("Reading", ("azimuth", "inclination", "roll", "mag_field", "grav_field", "dip"))
+
+
+class FusedSensor:
+    """
+    Single sensor of a `FusedCalibration`
+    """
+
+    def __init__(self, dct: dict):
+        """
+        :param dct: Sensor calibration, as from ``Sensor.as_dict``
+        """
+        transform = dct["transform"]
+        centre = dct["centre"]
+        sensor_axes = Axes(dct["axes"])
+        axes = [[0.0] * 3 for _ in range(3)]
+        for i in range(3):
+            axes[i][sensor_axes.indices[i]] = float(sensor_axes.polarities[i])
+        # Sensor.apply works with row vectors: out = (axes @ raw - centre) @ transform
+        self.field_avg = dct["field_avg"]
+        self.field_std = dct["field_std"]
+        self.scale = 1 / ((transform[0][0] + transform[1][1] + transform[2][2]) / 3)
+        if dct["rbfs"]:
+            # non-linear correction works on readings normalised by transform[0][0]
+            norm = transform[0][0]
+            self.matrix = [[x * norm for x in row] for row in axes]
+            self.offset = [-x * norm for x in centre]
+            self.rbfs = [RBF(params) for params in dct["rbfs"]]
+            self.luts = [self._tabulate(rbf) for rbf in self.rbfs]
+            self.transform = [[transform[j][i] / norm for j in range(3)] for i in range(3)]
+        else:
+            self.matrix = [[sum(transform[k][i] * axes[k][j] for k in range(3)) for j in range(3)]
+                           for i in range(3)]
+            self.offset = [-sum(centre[k] * transform[k][i] for k in range(3)) for i in range(3)]
+            self.luts = None
+            self.rbfs = None
+            self.transform = None
+
+    @staticmethod
+    def _tabulate(rbf) -> array:
+        step = 2 * LUT_RANGE / (LUT_SIZE - 1)
+        xs = np.array([i * step - LUT_RANGE for i in range(LUT_SIZE)])
+        return array("f", [float(x) for x in rbf(xs)])
+
+    def _correct(self, i: int, x: float) -> float:
+        pos = (x + LUT_RANGE) * (LUT_SIZE - 1) / (2 * LUT_RANGE)
+        if 0 <= pos < LUT_SIZE - 1:
+            index = int(pos)
+            lut = self.luts[i]
+            frac = pos - index
+            return x + lut[index] + (lut[index + 1] - lut[index]) * frac
+        # outside the table, which only happens with readings far from those used to calibrate
+        return x + float(self.rbfs[i](np.array([x]))[0])
+
+    def apply(self, raw: Sequence[float]) -> Tuple[float, float, float]:
+        """
+        Apply calibration to a single reading. Matches ``Sensor.apply``
+
+        :param raw: Raw sensor reading
+        :return: Calibrated reading
+        """
+        r0, r1, r2 = raw
+        m = self.matrix
+        o = self.offset
+        x = m[0][0] * r0 + m[0][1] * r1 + m[0][2] * r2 + o[0]
+        y = m[1][0] * r0 + m[1][1] * r1 + m[1][2] * r2 + o[1]
+        z = m[2][0] * r0 + m[2][1] * r1 + m[2][2] * r2 + o[2]
+        if self.luts is not None:
+            x = self._correct(0, x)
+            y = self._correct(1, y)
+            z = self._correct(2, z)
+            t = self.transform
+            return (t[0][0] * x + t[0][1] * y + t[0][2] * z,
+                    t[1][0] * x + t[1][1] * y + t[1][2] * z,
+                    t[2][0] * x + t[2][1] * y + t[2][2] * z)
+        return x, y, z
+
+    def check(self, strength: float, tolerance: float) -> Optional[str]:
+        """
+        :param strength: Field strength, in the sensor's original units
+        :param tolerance: Acceptable fractional difference from the calibrated field strength
+        :return: None if strength is acceptable, otherwise a description of the problem
+        """
+        acceptable = max(self.field_std * 3, self.field_avg * tolerance)
+        if abs(self.field_avg - strength) > acceptable:
+            return (f"Strength is {strength}, should be {self.field_avg - acceptable} - "
+                    f"{self.field_avg + acceptable}")
+        return None
+
+
+class FusedCalibration:
+    """
+    Gives the same results as a `mag_cal.Calibration`, but gets angles, field strengths and dip
+    from a single pass over each shot's readings. It is built from the calibration's data, so a
+    full `mag_cal.Calibration` does not need to be created just to take readings.
+    """
+
+    def __init__(self, dct: dict):
+        """
+        :param dct: Calibration to compile, as from ``Calibration.as_dict``
+        """
+        self.mag = FusedSensor(dct["mag"])
+        self.grav = FusedSensor(dct["grav"])
+        self.dip_avg = dct["dip_avg"]
+
+    def measure(self, mag: Sequence[float], grav: Sequence[float]) -> Reading:
+        """
+        Calculate everything about a shot
+
+        :param mag: Raw magnetometer reading
+        :param grav: Raw accelerometer reading
+        :return: `Reading`, with angles in degrees as from ``Calibration.get_angles`` and
+          ``get_dips``, and field strengths as from ``get_field_strengths``
+        """
+        mx, my, mz = self.mag.apply(mag)
+        gx, gy, gz = self.grav.apply(grav)
+        mag_norm = math.sqrt(mx * mx + my * my + mz * mz)
+        grav_norm = math.sqrt(gx * gx + gy * gy + gz * gz)
+        mx /= mag_norm
+        my /= mag_norm
+        mz /= mag_norm
+        # up is opposite to gravity
+        ux = -gx / grav_norm
+        uy = -gy / grav_norm
+        uz = -gz / grav_norm
+        # east = mag x up
+        ex = my * uz - mz * uy
+        ey = mz * ux - mx * uz
+        ez = mx * uy - my * ux
+        east_norm = math.sqrt(ex * ex + ey * ey + ez * ez)
+        ex /= east_norm
+        ey /= east_norm
+        ez /= east_norm
+        # north = up x east; only the y component is needed
+        ny = uz * ex - ux * ez
+        theta1 = math.atan2(ey, ny)
+        theta2 = math.atan2(uy * math.cos(theta1), ny)
+        theta3 = math.atan2(-ux, uz)
+        dot = -(mx * ux + my * uy + mz * uz)
+        dot = max(-1.0, min(1.0, dot))
+        return Reading(azimuth=math.degrees(theta1) % 360,
+                       inclination=((math.degrees(theta2) + 90) % 180) - 90,
+                       roll=math.degrees(theta3),
+                       mag_field=mag_norm * self.mag.scale,
+                       grav_field=grav_norm * self.grav.scale,
+                       dip=90 - math.degrees(math.acos(dot)))
+
+    def raise_if_anomaly(self, reading: Reading, strictness: Strictness):
+        """
+        Check a reading in the same way as ``Calibration.raise_if_anomaly``
+
+        :param reading: Result from `measure`
+        :param strictness: Acceptable differences from the calibration
+        :raises: ``MagneticAnomalyError``, ``GravityAnomalyError`` or ``DipAnomalyError``
+        """
+        problem = self.mag.check(reading.mag_field, strictness.mag / 100)
+        if problem:
+            raise MagneticAnomalyError(problem)
+        problem = self.grav.check(reading.grav_field, strictness.grav / 100)
+        if problem:
+            raise GravityAnomalyError(problem)
+        if abs(self.dip_avg - reading.dip) > strictness.dip:
+            raise DipAnomalyError(f"Magnetic dip {reading.dip} out of limits {self.dip_avg - strictness.dip} - "
+                                  f"{self.dip_avg + strictness.dip}")
@@ -1,9 +1,12 @@
 import asyncio
 from os import uname
 
+from async_button import Button
+
 from . import config
 from . import display
 from . import hardware
+from . import timing
 from .version import get_long_name, get_short_name, get_sw_version, get_hw_version_as_str
 try:
     import numpy as np
@@ -11,22 +14,39 @@ except ImportError:
     # noinspection PyUnresolvedReferences
     from ulab import numpy as np
 
+LIVE_INTERVAL = 0.125
+"""Seconds between updates of the live readings screens, the console only redraws what changes"""
+
+RAW_TEMPLATE = ("Raw  Accel  Mag\r\n"
+                "X   {: 06.3f} {: 06.2f}\r\n"
+                "Y   {: 06.3f} {: 06.2f}\r\n"
+                "Z   {: 06.3f} {: 06.2f}\r\n"
+                "Voltage: {:4.2f}V")
+
+CALIBRATED_TEMPLATE = ("      Accel  Mag\r\n"
+                       "X   {: 7.3f} {: 6.2f}\r\n"
+                       "Y   {: 7.3f} {: 6.2f}\r\n"
+                       "Z   {: 7.3f} {: 6.2f}\r\n"
+                       "|V| {: 7.3f} {: 6.2f}")
+
+ORIENTATION_TEMPLATE = ("Compass: {}\r\n"
+                        "Inclination: {}\r\n"
+                        "Roll: {}\r\n"
+                        "Dip: {}")
+
 
 # noinspection PyUnusedLocal
 async def raw_readings(devices: hardware.HardwareBase, cfg: config.Config, disp: display.DisplayBase):
     while True:
         try:
-            await asyncio.wait_for(devices.button_a.wait_for_click(), 0.5)
+            await asyncio.wait_for(devices.button_a.wait_for_click(), LIVE_INTERVAL)
             return
         except asyncio.TimeoutError:
             pass
         acc = devices.accelerometer.acceleration
         mag = devices.magnetometer.magnetic
-        text = "Raw  Accel  Mag\r\n"
-        for axis, a, m in zip("XYZ", acc, mag):
-            text += f"{axis}   {a: 06.3f} {m: 06.2f}\r\n"
-        text += f"Voltage: {devices.batt_voltage:4.2f}V"
-        disp.show_info(text)
+        disp.show_info(RAW_TEMPLATE.format(acc[0], mag[0], acc[1], mag[1], acc[2], mag[2],
+                                           devices.batt_voltage), live=True)
 
 def scale_readings(readings, scale):
     return readings * scale / np.linalg.norm(readings)
@@ -38,7 +58,7 @@ async def calibrated_readings(devices: hardware.HardwareBase, cfg: config.Config
         return
     while True:
         try:
-            await asyncio.wait_for(devices.button_a.wait_for_click(), 0.5)
+            await asyncio.wait_for(devices.button_a.wait_for_click(), LIVE_INTERVAL)
             return
         except asyncio.TimeoutError:
             pass
@@ -48,36 +68,63 @@ async def calibrated_readings(devices: hardware.HardwareBase, cfg: config.Config
         mag_strength, grav_strength = cfg.calib.get_field_strengths(mag, grav)
         grav = scale_readings(cfg.calib.grav.apply(grav), grav_strength)
         mag = scale_readings(cfg.calib.mag.apply(mag), mag_strength)
-        text = "      Accel  Mag\r\n"
-        for axis, g, m in zip("XYZ", grav, mag):
-            text += f"{axis}   {g: 7.3f} {m: 6.2f}\r\n"
-        text += f"|V| {grav_strength: 7.3f} {mag_strength: 6.2f}"
-        disp.show_info(text)
+        disp.show_info(CALIBRATED_TEMPLATE.format(grav[0], mag[0], grav[1], mag[1], grav[2], mag[2],
+                                                  grav_strength, mag_strength), live=True)
 
 
 # noinspection PyTypeChecker
 async def orientation(devices: hardware.HardwareBase, cfg: config.Config, disp: display.DisplayBase):
-    if cfg.calib is None:
+    if not cfg.has_calib:
         disp.show_info("Device not\r\ncalibrated")
         await devices.button_a.wait_for_click()
         return
     while True:
         try:
-            await asyncio.wait_for(devices.button_a.wait_for_click(), 0.5)
+            await asyncio.wait_for(devices.button_a.wait_for_click(), LIVE_INTERVAL)
             return
         except asyncio.TimeoutError:
             pass
         grav = devices.accelerometer.acceleration
         mag = devices.magnetometer.magnetic
-        heading, inclination, roll = cfg.calib.get_angles(mag, grav)
-        dip = cfg.calib.get_dips(mag, grav)
-        text = f"""
-            Compass: {cfg.get_azimuth_text(heading)}
-            Inclination: {cfg.get_inclination_text(inclination)}
-            Roll: {cfg.get_inclination_text(roll)}
-            Dip: {cfg.get_inclination_text(dip)}
-        """
-        disp.show_info(text, clean=True)
+        # as for a shot, see measure.take_reading
+        result = cfg.fused_calib.measure(mag, grav)
+        disp.show_info(ORIENTATION_TEMPLATE.format(cfg.get_azimuth_text(result.azimuth),
+                                                   cfg.get_inclination_text(result.inclination),
+                                                   cfg.get_inclination_text(result.roll),
+                                                   cfg.get_inclination_text(result.dip)), live=True)
+
+
+async def shot_timing(devices: hardware.HardwareBase, cfg: config.Config, disp: display.DisplayBase):
+    if not cfg.shot_timing:
+        disp.show_info("""
+            Shot timing is off
+            Turn it on in
+            Settings first
+        """, clean=True)
+        await devices.button_a.wait_for_click()
+        return
+    lines = timing.shot_timer.summary()
+    pages = [lines[i:i + 4] for i in range(0, len(lines), 4)]
+    page = 0
+    while True:
+        if page < len(pages):
+            text = "Stage     n   ms  p90\r\n" + "\r\n".join(pages[page])
+        else:
+            text = "A: Exit\r\nB: Save to flash"
+        disp.show_info(text)
+        button, _ = await devices.both_buttons.wait(a=Button.SINGLE, b=Button.SINGLE)
+        if button == "a":
+            return
+        if page == len(pages):
+            header = f"{get_short_name()} SW: {get_sw_version()} CP: {uname().release}"
+            try:
+                timing.shot_timer.save(header=header)
+                disp.show_info(f"Saved to\r\n{timing.TIMING_FILE}")
+            except OSError:
+                disp.show_info("Unable to save\r\nIs USB connected?")
+            await devices.button_a.wait_for_click()
+            return
+        page += 1
 
 
 # noinspection PyUnusedLocal
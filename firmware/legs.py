@@ -0,0 +1,135 @@
+import math
+
+try:
+    from .discarding_queue import ArrayQueue, DiscardingQueue
+except ImportError:
+    # running on the host, not as part of the firmware package
+    from discarding_queue import ArrayQueue, DiscardingQueue
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import List, Tuple
+except ImportError:
+    pass
+
+MAX_DISTANCE_CHANGE = 0.05
+"""Shots to the same point must have distances within this many metres of each other"""
+
+MAX_DIRECTION_CHANGE = 0.03
+"""Shots to the same point must have unit direction vectors within this distance (~1.7°)"""
+
+_X = 0
+_Y = 1
+_Z = 2
+_DISTANCE = 3
+
+
+def direction(azimuth: float, inclination: float) -> Tuple[float, float, float]:
+    """
+    Unit vector pointing along a shot, in world coordinates (X is east, Y is north, Z is up)
+
+    :param azimuth: Azimuth in degrees
+    :param inclination: Inclination in degrees
+    :return: (x, y, z)
+    """
+    azimuth = math.radians(azimuth)
+    inclination = math.radians(inclination)
+    horizontal = math.cos(inclination)
+    return horizontal * math.sin(azimuth), horizontal * math.cos(azimuth), math.sin(inclination)
+
+
+class LegDetector:
+    """
+    Detects when a leg has been shot, i.e. when ``shots`` of the last ``window`` shots (including
+    the most recent) were all to the same point.
+
+    Each shot's direction vector is calculated once, when it is added, and at the same time its
+    agreement with each of the previous shots in the window is stored as a bitmask, so
+    detection only needs to compare the newest shot with the others.
+    """
+
+    def __init__(self, shots: int = 3, window: int = 3):
+        self.shots = shots
+        self.window = window
+        self.configure(shots, window, force=True)
+
+    def configure(self, shots: int, window: int, force: bool = False):
+        """
+        Change the number of shots and window size, discarding history if these change
+
+        :param shots: Number of agreeing shots needed for a leg
+        :param window: Number of recent shots to consider
+        :param force: Discard history even if nothing has changed
+        """
+        if shots == self.shots and window == self.window and not force:
+            return
+        if shots < 2 or window < shots:
+            raise ValueError("Need at least two shots, and a window at least as large")
+        self.shots = shots
+        self.window = window
+        self.clear()
+
+    def _agrees(self, x: float, y: float, z: float, distance: float, i: int) -> bool:
+        vectors = self._vectors
+        if abs(distance - vectors.field(i, _DISTANCE)) > MAX_DISTANCE_CHANGE:
+            return False
+        dx = x - vectors.field(i, _X)
+        dy = y - vectors.field(i, _Y)
+        dz = z - vectors.field(i, _Z)
+        return dx * dx + dy * dy + dz * dz < MAX_DIRECTION_CHANGE * MAX_DIRECTION_CHANGE
+
+    def add(self, azimuth: float, inclination: float, distance: float) -> bool:
+        """
+        Add a shot
+
+        :param azimuth: Azimuth in degrees
+        :param inclination: Inclination in degrees
+        :param distance: Distance in metres
+        :return: True if this shot completes a leg
+        """
+        x, y, z = direction(azimuth, inclination)
+        agreements = 0
+        count = len(self._vectors)
+        for k in range(min(count, self.window - 1)):
+            if self._agrees(x, y, z, distance, -1 - k):
+                agreements |= 1 << k
+        self._vectors.append((x, y, z, distance))
+        self._agreements.append(agreements)
+        return self.is_leg()
+
+    def is_leg(self) -> bool:
+        """
+        :return: True if the most recent shot and ``shots - 1`` others in the window all agree
+        """
+        if len(self._agreements) < self.shots:
+            return False
+        candidates = [k + 1 for k in range(self.window - 1) if self._agreements[-1] & (1 << k)]
+        return self._find_group(candidates, self.shots - 1)
+
+    def _mutual(self, a: int, b: int) -> bool:
+        """
+        :param a: How many shots before the newest the first shot is
+        :param b: How many shots before the newest the second shot is; must be greater than ``a``
+        :return: True if the two shots agree
+        """
+        return bool(self._agreements[-1 - a] & (1 << (b - a - 1)))
+
+    def _find_group(self, candidates: List[int], needed: int) -> bool:
+        """
+        Find whether ``needed`` of the candidates all agree with each other
+        """
+        if needed == 0:
+            return True
+        for i, a in enumerate(candidates):
+            rest = [b for b in candidates[i + 1:] if self._mutual(a, b)]
+            if len(rest) >= needed - 1 and self._find_group(rest, needed - 1):
+                return True
+        return False
+
+    def clear(self):
+        """
+        Forget all previous shots
+        """
+        self._vectors = ArrayQueue(max_len=self.window, columns=4)
+        self._agreements = DiscardingQueue(max_len=self.window)
+        # bit k of the agreements for a shot is set if it agrees with the shot k+1 before it
@@ -0,0 +1,102 @@
+"""
+Linear algebra for calibration that works with either numpy or ulab, kept apart from `utils` so
+that it can be run and benchmarked on the host.
+"""
+from mag_cal.utils import np, ULAB_PRESENT
+
+if ULAB_PRESENT:
+    # noinspection PyUnresolvedReferences
+    from ulab import scipy
+else:
+    import scipy.linalg
+
+MAX_CONDITION = 1e6
+"""Largest estimated condition number of AᵀA to solve by Cholesky, above this QR is used instead.
+ulab works in single precision on the device, which loses about this many significant figures to it"""
+
+RANK_TOLERANCE = 1e-10
+"""Columns of A whose QR diagonal is smaller than this, relative to the largest, count as dependent"""
+
+
+# noinspection PyPep8Naming
+class LeastSquares:
+    """
+    Least squares solutions of Ax=B for one design matrix A. A is factorised once, when this is
+    created, and any number of right hand sides can then be solved against it.
+
+    The normal equations AᵀAx=AᵀB are solved with a Cholesky factorisation, as it is fastest and
+    needs least memory. If AᵀA is not positive definite or looks badly conditioned, A is factorised
+    by QR instead, which loses far less precision.
+
+    Whether AᵀA is badly conditioned is judged from the square of the ratio of the largest to the
+    smallest diagonal entry of its Cholesky factor L. This is a lower bound on its condition number,
+    not an estimate of it, but it is free once L is known and catches nearly dependent columns,
+    which are what calibration data suffers from.
+    """
+
+    def __init__(self, A):
+        """
+        :param A: Array of shape (M, N), with M >= N
+        :raises ValueError: if A does not have full column rank
+        """
+        self.A = A
+        self.q = None
+        self.r = None
+        self.l = None
+        try:
+            l = np.linalg.cholesky(np.dot(A.transpose(), A))
+            diagonal = [abs(l[i, i]) for i in range(l.shape[0])]
+            # lower bound on the condition number of AᵀA, see above
+            if min(diagonal) > 0 and (max(diagonal) / min(diagonal)) ** 2 <= MAX_CONDITION:
+                self.l = l
+        except ValueError:
+            # not positive definite
+            pass
+        if self.l is None:
+            self.q, self.r = np.linalg.qr(A)
+            diagonal = [abs(self.r[i, i]) for i in range(self.r.shape[0])]
+            if min(diagonal) <= max(diagonal) * RANK_TOLERANCE:
+                raise ValueError("Design matrix does not have full column rank")
+
+    @property
+    def method(self) -> str:
+        """Which factorisation is used, either cholesky or qr"""
+        return "qr" if self.l is None else "cholesky"
+
+    def solve(self, B):
+        """
+        :param B: Array of shape (M,), or (M, K) to solve K right hand sides at once
+        :return: x, of shape (N,) or (N, K)
+        """
+        if self.l is None:
+            rhs = np.dot(self.q.transpose(), B)
+        else:
+            rhs = np.dot(self.A.transpose(), B)
+        if len(B.shape) == 1:
+            return self._solve_one(rhs)
+        x = np.zeros(rhs.shape)
+        for k in range(rhs.shape[1]):
+            x[:, k] = self._solve_one(rhs[:, k])
+        return x
+
+    def _solve_one(self, rhs):
+        if self.l is None:
+            return scipy.linalg.solve_triangular(self.r, rhs, lower=False)
+        if ULAB_PRESENT:
+            return scipy.linalg.cho_solve(self.l, rhs)
+        return scipy.linalg.cho_solve((self.l, True), rhs)
+
+
+# noinspection PyPep8Naming
+def lstsq(A, B):
+    """
+    Least squares solution of Ax=B, using `LeastSquares`. This is patched into mag_cal by
+    `calibrate`, as it is faster and uses less memory than mag_cal's own. Nothing is kept between
+    calls: to solve several right hand sides against the same A, pass them together as B, or hold on
+    to a `LeastSquares`
+
+    :param A: Array of shape (M, N)
+    :param B: Array of shape (M,), or (M, K) for several right hand sides
+    :return: (x, None), to match the signature of mag_cal's lstsq
+    """
+    return LeastSquares(A).solve(B), None
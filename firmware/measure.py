@@ -8,13 +8,16 @@ from mag_cal import MagneticAnomalyError, DipAnomalyError, GravityAnomalyError,
 
 try:
     # noinspection PyUnresolvedReferences
-    from typing import Dict
+    from typing import Dict, Optional
 except ImportError:
     pass
 
 from . import config
 from . import display
 from . import hardware
+from . import sampling
+from . import timing
+from .timing import shot_timer
 from .data import readings, Leg
 from .debug import logger
 from .utils import check_mem
@@ -88,46 +91,55 @@ async def measure(devices: hardware.HardwareBase, cfg: config.Config, disp: disp
                 success = True
         # noinspection PyUnboundLocalVariable
         if readings.current_reading is not None and success:
+            mark = shot_timer.start()
             disp.update_measurement(readings.current, readings.current_reading, showing_extents)
+            shot_timer.lap(timing.DISPLAY, mark)
 
 
-async def get_raw_measurement(devices: hardware.HardwareBase, disp: display.DisplayBase, with_laser: bool = True):
+async def get_raw_measurement(devices: hardware.HardwareBase, disp: display.DisplayBase, with_laser: bool = True,
+                              samples: int = 1, guard: Optional[float] = None):
+    """
+    Take a distance reading (if ``with_laser``) and read both orientation sensors
+
+    :param samples: Number of readings to take from each sensor. These are averaged with outliers
+      rejected, to reduce noise
+    :param guard: If not None, read the sensors while waiting for the laser, starting this many
+      seconds after the laser is triggered. See `sampling.capture`
+    :return: mag, grav, distance
+    """
     logger.info("Taking a reading")
     try:
         disp.sleep()
-        if with_laser:
-            distance = await asyncio.wait_for(devices.laser_measure(), LASER_TIMEOUT) / 1000
-        else:
-            distance = None
-        logger.debug(f"Raw Distance: {distance}m")
-        await devices.laser_on(False)
-        await asyncio.sleep(0.1)
-        mag = devices.magnetometer.magnetic
-        logger.debug(f"Mag: {mag}")
-        grav = devices.accelerometer.acceleration
-        logger.debug(f"Grav: {grav}")
-        await devices.laser_on(True)
+        shot = await sampling.capture(devices, with_laser, samples, guard, LASER_TIMEOUT, shot_timer)
     finally:
         disp.sleep(wake=True)
-    return mag, grav, distance
+    distance = None if shot.distance is None else shot.distance / 1000
+    logger.debug(f"Raw Distance: {distance}m")
+    logger.debug(f"Mag: {shot.mag} spread: {shot.mag_spread}")
+    logger.debug(f"Grav: {shot.grav} spread: {shot.grav_spread}")
+    return shot.mag, shot.grav, distance
 
 
 async def take_reading(devices: hardware.HardwareBase,
                        cfg: config.Config,
                        disp: display.DisplayBase) -> bool:
     # take a reading
+    shot_timer.enabled = cfg.shot_timing
     try:
         try:
-            mag, grav, distance = await get_raw_measurement(devices, disp, True)
-            if cfg.calib is None:
+            mag, grav, distance = await get_raw_measurement(devices, disp, True,
+                                                             cfg.sensor_samples, cfg.laser_guard)
+            if not cfg.has_calib:
                 raise NotCalibrated()
-            # noinspection PyTypeChecker
-            azimuth, inclination, _ = cfg.calib.get_angles(mag, grav)
+            mark = shot_timer.start()
+            result = cfg.fused_calib.measure(mag, grav)
+            azimuth, inclination = result.azimuth, result.inclination
+            mark = shot_timer.lap(timing.ANGLES, mark)
             distance += cfg.laser_cal
             logger.debug(f"Distance: {distance}m")
             if cfg.anomaly_strictness is not None:
-                # noinspection PyTypeChecker
-                cfg.calib.raise_if_anomaly(mag, grav, cfg.anomaly_strictness)
+                cfg.fused_calib.raise_if_anomaly(result, cfg.anomaly_strictness)
+                shot_timer.lap(timing.ANOMALY, mark)
         except tuple(ERROR_MESSAGES.keys()) as exc:
             isMagneticError = False
             for key in ERROR_MESSAGES.keys():
@@ -158,9 +170,12 @@ async def take_reading(devices: hardware.HardwareBase,
             return False
         else:
             leg = Leg(azimuth, inclination, distance)
-            readings.store_reading(leg, cfg)
+            mark = shot_timer.start()
+            readings.store_reading(leg, cfg, mag, grav)
+            mark = shot_timer.lap(timing.STORE, mark)
             devices.bt.disto.send_data(azimuth, inclination, distance)
-            if readings.triple_shot():
+            shot_timer.lap(timing.BLUETOOTH, mark)
+            if readings.is_leg():
                 devices.flash_laser(2,0.2)
                 devices.beep_happy()
             else:
@@ -173,7 +188,21 @@ async def take_reading(devices: hardware.HardwareBase,
         #       because the device may not be able to recover otherwise?
         return False
     
-async def take_multiple_readings(devices, disp, fname, prelude, reminder):
+async def take_multiple_readings(devices, disp, fname, prelude, reminder, tracker=None, samples: int = 1,
+                                 guard: Optional[float] = None):
+    """
+    Take raw readings until the user presses B, and save them to a file
+
+    :param fname: JSON file to save readings to
+    :param prelude: Instructions to show before starting
+    :param reminder: Text to show after each reading
+    :param tracker: Optional `cal_coverage.CoverageTracker` to add each reading to as it is taken.
+      Its progress is shown instead of the reminder, and collection ends once it is complete
+    :param samples: Number of readings to average from each sensor for each shot, as for survey shots
+    :param guard: If not None, read the sensors this many seconds after starting with the laser on,
+      so that the shots see the same interference as survey shots. See `sampling.capture`
+    :return: Lists of magnetometer and accelerometer readings
+    """
     devices.laser_enable(True)
     disp.show_info(prelude)
     await devices.button_a.wait(Button.SINGLE)
@@ -182,15 +211,23 @@ async def take_multiple_readings(devices, disp, fname, prelude, reminder):
     gravs = []
     count = 0
     while True:
-        disp.show_info(f"Legs: {count}\r\n{reminder}")
+        if tracker is None:
+            disp.show_info(f"Legs: {count}\r\n{reminder}")
+        else:
+            disp.show_info(tracker.summary())
         button, click = await devices.both_buttons.wait(a=(Button.SINGLE, Button.LONG), b=Button.SINGLE)
         if button == "a":
             if click == Button.SINGLE:
                 await asyncio.sleep(0.5)
-            mag, grav, _ = await get_raw_measurement(devices, disp, False)
+            mag, grav, _ = await get_raw_measurement(devices, disp, False, samples, guard)
             mags.append(mag)
             gravs.append(grav)
             devices.beep_bip()
+            if tracker is not None:
+                tracker.add(mag, grav)
+                if tracker.complete:
+                    devices.beep_bop()
+                    break
         elif button == "b":
             devices.beep_bop()
             break
@@ -204,9 +241,9 @@ async def take_multiple_readings(devices, disp, fname, prelude, reminder):
     return mags, gravs
 
 
-# noinspection PyUnusedLocal
 async def save_multiple_shots(devices: hardware.HardwareBase, cfg: config.Config, disp: display.DisplayBase):
     prelude = "Press A\r\nto start recording\r\nPress B to stop"
     reminder = "Press B to stop"
     fname = "debug_shots.json"
-    await take_multiple_readings(devices, disp, fname, prelude, reminder)
+    await take_multiple_readings(devices, disp, fname, prelude, reminder, samples=cfg.sensor_samples,
+                                 guard=cfg.laser_guard)
@@ -10,6 +10,7 @@ from . import config
 from . import display
 from . import hardware
 from . import info
+from . import sampling
 from . import debug
 from .debug import logger
 from .config import Config
@@ -57,6 +58,7 @@ async def menu(devices: hardware.HardwareBase, cfg: config.Config, disp: display
     items = [
         ("Calibrate", [
             ("Sensors", AsyncAction(calibrate.calibrate_sensors)),
+            ("Top Up Sensors", AsyncAction(calibrate.top_up_calibration)),
             ("Laser", AsyncAction(calibrate.calibrate_distance)),
             ("Cal From Saved", AsyncAction(calibrate.cal_from_saved)),
         ]),
@@ -64,6 +66,7 @@ async def menu(devices: hardware.HardwareBase, cfg: config.Config, disp: display
             ("Raw Data", AsyncAction(info.raw_readings)),
             ("Calibrated Data", AsyncAction(info.calibrated_readings)),
             ("Orientation", AsyncAction(info.orientation)),
+            ("Shot Timing", AsyncAction(info.shot_timing)),
             ("Device", AsyncAction(info.device)),
         ]),
         ("Settings", [
@@ -113,6 +116,14 @@ async def menu(devices: hardware.HardwareBase, cfg: config.Config, disp: display
                 ]
             )),
 
+            ("Leg Detection", ConfigOptions(
+                name="leg_window", obj=cfg,
+                options=[
+                    ("Last 3 shots", 3),
+                    ("Last 4 shots", 4),
+                    ("Last 5 shots", 5),
+                ]
+            )),
             ("Anomaly Detection", ConfigOptions(
                 name="anomaly_strictness", obj=cfg,
                 options=[
@@ -120,12 +131,35 @@ async def menu(devices: hardware.HardwareBase, cfg: config.Config, disp: display
                     ("Relaxed", config.SOFT_STRICTNESS),
                     ("Strict", config.HARD_STRICTNESS)],
             )),
+            ("Sensor Samples", ConfigOptions(
+                name="sensor_samples", obj=cfg,
+                options=[
+                    ("1", 1),
+                    ("3", 3),
+                    ("5", 5),
+                    ("9", 9),
+                ]
+            )),
+            ("Sensor Timing", ConfigOptions(
+                name="laser_guard", obj=cfg,
+                options=[
+                    ("After laser", None),
+                    ("With laser (fast)", sampling.LASER_GUARD),
+                ]
+            )),
             ("Save Readings", ConfigOptions(
                 name="save_readings", obj=cfg,
                 options=[
                     ("Off", False),
                     ("On", True),
                 ]
+            )),
+            ("Time Shots", ConfigOptions(
+                name="shot_timing", obj=cfg,
+                options=[
+                    ("Off", False),
+                    ("On", True),
+                ]
             ))
         ]),
         ("Bluetooth", [
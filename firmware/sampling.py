@@ -0,0 +1,274 @@
+import asyncio
+import math
+from collections import namedtuple
+
+try:
+    from . import timing
+except ImportError:
+    # running on the host, not as part of the firmware package
+    import timing
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+    Vector = Tuple[float, float, float]
+except ImportError:
+    pass
+
+OUTLIER_THRESHOLD = 3.0
+"""Samples more than this many (robust) standard deviations from the median are discarded"""
+
+LASER_OFF_SETTLE = 0.1
+"""Time to wait after switching the laser off before reading the sensors in sequential mode"""
+
+LASER_GUARD = 0.1
+"""Guard time offered in the menu for reading the sensors while the laser measures, long enough to
+miss the laser switching on. See `capture`"""
+
+TARGET_DISTANCE_ERROR = 0.5
+"""Standard error in mm at which `measure_distance` stops taking readings"""
+
+MIN_DISTANCE_READINGS = 5
+"""Fewest readings `measure_distance` takes, so that the spread can be estimated"""
+
+MAX_DISTANCE_READINGS = 20
+"""Most readings `measure_distance` takes, however much they vary"""
+
+DISTANCE_RESOLUTION = 1.0
+"""Smallest step in laser readings, in mm"""
+
+MAG_RESOLUTION = 1 / 736
+"""Smallest step in magnetometer readings, in µT: one LSB of the RM3100 at a cycle count of 2000"""
+
+GRAV_RESOLUTION = 0.061e-3 * 9.80665
+"""Smallest step in accelerometer readings, in m/s²: one LSB of the LSM6DS3 at ±2 g"""
+
+Shot = namedtuple("Shot", ("mag", "grav", "distance", "mag_spread", "grav_spread"))
+
+Distance = namedtuple("Distance", ("distance", "error", "count", "rejected"))
+
+_NULL_TIMER = timing.ShotTimer()
+_MAD_TO_SIGMA = 1.4826
+_MIN_DEVIATION = 1e-6
+
+
+def median(values: Sequence[float]) -> float:
+    """
+    Find the median of a sequence of values
+
+    :param values: Sequence of at least one value
+    :return: Median value
+    """
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def _limit(values: Sequence[float], centre: float, threshold: float, resolution: float) -> float:
+    # readings are quantised, so when most are identical the median absolute deviation is zero and
+    # a reading one step away would be an outlier: the deviation is taken as at least one step
+    deviation = median([abs(x - centre) for x in values]) * _MAD_TO_SIGMA
+    return max(deviation, resolution, _MIN_DEVIATION) * threshold
+
+
+def robust_stats(values: Sequence[float], threshold: float = OUTLIER_THRESHOLD,
+                 resolution: float = 0.0) -> Tuple[float, float, int]:
+    """
+    Average a set of single values, discarding outliers in the same way as `robust_mean`
+
+    :param values: Sequence of at least one value
+    :param threshold: Number of standard deviations a value may be from the median
+    :param resolution: Smallest step between readings, used as the least standard deviation
+    :return: (mean, error, count) where error is the standard error of the mean of the accepted
+      values, infinite if there is only one, and count is the number of values accepted
+    """
+    centre = median(values)
+    limit = _limit(values, centre, threshold, resolution)
+    accepted = [x for x in values if abs(x - centre) <= limit]
+    count = len(accepted)
+    mean = sum(accepted) / count
+    if count < 2:
+        return mean, float("inf"), count
+    variance = sum((x - mean) ** 2 for x in accepted) / (count - 1)
+    return mean, math.sqrt(variance / count), count
+
+
+def read_burst(read: Callable[[], Vector], count: int) -> List[Vector]:
+    """
+    Read a sensor repeatedly
+
+    :param read: Function that returns a single reading of 3 floats
+    :param count: Number of readings to take
+    :return: List of readings
+    """
+    return [tuple(read()) for _ in range(count)]
+
+
+def robust_mean(samples: Sequence[Vector], threshold: float = OUTLIER_THRESHOLD,
+                resolution: float = 0.0) -> Tuple[Vector, float]:
+    """
+    Average a set of vector readings, discarding outliers. Any sample that is more than ``threshold``
+    robust standard deviations (estimated from the median absolute deviation, but no less than
+    ``resolution``) away from the median on any axis is rejected, and the remaining samples averaged.
+
+    :param samples: Sequence of readings, each of three floats
+    :param threshold: Number of standard deviations a sample may be from the median
+    :param resolution: Smallest step between readings on each axis
+    :return: (mean, spread) where mean is the averaged vector and spread is the RMS distance of the
+      accepted samples from that mean
+    """
+    if len(samples) == 1:
+        return tuple(samples[0]), 0.0
+    axes = list(zip(*samples))
+    centres = [median(axis) for axis in axes]
+    limits = [_limit(axis, centre, threshold, resolution) for axis, centre in zip(axes, centres)]
+    accepted = [s for s in samples if all(abs(x - c) <= lim for x, c, lim in zip(s, centres, limits))]
+    if not accepted:
+        return tuple(centres), 0.0
+    count = len(accepted)
+    mean = tuple(sum(axis) / count for axis in zip(*accepted))
+    spread = math.sqrt(sum((x - m) ** 2 for s in accepted for x, m in zip(s, mean)) / count)
+    return mean, spread
+
+
+def read_averaged(read: Callable[[], Vector], count: int,
+                  threshold: float = OUTLIER_THRESHOLD, resolution: float = 0.0) -> Tuple[Vector, float]:
+    """
+    Take ``count`` readings from a sensor and return the outlier-rejected average and spread. See
+    `robust_mean` for details
+
+    :param read: Function that returns a single reading of 3 floats
+    :param count: Number of readings to take
+    :param threshold: Number of standard deviations a sample may be from the median
+    :param resolution: Smallest step between the sensor's readings
+    :return: (mean, spread)
+    """
+    return robust_mean(read_burst(read, count), threshold, resolution)
+
+
+async def read_averaged_async(read: Callable[[], Vector], count: int,
+                              threshold: float = OUTLIER_THRESHOLD,
+                              resolution: float = 0.0) -> Tuple[Vector, float]:
+    """
+    As `read_averaged`, but yields to the event loop between readings so other tasks (such as
+    waiting for the laser) can proceed
+
+    :param read: Function that returns a single reading of 3 floats
+    :param count: Number of readings to take
+    :param threshold: Number of standard deviations a sample may be from the median
+    :param resolution: Smallest step between the sensor's readings
+    :return: (mean, spread)
+    """
+    samples = []
+    for _ in range(count):
+        samples.append(tuple(read()))
+        await asyncio.sleep(0)
+    return robust_mean(samples, threshold, resolution)
+
+
+async def measure_distance(measure: Callable[[], Awaitable[float]],
+                           target: float = TARGET_DISTANCE_ERROR,
+                           min_count: int = MIN_DISTANCE_READINGS,
+                           max_count: int = MAX_DISTANCE_READINGS,
+                           threshold: float = OUTLIER_THRESHOLD,
+                           resolution: float = DISTANCE_RESOLUTION,
+                           on_reading: Optional[Callable[[int, float], None]] = None) -> Distance:
+    """
+    Take distance readings until the standard error of their mean, after discarding outliers as in
+    `robust_stats`, is below ``target``, or ``max_count`` readings have been taken
+
+    :param measure: Coroutine function that returns a distance, such as ``laser_measure``
+    :param target: Standard error to stop at, in the same units as the distances
+    :param min_count: Fewest readings to take
+    :param max_count: Most readings to take
+    :param threshold: Number of standard deviations a reading may be from the median
+    :param resolution: Smallest step between readings, in the same units as the distances
+    :param on_reading: Called with the number of readings so far and the latest, after each one
+    :return: `Distance` with the mean, its standard error, the number of readings taken and the
+      number discarded as outliers
+    """
+    readings = []
+    while True:
+        readings.append(await measure())
+        if on_reading is not None:
+            on_reading(len(readings), readings[-1])
+        if len(readings) < min_count:
+            continue
+        mean, error, accepted = robust_stats(readings, threshold, resolution)
+        if error <= target or len(readings) >= max_count:
+            return Distance(mean, error, len(readings), len(readings) - accepted)
+
+
+async def read_orientation(devices, samples: int = 1, delay: float = 0.0,
+                           timer: Optional[timing.ShotTimer] = None):
+    """
+    Read the magnetometer and accelerometer
+
+    :param devices: Hardware with ``magnetometer`` and ``accelerometer`` attributes
+    :param samples: Number of readings to average from each sensor
+    :param delay: Time to wait before the first reading
+    :param timer: If given, record the time taken to read each sensor
+    :return: mag, grav, mag_spread, grav_spread
+    """
+    if timer is None:
+        timer = _NULL_TIMER
+    await asyncio.sleep(delay)
+    mark = timer.start()
+    mag, mag_spread = await read_averaged_async(lambda: devices.magnetometer.magnetic, samples,
+                                                resolution=MAG_RESOLUTION)
+    mark = timer.lap(timing.MAG, mark)
+    grav, grav_spread = await read_averaged_async(lambda: devices.accelerometer.acceleration, samples,
+                                                  resolution=GRAV_RESOLUTION)
+    timer.lap(timing.GRAV, mark)
+    return mag, grav, mag_spread, grav_spread
+
+
+async def capture(devices, with_laser: bool = True, samples: int = 1, guard: Optional[float] = None,
+                  timeout: Optional[float] = None, timer: Optional[timing.ShotTimer] = None) -> Shot:
+    """
+    Take a distance reading and orientation readings for a single shot.
+
+    If ``guard`` is None, this is done sequentially: the laser measures, is switched off and after
+    `LASER_OFF_SETTLE` seconds the sensors are read. Otherwise, the sensors are read while waiting
+    for the laser to respond, starting ``guard`` seconds after the measurement is triggered, so that
+    the sensors do not see any interference as the laser switches on. Without a distance reading
+    the sensors are then read ``guard`` seconds after starting, with the laser still on, so that
+    calibration shots see the same interference from the laser as survey shots. The laser is left
+    on in every case.
+
+    :param devices: Hardware to use, as `HardwareBase`
+    :param with_laser: Whether to take a distance reading
+    :param samples: Number of readings to average from each sensor
+    :param guard: Time in seconds after triggering the laser before the sensors can be read, or None
+      to read the sensors after the laser has finished
+    :param timeout: Maximum time to wait for the laser
+    :param timer: If given, record the time taken by the laser and each sensor
+    :return: `Shot`, with distance in mm, or None if ``with_laser`` is False
+    """
+    if timer is None:
+        timer = _NULL_TIMER
+    distance = None
+    if with_laser and guard is not None:
+        sensor_task = asyncio.create_task(read_orientation(devices, samples, guard, timer))
+        mark = timer.start()
+        try:
+            distance = await asyncio.wait_for(devices.laser_measure(), timeout)
+        except BaseException:
+            sensor_task.cancel()
+            raise
+        timer.lap(timing.LASER, mark)
+        mag, grav, mag_spread, grav_spread = await sensor_task
+    elif guard is not None:
+        mag, grav, mag_spread, grav_spread = await read_orientation(devices, samples, guard, timer)
+    else:
+        if with_laser:
+            mark = timer.start()
+            distance = await asyncio.wait_for(devices.laser_measure(), timeout)
+            timer.lap(timing.LASER, mark)
+        await devices.laser_on(False)
+        mag, grav, mag_spread, grav_spread = await read_orientation(devices, samples, LASER_OFF_SETTLE, timer)
+    await devices.laser_on(True)
+    return Shot(mag, grav, distance, mag_spread, grav_spread)
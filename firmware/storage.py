@@ -0,0 +1,150 @@
+"""
+Helpers for keeping the device's configuration on flash: writing files so that a reset part way
+through never leaves a damaged file, and a compact binary form for calibrations.
+
+A calibration blob starts with ``b"SAPC"``, a version byte and three reserved bytes, then the mean
+dip as a float32, then the magnetometer and accelerometer in turn. Each sensor is its six
+character axes string, the 3x3 transform, the centre, the mean and standard deviation of field
+strength (all float32), then a byte with the number of non-linear correction functions followed
+by, for each, a byte with its number of parameters and the parameters as float32. Everything is
+little-endian.
+"""
+import os
+import struct
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import List
+except ImportError:
+    pass
+
+MAGIC = b"SAPC"
+VERSION = 1
+HEADER_FORMAT = "<4sB3x"
+SENSOR_FORMAT = "<6s14f"
+TEMP_SUFFIX = ".tmp"
+
+_STRUCT_ERROR = getattr(struct, "error", ValueError)  # MicroPython raises ValueError
+
+
+class StorageError(Exception):
+    """
+    Data is not a calibration blob, or is damaged
+    """
+
+
+def write_atomic(fname: str, data: bytes):
+    """
+    Replace the contents of a file. The new data is written to a temporary file first, so if
+    power is lost part way through, `read_atomic` will return either the old or the new contents
+
+    :param fname: File to write
+    :param data: New contents
+    :raises OSError: if the file cannot be written
+    """
+    temp = fname + TEMP_SUFFIX
+    with open(temp, "wb") as f:
+        f.write(data)
+    try:
+        os.rename(temp, fname)
+    except OSError:
+        # the FAT filesystem will not rename over an existing file
+        os.remove(fname)
+        os.rename(temp, fname)
+
+
+def read_atomic(fname: str) -> bytes:
+    """
+    Read a file written with `write_atomic`, recovering the new contents if power was lost after
+    the old file was removed but before the new one was renamed
+
+    :param fname: File to read
+    :return: File contents
+    :raises OSError: if there is no such file
+    """
+    try:
+        with open(fname, "rb") as f:
+            return f.read()
+    except OSError:
+        with open(fname + TEMP_SUFFIX, "rb") as f:
+            return f.read()
+
+
+def remove(fname: str):
+    """
+    Remove a file and any temporary file left by `write_atomic`, ignoring files that do not exist
+    """
+    for name in (fname, fname + TEMP_SUFFIX):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def _flatten(rows) -> List[float]:
+    result = []
+    for row in rows:
+        if isinstance(row, (list, tuple)):
+            result.extend(_flatten(row))
+        else:
+            result.append(float(row))
+    return result
+
+
+def pack_calibration(dct: dict) -> bytes:
+    """
+    Convert a calibration to a binary blob
+
+    :param dct: Calibration as from ``Calibration.as_dict``
+    :return: Binary form
+    """
+    parts = [struct.pack(HEADER_FORMAT, MAGIC, VERSION), struct.pack("<f", dct["dip_avg"])]
+    for name in ("mag", "grav"):
+        sensor = dct[name]
+        values = (sensor["axes"].encode(),) + tuple(_flatten(sensor["transform"])) + \
+            tuple(_flatten(sensor["centre"])) + (sensor["field_avg"], sensor["field_std"])
+        parts.append(struct.pack(SENSOR_FORMAT, *values))
+        parts.append(bytes((len(sensor["rbfs"]),)))
+        for rbf in sensor["rbfs"]:
+            params = _flatten(rbf)
+            parts.append(bytes((len(params),)))
+            parts.append(struct.pack(f"<{len(params)}f", *params))
+    return b"".join(parts)
+
+
+def unpack_calibration(data: bytes) -> dict:
+    """
+    Convert a binary blob back to a calibration
+
+    :param data: Blob from `pack_calibration`
+    :return: Dict suitable for ``Calibration.from_dict``
+    :raises StorageError: if the data is not a valid calibration
+    """
+    try:
+        magic, version = struct.unpack_from(HEADER_FORMAT, data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise StorageError("Not a calibration")
+        offset = struct.calcsize(HEADER_FORMAT)
+        dct = {"dip_avg": struct.unpack_from("<f", data, offset)[0]}
+        offset += 4
+        for name in ("mag", "grav"):
+            values = struct.unpack_from(SENSOR_FORMAT, data, offset)
+            offset += struct.calcsize(SENSOR_FORMAT)
+            rbfs = []
+            for _ in range(data[offset]):
+                count = data[offset + 1]
+                params = struct.unpack_from(f"<{count}f", data, offset + 2)
+                rbfs.append([[x] for x in params])
+                offset += 1 + 4 * count
+            offset += 1
+            dct[name] = {
+                "axes": values[0].decode(),
+                "transform": [list(values[1:4]), list(values[4:7]), list(values[7:10])],
+                "centre": list(values[10:13]),
+                "rbfs": rbfs,
+                "field_avg": values[13],
+                "field_std": values[14],
+            }
+    except (IndexError, ValueError, _STRUCT_ERROR) as exc:
+        raise StorageError("Damaged calibration") from exc
+    return dct
@@ -0,0 +1,201 @@
+"""
+Benchmark sensor calibration, failing if anything has got slower or uses more memory than before.
+Run from the firmware directory with::
+
+    python tests/bench_calibration.py                          # compare with the baseline
+    python tests/bench_calibration.py --update                 # record a new baseline
+    python tests/bench_calibration.py calibration_data.json    # include shots recorded on a device
+
+For each dataset, every stage of `cal_pipeline.CalibrationPipeline` is timed, and its peak memory
+use measured with tracemalloc. So are `linalg.lstsq`, on the matrix ``Sensor.fit_ellipsoid`` would
+build, `linalg.LeastSquares` solving three right hand sides against that matrix at once, `calibrate_roll.calib_fit_rotM_cstdip`, and `calibrate_roll.RollFit` doing the same fit a
+reading at a time. Results are compared with
+``bench_calibration.json`` next to this file, and the script exits with an error if any time or
+peak is more than the threshold above the baseline. Times depend on the machine, so record a
+baseline before making changes and compare on the same machine.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import calibrate_roll  # noqa: E402
+import linalg  # noqa: E402
+from cal_pipeline import CalibrationPipeline, STAGES  # noqa: E402
+from test_cal_coverage import random_shots, shot  # noqa: E402
+from test_fused_cal import load_calib  # noqa: E402
+
+BASELINE = path.join(path.dirname(path.abspath(__file__)), "bench_calibration.json")
+SYNTHETIC_SIZES = (24, 100, 400)
+REPEATS = 5
+TIME_THRESHOLD = 0.5
+"""Fractional increase in time that counts as a regression"""
+
+TIME_SLACK = 0.0005
+"""Increases in time of less than this many seconds are ignored, as short times are noisy"""
+
+MEMORY_THRESHOLD = 0.1
+"""Fractional increase in peak memory that counts as a regression"""
+
+MEMORY_SLACK = 1024
+"""Increases in peak memory of fewer bytes than this are ignored"""
+
+
+def synthetic(count: int):
+    """
+    Shots in random directions followed by two runs of eight in the same direction, made with the
+    test device's calibration
+    """
+    calib = load_calib()
+    rng = np.random.default_rng(count)
+    shots = random_shots(calib, count - 16, seed=count)
+    for azimuth, inclination in ((40, 5), (130, -20)):
+        shots.extend(shot(calib, azimuth, inclination, roll, rng) for roll in range(0, 360, 45))
+    mag, grav = zip(*shots)
+    return np.array(mag), np.array(grav)
+
+
+def recorded(fname: str):
+    with open(fname) as f:
+        dct = json.load(f)
+    return np.array(dct["mag"], dtype=float), np.array(dct["grav"], dtype=float)
+
+
+def ellipsoid_terms(data: np.ndarray) -> np.ndarray:
+    x, y, z = data[:, 0:1], data[:, 1:2], data[:, 2:3]
+    return np.concatenate((x * x, y * y, z * z, 2 * x * y, 2 * x * z, 2 * y * z, 2 * x, 2 * y, 2 * z), axis=1)
+
+
+def bench_pipeline(mag, grav, mag_axes: str, grav_axes: str, progress: str):
+    """
+    :return: Time and peak memory for each stage, and the resulting calibration
+    """
+    results = {name: {"time": float("inf")} for name, _ in STAGES}
+    for _ in range(REPEATS):
+        if path.exists(progress):
+            os.remove(progress)
+        pipeline = CalibrationPipeline(mag, grav, mag_axes, grav_axes, progress_file=progress)
+        for name, _ in STAGES:
+            start = time.perf_counter()
+            pipeline.run_stage()
+            results[name]["time"] = min(results[name]["time"], time.perf_counter() - start)
+    os.remove(progress)
+    pipeline = CalibrationPipeline(mag, grav, mag_axes, grav_axes, progress_file=progress)
+    tracemalloc.start()
+    for name, _ in STAGES:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        pipeline.run_stage()
+        results[name]["peak"] = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    os.remove(progress)
+    return results, pipeline.cal
+
+
+def bench_function(func, *args) -> dict:
+    duration = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(*args)
+        duration = min(duration, time.perf_counter() - start)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {"time": duration, "peak": peak}
+
+
+def lstsq(a, b):
+    return linalg.lstsq(a, b)
+
+
+def lstsq_multi(a, b):
+    return linalg.LeastSquares(a).solve(b)
+
+
+def roll_fit(mag, grav):
+    fit = calibrate_roll.RollFit(1)
+    for m, g in zip(mag, grav):
+        fit.add(m, g)
+    fit.solve()
+    return fit.rotation()
+
+
+def bench_dataset(mag, grav, mag_axes: str, grav_axes: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        results, cal = bench_pipeline(mag, grav, mag_axes, grav_axes, path.join(tmp, "progress.json"))
+    terms = ellipsoid_terms(cal.mag.axes.fix_axes(mag))
+    results["lstsq"] = bench_function(lstsq, terms, np.ones(len(terms)))
+    results["lstsq_multi"] = bench_function(lstsq_multi, terms, np.ones((len(terms), 3)))
+    mag, grav = cal.mag.apply(mag), cal.grav.apply(grav)
+    results["roll_fit"] = bench_function(calibrate_roll.calib_fit_rotM_cstdip, mag, grav, 1, False)
+    results["roll_sums"] = bench_function(roll_fit, mag, grav)
+    return results
+
+
+def compare(baseline: dict, results: dict, time_threshold: float, memory_threshold: float) -> list:
+    """
+    :return: Descriptions of every regression
+    """
+    problems = []
+    for dataset, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(dataset, {}).get(stage)
+            if base is None:
+                continue
+            if result["time"] > base["time"] * (1 + time_threshold) + TIME_SLACK:
+                problems.append(f"{dataset} {stage}: {result['time'] * 1000:.1f} ms, "
+                                f"was {base['time'] * 1000:.1f} ms")
+            if result["peak"] > base["peak"] * (1 + memory_threshold) + MEMORY_SLACK:
+                problems.append(f"{dataset} {stage}: peak {result['peak']} bytes, was {base['peak']} bytes")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sensor calibration")
+    parser.add_argument("files", nargs="*", help="calibration_data.json files recorded on a device")
+    parser.add_argument("--update", action="store_true", help="Save results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file to compare with or update")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD,
+                        help="Fractional increase in time that fails, default %(default)s")
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD,
+                        help="Fractional increase in peak memory that fails, default %(default)s")
+    args = parser.parse_args(argv)
+    calib = load_calib().as_dict()
+    mag_axes, grav_axes = calib["mag"]["axes"], calib["grav"]["axes"]
+    datasets = {f"synthetic-{count}": synthetic(count) for count in SYNTHETIC_SIZES}
+    for fname in args.files:
+        datasets[path.basename(fname)] = recorded(fname)
+    results = {}
+    for name, (mag, grav) in datasets.items():
+        results[name] = bench_dataset(mag, grav, mag_axes, grav_axes)
+        for stage, result in results[name].items():
+            print(f"{name:16} {stage:12} {result['time'] * 1000:8.2f} ms {result['peak'] / 1024:8.1f} kB")
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except OSError:
+        print(f"No baseline at {args.baseline}, run with --update to create one")
+        return 1
+    problems = compare(baseline, results, args.time_threshold, args.memory_threshold)
+    for problem in problems:
+        print("REGRESSION", problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for the shot history queues. Run from the firmware directory with::
+
+    python tests/bench_discarding_queue.py
+"""
+import sys
+import timeit
+import tracemalloc
+from collections import namedtuple
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from discarding_queue import DiscardingQueue, ArrayQueue  # noqa: E402
+
+Leg = namedtuple("Leg", ("azimuth", "inclination", "distance"))
+
+HISTORY = 500
+SHOTS = 5000
+
+
+class ListQueue:
+    """The original list based implementation, kept here for comparison"""
+
+    def __init__(self, max_len):
+        self.max_len = max_len
+        self.queue = []
+
+    def append(self, obj):
+        if len(self.queue) == self.max_len:
+            self.queue.pop(0)
+        self.queue.append(obj)
+
+    def __getitem__(self, i):
+        return self.queue[i]
+
+
+def fill(queue):
+    for i in range(SHOTS):
+        queue.append(Leg(i % 360, 0.5, i * 0.01))
+        _ = queue[-1]
+
+
+def bench(name, factory):
+    duration = min(timeit.repeat(lambda: fill(factory()), number=1, repeat=5))
+    tracemalloc.start()
+    queue = factory()
+    fill(queue)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:16} {duration / SHOTS * 1e6:7.2f} µs/shot {retained / 1024:8.1f} kB retained")
+
+
+def main():
+    print(f"{SHOTS} shots into a history of {HISTORY}")
+    bench("list pop(0)", lambda: ListQueue(HISTORY))
+    bench("DiscardingQueue", lambda: DiscardingQueue(max_len=HISTORY))
+    bench("ArrayQueue", lambda: ArrayQueue(max_len=HISTORY, factory=Leg))
+
+
+if __name__ == "__main__":
+    main()
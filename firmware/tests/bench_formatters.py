@@ -0,0 +1,105 @@
+"""
+Micro-benchmark for formatting the text shown for each shot. Run from the firmware directory with::
+
+    python tests/bench_formatters.py
+"""
+import sys
+import timeit
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from formatters import azimuth_formatter, inclination_formatter, distance_formatter  # noqa: E402
+
+SHOTS = 20000
+REDRAWS = 3
+"""Number of times each shot is drawn: when taken, and when scrolled back to"""
+
+
+class OldConfig:
+    """The original per-call formatting from Config, kept here for comparison"""
+    angles = 0
+    units = 0
+    low_precision = False
+
+    def get_azimuth_text(self, azimuth, decimals=None, with_unit=True):
+        if decimals is None:
+            decimals = 0 if self.low_precision else 1
+        if decimals > 0:
+            chars = decimals + 4
+        else:
+            chars = 3
+        azimuth = azimuth % 360
+        unit = ("°" if self.angles == 0 else "g") if with_unit else ""
+        azimuth = azimuth * (400 / 360.0) if self.angles == 1 else azimuth
+        return f"{azimuth:0{chars}.{decimals}f}{unit}"
+
+    def get_inclination_text(self, inclination, decimals=None, with_unit=True):
+        if decimals is None:
+            decimals = 0 if self.low_precision else 1
+        if decimals > 0:
+            chars = decimals + 4
+        else:
+            chars = 3
+        unit = ("°" if self.angles == 0 else "g") if with_unit else ""
+        inclination = inclination * (400 / 360.0) if self.angles == 1 else inclination
+        return f"{inclination:+0{chars}.{decimals}f}{unit}"
+
+    def get_distance_text(self, distance, decimals=None, with_unit=True):
+        if decimals is None:
+            decimals = 2 if self.low_precision else 3
+        unit = ("m" if self.units == 0 else "'") if with_unit else ""
+        distance = distance * 3.28084 if self.units == 1 else distance
+        return f"{distance:.{decimals}f}{unit}"
+
+
+class NewConfig:
+    """Formatters built once, as Config now does"""
+
+    def __init__(self):
+        self._formatters = {}
+
+    def _get(self, kind, decimals, with_unit):
+        key = (kind, decimals, with_unit)
+        formatter = self._formatters.get(key)
+        if formatter is None:
+            if kind is distance_formatter:
+                formatter = kind(3 if decimals is None else decimals, "m" if with_unit else "")
+            else:
+                formatter = kind(1 if decimals is None else decimals, "°" if with_unit else "")
+            self._formatters[key] = formatter
+        return formatter
+
+    def get_azimuth_text(self, azimuth, decimals=None, with_unit=True):
+        return self._get(azimuth_formatter, decimals, with_unit)(azimuth)
+
+    def get_inclination_text(self, inclination, decimals=None, with_unit=True):
+        return self._get(inclination_formatter, decimals, with_unit)(inclination)
+
+    def get_distance_text(self, distance, decimals=None, with_unit=True):
+        return self._get(distance_formatter, decimals, with_unit)(distance)
+
+
+def run(cfg):
+    for i in range(SHOTS):
+        azimuth, inclination, distance = (i * 0.37) % 360, (i * 0.11) % 180 - 90, i * 0.003
+        for _ in range(REDRAWS):
+            cfg.get_azimuth_text(azimuth)
+            cfg.get_inclination_text(inclination)
+            cfg.get_distance_text(distance)
+
+
+def bench(name, cfg):
+    duration = min(timeit.repeat(lambda: run(cfg), number=1, repeat=5))
+    print(f"{name:10} {duration / (SHOTS * REDRAWS) * 1e6:6.2f} us per shot drawn")
+    return duration
+
+
+def main():
+    old = bench("original", OldConfig())
+    new = bench("compiled", NewConfig())
+    print(f"speedup    {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Measure the time taken to capture a shot using simulated hardware, with the sensors read after the
+laser (sequential) or while waiting for the laser (overlapped), and the magnetometer bias each sees
+from the laser, which is only on while the sensors are read when overlapped. Run from the firmware
+directory with::
+
+    python tests/bench_shot_latency.py
+"""
+import asyncio
+import math
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from sampling import capture  # noqa: E402
+from simulated_hardware import SimulatedHardware  # noqa: E402
+
+REPEATS = 3
+
+TRUE_MAG = (20.0, -15.0, 40.0)
+LASER_MAG_BIAS = (0.4, -0.25, 0.1)
+"""Offset the laser adds to the magnetometer while it is on, in µT"""
+
+
+def bench(name, **kwargs):
+    durations = []
+    bias = 0.0
+    for _ in range(REPEATS):
+        devices = SimulatedHardware(mag=TRUE_MAG, laser_mag_bias=LASER_MAG_BIAS)
+        start = time.perf_counter()
+        shot = asyncio.run(capture(devices, **kwargs))
+        durations.append(time.perf_counter() - start)
+        bias = math.sqrt(sum((a - b) ** 2 for a, b in zip(shot.mag, TRUE_MAG)))
+    print(f"{name:28} {min(durations) * 1000:6.0f} ms  mag bias {bias:5.2f} µT")
+
+
+def main():
+    for samples in (1, 5):
+        bench(f"sequential, {samples} samples", samples=samples)
+        bench(f"overlapped, {samples} samples", samples=samples, guard=0.1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+A stand-in for `HardwareBase` that runs on the host, with per-device delays similar to the real
+SAP6. The laser runs as a coroutine (the real one waits on the UART), whereas the sensor reads block
+(the real ones are I2C transactions and, for the RM3100, a wait for the data ready pin).
+"""
+import asyncio
+import math
+import random
+import time
+
+LASER_MEASURE_TIME = 0.6
+LASER_COMMAND_TIME = 0.03
+RM3100_READ_TIME = 0.04  # three axes at cycle_count=2000
+IMU_READ_TIME = 0.002
+
+
+class SimulatedSensor:
+    """
+    A sensor with gaussian noise that occasionally gives a wildly wrong reading
+    """
+
+    def __init__(self, value, delay=0.0, noise=0.0, spike_rate=0.0, spike_size=0.0, seed=0):
+        self.value = value
+        self.delay = delay
+        self.noise = noise
+        self.spike_rate = spike_rate
+        self.spike_size = spike_size
+        self.random = random.Random(seed)
+        self.reads = 0
+        self.bias = None
+        """Called for an offset to add to each reading, if set"""
+
+    def read(self):
+        if self.delay:
+            time.sleep(self.delay)
+        self.reads += 1
+        value = [x + self.random.gauss(0, self.noise) for x in self.value]
+        if self.random.random() < self.spike_rate:
+            axis = self.random.randrange(3)
+            value[axis] += self.random.choice((-1, 1)) * self.spike_size
+        if self.bias is not None:
+            value = [x + b for x, b in zip(value, self.bias())]
+        return tuple(value)
+
+    def error(self, vector):
+        return math.sqrt(sum((a - b) ** 2 for a, b in zip(vector, self.value)))
+
+    @property
+    def magnetic(self):
+        return self.read()
+
+    @property
+    def acceleration(self):
+        return self.read()
+
+
+class SimulatedHardware:
+    def __init__(self, scale: float = 1.0, distance: float = 2500.0,
+                 mag=(20.0, -15.0, 40.0), grav=(0.0, 0.0, 9.81), laser_mag_bias=(0.0, 0.0, 0.0)):
+        self.scale = scale
+        self.distance = distance
+        self.magnetometer = SimulatedSensor(mag, RM3100_READ_TIME * scale)
+        # the magnetometer sees the current drawn by the laser while it is on
+        self.magnetometer.bias = lambda: laser_mag_bias if self.laser else (0.0, 0.0, 0.0)
+        self.accelerometer = SimulatedSensor(grav, IMU_READ_TIME * scale)
+        self.laser = True
+        self.laser_log = []
+
+    async def laser_on(self, value: bool):
+        await asyncio.sleep(LASER_COMMAND_TIME * self.scale)
+        self.laser = value
+        self.laser_log.append(value)
+
+    async def laser_measure(self) -> float:
+        await asyncio.sleep(LASER_MEASURE_TIME * self.scale)
+        return self.distance
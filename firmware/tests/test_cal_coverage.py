@@ -0,0 +1,139 @@
+import math
+from unittest import TestCase
+
+import numpy as np
+from mag_cal import Calibration
+
+import cal_coverage
+from cal_coverage import CoverageTracker
+from test_fused_cal import load_calib, raw_reading
+
+
+def shot(calib: Calibration, azimuth: float, inclination: float, roll: float, rng=None):
+    dip = np.radians(calib.dip_avg)
+    matrix = Calibration.angles_to_matrix(azimuth, inclination, roll)
+    mag = raw_reading(calib.mag, matrix.T @ np.array([0, np.cos(dip), -np.sin(dip)]))
+    grav = raw_reading(calib.grav, matrix.T @ np.array([0, 0, -1.0]))
+    if rng is not None:
+        # noise about the size of the spread in field strength on the test device
+        mag += rng.normal(size=3) * 0.05
+        grav += rng.normal(size=3) * 0.003
+    return mag, grav
+
+
+def random_shots(calib: Calibration, count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [shot(calib, rng.uniform(0, 360), rng.uniform(-85, 85), rng.uniform(-180, 180), rng)
+            for _ in range(count)]
+
+
+def make_tracker(calib: Calibration) -> CoverageTracker:
+    dct = calib.as_dict()
+    return CoverageTracker(dct["mag"]["axes"], dct["grav"]["axes"])
+
+
+class TestRegion(TestCase):
+    def test_axes(self):
+        for i, direction in enumerate(cal_coverage.REGIONS):
+            self.assertEqual(i, cal_coverage.region([x * 3 for x in direction]))
+
+    def test_nearest(self):
+        self.assertEqual(cal_coverage.REGIONS.index((0.0, 0.0, 1.0)), cal_coverage.region((0.1, -0.2, 5.0)))
+        c = 1 / math.sqrt(3)
+        self.assertEqual(cal_coverage.REGIONS.index((c, -c, c)), cal_coverage.region((1.0, -0.9, 1.1)))
+
+
+class TestCoverageTracker(TestCase):
+    def setUp(self):
+        self.calib = load_calib()
+
+    def test_flat_shots(self):
+        tracker = make_tracker(self.calib)
+        for azimuth in range(0, 360, 45):
+            tracker.add(*shot(self.calib, azimuth, 0, 0))
+        self.assertNotIn("flat", tracker.missing())
+        self.assertIn("upside down", tracker.missing())
+        self.assertIn("point up", tracker.missing())
+        self.assertEqual(8, tracker.count)
+        self.assertIsNone(tracker.accuracy)
+        self.assertFalse(tracker.complete)
+
+    def test_orientations(self):
+        tracker = make_tracker(self.calib)
+        expected = {
+            "flat": (0, 0), "upside down": (0, 180), "point up": (80, 0),
+            "point down": (-80, 0), "right side": (0, 90), "left side": (0, -90),
+        }
+        names = set(cal_coverage.ORIENTATION_NAMES)
+        for name, (inclination, roll) in expected.items():
+            tracker.add(*shot(self.calib, 30, inclination, roll))
+            names.remove(name)
+            self.assertEqual(names, set(tracker.missing()))
+
+    def test_coverage_grows(self):
+        tracker = make_tracker(self.calib)
+        last = 0
+        for mag, grav in random_shots(self.calib, 40):
+            tracker.add(mag, grav)
+            self.assertGreaterEqual(tracker.coverage, last)
+            last = tracker.coverage
+        self.assertGreater(tracker.coverage, cal_coverage.TARGET_COVERAGE)
+
+    def test_accuracy_estimate(self):
+        tracker = make_tracker(self.calib)
+        mags, gravs = zip(*random_shots(self.calib, 40))
+        for mag, grav in zip(mags, gravs):
+            tracker.add(mag, grav)
+        dct = self.calib.as_dict()
+        calib = Calibration(mag_axes=dct["mag"]["axes"], grav_axes=dct["grav"]["axes"])
+        uniformity = calib.fit_ellipsoid(np.array(mags), np.array(gravs))
+        expected = math.degrees(math.hypot(*uniformity))
+        self.assertAlmostEqual(expected, tracker.accuracy, delta=expected * 0.05)
+        self.assertLess(tracker.accuracy, cal_coverage.TARGET_ACCURACY)
+
+    def test_runs(self):
+        tracker = make_tracker(self.calib)
+        rng = np.random.default_rng(3)
+        for azimuth, inclination in ((20, 10), (200, -30)):
+            for roll in range(-180, 180, 60):
+                tracker.add(*shot(self.calib, azimuth, inclination, roll, rng))
+        self.assertEqual(2, tracker.runs)
+        for mag, grav in random_shots(self.calib, 8, seed=4):
+            tracker.add(mag, grav)
+        self.assertEqual(2, tracker.runs)
+
+    def test_complete(self):
+        tracker = make_tracker(self.calib)
+        rng = np.random.default_rng(5)
+        for mag, grav in random_shots(self.calib, 30, seed=6):
+            tracker.add(mag, grav)
+        # plenty of coverage, but no runs yet
+        self.assertFalse(tracker.complete)
+        self.assertIn("Runs: 0", tracker.summary())
+        for azimuth, inclination in ((90, 0), (300, 40)):
+            for roll in range(0, 360, 90):
+                self.assertFalse(tracker.complete)
+                tracker.add(*shot(self.calib, azimuth, inclination, roll, rng))
+        self.assertTrue(tracker.complete)
+
+    def test_summary(self):
+        tracker = make_tracker(self.calib)
+        self.assertIn("Shots: 0", tracker.summary())
+        self.assertIn("--", tracker.summary())
+        tracker.add(*shot(self.calib, 0, 0, 0))
+        self.assertIn("Try: left side", tracker.summary())
+
+    def test_summary_fits_display(self):
+        tracker = make_tracker(self.calib)
+        tracker.count = 999
+        tracker.runs = 99
+        tracker.accuracy = 123.456
+        widest = ""
+        for seen in range(1 << len(cal_coverage.ORIENTATION_NAMES)):
+            for i in range(len(cal_coverage.ORIENTATION_NAMES)):
+                tracker.grav_regions[i] = (seen >> i) & 1
+            lines = tracker.summary().split("\r\n")
+            widest = max(lines + [widest], key=len)
+            if len(tracker.missing()) > 0:
+                self.assertTrue(lines[-1].startswith("Try: " + tracker.missing()[0]))
+        self.assertLessEqual(len(widest), cal_coverage.DISPLAY_COLUMNS, widest)
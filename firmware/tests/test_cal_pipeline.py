@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+import cal_pipeline
+import calibrate_roll
+import mag_cal
+from cal_pipeline import CalibrationPipeline, STAGES
+from test_cal_coverage import random_shots, shot
+from test_fused_cal import load_calib
+
+
+class FailingPipeline(CalibrationPipeline):
+    """Runs out of memory at one stage, as the device might"""
+
+    def __init__(self, *args, fail_at: str = "", **kwargs):
+        self.fail_at = fail_at
+        self.stages_run = []
+        super().__init__(*args, **kwargs)
+
+    def run_stage(self):
+        name = STAGES[self.stage][0]
+        if name == self.fail_at:
+            raise MemoryError(f"Failed at {name}")
+        self.stages_run.append(name)
+        super().run_stage()
+
+
+def calibration_shots():
+    calib = load_calib()
+    rng = np.random.default_rng(7)
+    shots = random_shots(calib, 8, seed=8)
+    for azimuth, inclination in ((40, 5), (130, -20)):
+        shots.extend(shot(calib, azimuth, inclination, roll, rng) for roll in range(0, 360, 45))
+    mag, grav = zip(*shots)
+    dct = calib.as_dict()
+    return np.array(mag), np.array(grav), dct["mag"]["axes"], dct["grav"]["axes"]
+
+
+class TestCalibrationPipeline(TestCase):
+    def setUp(self):
+        self.mag, self.grav, self.mag_axes, self.grav_axes = calibration_shots()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.progress = os.path.join(self.tmp.name, "progress.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def pipeline(self, cls=CalibrationPipeline, **kwargs) -> CalibrationPipeline:
+        return cls(self.mag, self.grav, self.mag_axes, self.grav_axes, progress_file=self.progress, **kwargs)
+
+    def assert_same_calibration(self, expected: dict, actual: dict):
+        for name in ("mag", "grav"):
+            np.testing.assert_allclose(expected[name]["transform"], actual[name]["transform"], rtol=1e-9)
+            np.testing.assert_allclose(expected[name]["centre"], actual[name]["centre"], rtol=1e-9)
+            np.testing.assert_allclose(expected[name]["rbfs"], actual[name]["rbfs"], rtol=1e-9, atol=1e-12)
+            self.assertAlmostEqual(expected[name]["field_avg"], actual[name]["field_avg"])
+        self.assertAlmostEqual(expected["dip_avg"], actual["dip_avg"])
+
+    def test_full_run(self):
+        pipeline = self.pipeline()
+        self.assertFalse(pipeline.resumed)
+        accuracy = pipeline.run()
+        self.assertTrue(pipeline.done)
+        self.assertEqual(2, len(pipeline.runs))
+        self.assertLess(accuracy, 0.5)
+        original = load_calib()
+        np.testing.assert_allclose(original.mag.centre, pipeline.cal.mag.centre, atol=0.05)
+        self.assertAlmostEqual(original.dip_avg, pipeline.cal.dip_avg, delta=0.5)
+
+    def test_resume_after_failure(self):
+        expected = self.pipeline().run()
+        expected_calib = json.loads(open(self.progress).read())["calib"]
+        os.remove(self.progress)
+        for i, (name, _) in enumerate(STAGES):
+            with self.subTest(stage=name):
+                cal_pipeline.remove_progress(self.progress)
+                first = self.pipeline(FailingPipeline, fail_at=name)
+                with self.assertRaises(MemoryError):
+                    first.run()
+                self.assertEqual([stage for stage, _ in STAGES[:i]], first.stages_run)
+                # as after the device has been reset
+                second = self.pipeline(FailingPipeline)
+                self.assertEqual(i, second.stage)
+                self.assertEqual(i > 0, second.resumed)
+                accuracy = second.run()
+                self.assertEqual([stage for stage, _ in STAGES[i:]], second.stages_run)
+                self.assertAlmostEqual(expected, accuracy)
+                self.assert_same_calibration(expected_calib, second.cal.as_dict())
+
+    def test_finished_progress(self):
+        expected = self.pipeline().run()
+        pipeline = self.pipeline(FailingPipeline)
+        self.assertTrue(pipeline.done)
+        self.assertEqual(expected, pipeline.run())
+        self.assertEqual([], pipeline.stages_run)
+
+    def test_different_readings(self):
+        first = self.pipeline(FailingPipeline, fail_at="roll")
+        with self.assertRaises(MemoryError):
+            first.run()
+        self.mag = self.mag * 1.01
+        second = self.pipeline()
+        self.assertFalse(second.resumed)
+        self.assertEqual(0, second.stage)
+        self.grav_axes = "+X+Y+Z"
+        self.mag = self.mag / 1.01
+        self.assertFalse(self.pipeline().resumed)
+
+    def test_damaged_progress(self):
+        with open(self.progress, "w") as f:
+            f.write('{"fingerprint": [24, ')
+        pipeline = self.pipeline()
+        self.assertFalse(pipeline.resumed)
+        pipeline.run()
+        self.assertTrue(pipeline.done)
+
+    def test_progress_not_writable(self):
+        self.progress = os.path.join(self.tmp.name, "missing", "progress.json")
+        pipeline = self.pipeline()
+        self.assertLess(pipeline.run(), 0.5)
+        self.assertFalse(os.path.exists(self.progress))
+
+    def test_no_runs(self):
+        mag, grav = zip(*random_shots(load_calib(), 24, seed=9))
+        pipeline = CalibrationPipeline(np.array(mag), np.array(grav), self.mag_axes, self.grav_axes,
+                                       progress_file=self.progress)
+        pipeline.run_stage()
+        with self.assertRaises(ValueError):
+            pipeline.run_stage()
+        self.assertEqual(1, pipeline.stage)
+
+    def run_to(self, name: str) -> CalibrationPipeline:
+        pipeline = self.pipeline()
+        while STAGES[pipeline.stage][0] != name:
+            pipeline.run_stage()
+        return pipeline
+
+    def test_runs_match_mag_cal(self):
+        pipeline = self.run_to("runs")
+        expected = pipeline.cal.find_similar_shots(self.mag, self.grav)
+        pipeline.run_stage()
+        self.assertEqual(expected, pipeline.runs)
+
+    def test_non_linear_matches_mag_cal(self):
+        pipeline = self.run_to("non_linear")
+        expected = mag_cal.Calibration.from_dict(pipeline.cal.as_dict())
+        expected.fit_non_linear_quick(pipeline._paired_data())
+        pipeline.run_stage()
+        self.assert_same_calibration(expected.as_dict(), pipeline.cal.as_dict())
+
+    def test_runs_by_session_match(self):
+        extra = [shot(load_calib(), 130, -20, roll, np.random.default_rng(3)) for roll in range(0, 360, 72)]
+        self.mag = np.vstack((self.mag, [m for m, _ in extra]))
+        self.grav = np.vstack((self.grav, [g for _, g in extra]))
+        breaks = [len(self.mag) - len(extra), len(self.mag)]
+        expected = self.run_to("runs")
+        expected.breaks = breaks
+        expected.run_stage()
+        os.remove(self.progress)
+        pipeline = self.run_to("runs")
+        pipeline.breaks = breaks
+        # the search used if mag_cal stops providing its check for a run
+        for _ in pipeline._runs_by_session():
+            pass
+        self.assertEqual(expected.runs, pipeline.runs)
+        self.assertEqual(3, len(pipeline.runs))
+
+    def test_matches_mag_cal_calibration(self):
+        # the same stages as the pipeline, using only mag_cal's own methods
+        expected = mag_cal.Calibration(self.mag_axes, self.grav_axes)
+        expected.fit_ellipsoid(self.mag, self.grav)
+        runs = expected.find_similar_shots(self.mag, self.grav, cal_pipeline.RUN_PRECISION, cal_pipeline.MIN_RUN)
+        paired = [(self.mag[a:b], self.grav[a:b]) for a, b in runs]
+        expected.fit_to_axis(paired)
+        calibrate_roll.align_sensor_roll(expected, self.mag, self.grav)
+        expected.fit_non_linear_quick(paired, cal_pipeline.NON_LINEAR_PARAMS)
+        expected.set_field_characteristics(self.mag, self.grav)
+        pipeline = self.pipeline()
+        accuracy = pipeline.run()
+        self.assertEqual(runs, pipeline.runs)
+        self.assertAlmostEqual(expected.accuracy(paired), accuracy, places=6)
+        actual = pipeline.cal.as_dict()
+        for name, dct in expected.as_dict().items():
+            if isinstance(dct, dict):
+                np.testing.assert_allclose(dct["transform"], actual[name]["transform"], rtol=1e-6, atol=1e-12)
+                np.testing.assert_allclose(dct["centre"], actual[name]["centre"], rtol=1e-6, atol=1e-9)
+                np.testing.assert_allclose(dct["rbfs"], actual[name]["rbfs"], rtol=1e-6, atol=1e-9)
+
+    def test_steps_report_progress(self):
+        pipeline = self.pipeline()
+        for name, _ in STAGES:
+            with self.subTest(stage=name):
+                fractions = list(pipeline.steps())
+                self.assertEqual(sorted(fractions), fractions)
+                self.assertTrue(all(0 < fraction <= 1 for fraction in fractions))
+                if name in ("ellipsoid", "roll", "non_linear"):
+                    self.assertAlmostEqual(1.0, fractions[-1])
+        self.assertTrue(pipeline.done)
+
+    def test_run_async(self):
+        ticks = []
+        reports = []
+
+        async def ticker():
+            while True:
+                ticks.append(len(reports))
+                await asyncio.sleep(0)
+
+        async def main():
+            task = asyncio.create_task(ticker())
+            result = await self.pipeline().run_async(lambda text, fraction: reports.append((text, fraction)),
+                                                     slice_ms=0, report_ms=0)
+            task.cancel()
+            return result
+
+        expected = self.pipeline().run()
+        os.remove(self.progress)
+        self.assertAlmostEqual(expected, asyncio.run(main()))
+        # the other task ran many times while the stages were running, not just between them
+        self.assertGreater(len(set(ticks)), 2 * len(STAGES))
+        self.assertEqual([text for _, text in STAGES], [text for text, fraction in reports if fraction == 0.0])
+        for description, _ in STAGES:
+            fractions = [fraction for text, fraction in reports if text == description]
+            self.assertEqual(sorted(fractions), fractions)
@@ -0,0 +1,114 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+import cal_store
+from cal_pipeline import CalibrationPipeline
+from test_cal_coverage import random_shots, shot
+from test_cal_pipeline import calibration_shots
+from test_fused_cal import load_calib
+
+
+class TestCalStore(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmp.name, "sessions.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def session(self, size: int, seed: int):
+        mag, grav = zip(*random_shots(load_calib(), size, seed=seed))
+        return [m.tolist() for m in mag], [g.tolist() for g in grav]
+
+    def test_empty(self):
+        self.assertEqual([], cal_store.load_sessions(self.store))
+        self.assertEqual(([], [], [], []), cal_store.merge([]))
+
+    def test_append_and_load(self):
+        first = self.session(5, 1)
+        second = self.session(3, 2)
+        self.assertEqual(1, cal_store.append_session(*first, fname=self.store))
+        self.assertEqual(2, cal_store.append_session(*second, fname=self.store))
+        sessions = cal_store.load_sessions(self.store)
+        self.assertEqual([1, 2], [session["id"] for session in sessions])
+        self.assertEqual(list(first), [sessions[0]["mag"], sessions[0]["grav"]])
+        self.assertEqual(list(second), [sessions[1]["mag"], sessions[1]["grav"]])
+        self.assertEqual([2], [session["id"] for session in cal_store.load_sessions(self.store, limit=1)])
+
+    def test_unfinished_session(self):
+        cal_store.append_session(*self.session(5, 1), fname=self.store)
+        with open(self.store, "a") as f:
+            f.write('\n{"id": 2, "time": 0, "mag": [[1.0, ')
+        cal_store.append_session(*self.session(3, 2), fname=self.store)
+        sessions = cal_store.load_sessions(self.store)
+        self.assertEqual([1, 2], [session["id"] for session in sessions])
+        self.assertEqual(3, len(sessions[1]["mag"]))
+
+    def test_oldest_dropped(self):
+        for i in range(cal_store.MAX_SESSIONS + 3):
+            cal_store.append_session(*self.session(2, i), fname=self.store)
+        sessions = cal_store.load_sessions(self.store)
+        self.assertEqual(list(range(4, cal_store.MAX_SESSIONS + 4)), [session["id"] for session in sessions])
+
+    def test_unsaved_session_is_newest(self):
+        for i in range(cal_store.MERGE_SESSIONS + 1):
+            cal_store.append_session(*self.session(2, i), fname=self.store)
+        mag, grav = self.session(3, 99)
+        sessions = cal_store.recent_sessions({"mag": mag, "grav": grav}, self.store)
+        self.assertEqual(cal_store.MERGE_SESSIONS, len(sessions))
+        self.assertEqual(mag, sessions[-1]["mag"])
+        merged_mag, _, weights, _ = cal_store.merge(sessions)
+        self.assertEqual(mag, merged_mag[:3])
+        self.assertEqual([1.0] * 3, weights[:3])
+        self.assertEqual(cal_store.load_sessions(self.store, cal_store.MERGE_SESSIONS),
+                         cal_store.recent_sessions(fname=self.store))
+
+    def test_merge(self):
+        sessions = [{"mag": [[i, 0, 0]] * size, "grav": [[0, 0, i]] * size}
+                    for i, size in enumerate((50, 30, 24, 6))]
+        mag, grav, weights, breaks = cal_store.merge(sessions, decay=0.5, max_shots=50)
+        self.assertEqual([6, 30], breaks)
+        self.assertEqual([[3, 0, 0]] * 6 + [[2, 0, 0]] * 24, mag)
+        self.assertEqual([[0, 0, 3]] * 6 + [[0, 0, 2]] * 24, grav)
+        self.assertEqual([1.0] * 6 + [0.5] * 24, weights)
+        # the newest session is always used
+        self.assertEqual([50], cal_store.merge(sessions[:1], max_shots=10)[3])
+
+    def test_top_up(self):
+        calib = load_calib()
+        rng = np.random.default_rng(4)
+        mag, grav, mag_axes, grav_axes = calibration_shots()
+        cal_store.append_session(mag, grav, fname=self.store)
+        # a few shots including one run
+        top_up = random_shots(calib, 2, seed=5)
+        top_up.extend(shot(calib, 250, 10, roll, rng) for roll in range(0, 360, 60))
+        cal_store.append_session(*zip(*top_up), fname=self.store)
+        mags, gravs, weights, breaks = cal_store.merge(cal_store.load_sessions(self.store))
+        self.assertEqual([8, 8 + len(mag)], breaks)
+        pipeline = CalibrationPipeline(np.array(mags), np.array(gravs), mag_axes, grav_axes, weights=weights,
+                                       breaks=breaks, progress_file=os.path.join(self.tmp.name, "progress.json"))
+        self.assertLess(pipeline.run(), 0.5)
+        self.assertEqual([[2, 8], [16, 24], [24, 32]], pipeline.runs)
+
+    def test_runs_stop_at_breaks(self):
+        calib = load_calib()
+        rng = np.random.default_rng(6)
+        mag, grav, mag_axes, grav_axes = calibration_shots()
+        # the last shots before the break point the same way as the first after it
+        extra = [shot(calib, 130, -20, roll, rng) for roll in (10, 20, 30)]
+        mags = np.concatenate((mag, [m for m, _ in extra]))
+        gravs = np.concatenate((grav, [g for _, g in extra]))
+        progress = os.path.join(self.tmp.name, "progress.json")
+        joined = CalibrationPipeline(mags, gravs, mag_axes, grav_axes, progress_file=progress)
+        joined.run_stage()
+        joined.run_stage()
+        self.assertEqual([16, len(mags)], joined.runs[-1])
+        os.remove(progress)
+        split = CalibrationPipeline(mags, gravs, mag_axes, grav_axes, breaks=[len(mag), len(mags)],
+                                    progress_file=progress)
+        split.run_stage()
+        split.run_stage()
+        self.assertEqual([[8, 16], [16, 24]], split.runs)
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+import numpy as np
+
+import calibrate_roll
+from calibrate_roll import RollFit
+from test_cal_coverage import random_shots
+from test_fused_cal import load_calib
+
+
+class TestRollFit(TestCase):
+    def setUp(self):
+        self.calib = load_calib()
+        mag, grav = zip(*random_shots(self.calib, 60, seed=3))
+        self.mag = self.calib.mag.apply(np.array(mag))
+        self.grav = self.calib.grav.apply(np.array(grav))
+
+    def rolled(self, axis: int, angle: float) -> np.ndarray:
+        """Magnetic readings with a small roll between the sensors, as the axis fit can leave"""
+        rot = calibrate_roll.rot3Dsc(np.sin(np.radians(angle)), np.cos(np.radians(angle)), axis)
+        return self.mag @ rot.T
+
+    def test_matches_calib_fit_rotM_cstdip(self):
+        for axis in (0, 1):
+            for angle in (-3, 0.5, 4):
+                with self.subTest(axis=axis, angle=angle):
+                    mag = self.rolled(axis, angle)
+                    expected = calibrate_roll.calib_fit_rotM_cstdip(mag, self.grav, axis, False)
+                    fit = RollFit(axis)
+                    for m, g in zip(mag, self.grav):
+                        fit.add(m, g)
+                    fit.solve()
+                    np.testing.assert_allclose(expected, fit.rotation(), atol=1e-12)
+
+    def test_add_all_matches_add(self):
+        mag = self.rolled(1, 2)
+        one_at_a_time = RollFit(1)
+        for m, g in zip(mag, self.grav):
+            one_at_a_time.add(m, g)
+        batch = RollFit(1)
+        batch.add_all(mag, self.grav)
+        for name in ("count", "w", "p", "q", "ww", "pp", "qq", "pq", "wp", "wq"):
+            self.assertAlmostEqual(getattr(one_at_a_time, name), getattr(batch, name), places=9)
+
+    def test_removes_roll(self):
+        fit = RollFit(1)
+        fit.add_all(self.rolled(1, 3), self.grav)
+        before = fit.residual()
+        fit.solve()
+        self.assertLess(fit.residual(), before / 5)
+        dips = np.sum((self.rolled(1, 3) @ fit.rotation().T) * self.grav, axis=1)
+        self.assertAlmostEqual(np.std(dips), fit.residual(), places=6)
+
+    def test_same_direction_as_calib_fit_rotM_cstdip(self):
+        # rotations about z go the wrong way in calib_fit_rotM_cstdip, and so here
+        mag = self.rolled(2, 3)
+        with self.assertRaises(ValueError):
+            calibrate_roll.calib_fit_rotM_cstdip(mag, self.grav, 2, False)
+        fit = RollFit(2)
+        fit.add_all(mag, self.grav)
+        with self.assertRaises(ValueError):
+            fit.solve()
+
+    def test_fit_roll_axes(self):
+        fits = calibrate_roll.fit_roll_axes(self.rolled(1, 3), self.grav, axes=(0, 1))
+        self.assertEqual([0, 1], [fit.axis for fit in fits])
+        self.assertLess(fits[1].residual(), fits[0].residual())
+
+    def test_no_readings(self):
+        with self.assertRaises(ValueError):
+            RollFit(1).solve()
+
+    def test_align_sensor_roll(self):
+        raw_mag, raw_grav = zip(*random_shots(self.calib, 60, seed=3))
+        expected = calibrate_roll.calib_fit_rotM_cstdip(self.mag, self.grav, 1, False)
+        transform = self.calib.mag.transform
+        calibrate_roll.align_sensor_roll(self.calib, np.array(raw_mag), np.array(raw_grav))
+        np.testing.assert_allclose(transform @ expected.T, self.calib.mag.transform, atol=1e-12)
@@ -1,6 +1,7 @@
+from collections import namedtuple
 from unittest import TestCase
 
-from discarding_queue import DiscardingQueue
+from discarding_queue import DiscardingQueue, ArrayQueue
 
 
 class TestDiscardingQueue(TestCase):
@@ -34,3 +35,118 @@ class TestDiscardingQueue(TestCase):
         q = DiscardingQueue((1, 2, 3), max_len=4)
         self.assertEqual(2, q[1])
         self.assertEqual(3, len(q))
+
+    def test_create_empty(self):
+        q = DiscardingQueue(max_len=3)
+        self.assertEqual(0, len(q))
+        self.assertListEqual([], list(q))
+
+    def test_wraps_around(self):
+        q = DiscardingQueue(max_len=3)
+        for i in range(10):
+            q.append(i)
+        self.assertEqual(3, len(q))
+        self.assertListEqual([7, 8, 9], list(q))
+
+    def test_negative_index(self):
+        q = DiscardingQueue(max_len=3)
+        for i in range(5):
+            q.append(i)
+        self.assertEqual(4, q[-1])
+        self.assertEqual(3, q[-2])
+        self.assertEqual(2, q[-3])
+        self.assertEqual(2, q[0])
+
+    def test_index_out_of_range(self):
+        q = DiscardingQueue((1, 2), max_len=3)
+        with self.assertRaises(IndexError):
+            _ = q[2]
+        with self.assertRaises(IndexError):
+            _ = q[-3]
+
+    def test_pop_after_wrap(self):
+        q = DiscardingQueue(max_len=3)
+        for i in range(5):
+            q.append(i)
+        self.assertEqual(2, q.pop())
+        q.append(5)
+        self.assertListEqual([3, 4, 5], list(q))
+
+    def test_pop_empty(self):
+        q = DiscardingQueue(max_len=3)
+        with self.assertRaises(IndexError):
+            q.pop()
+
+    def test_find_index(self):
+        q = DiscardingQueue(max_len=3)
+        for i in range(5):
+            q.append(i)
+        self.assertEqual(1, q.index(3))
+        with self.assertRaises(ValueError):
+            q.index(1)
+
+
+Leg = namedtuple("Leg", ("azimuth", "inclination", "distance"))
+
+
+class TestArrayQueue(TestCase):
+    def test_create(self):
+        q = ArrayQueue([Leg(1, 2, 3)], max_len=5, factory=Leg)
+        self.assertEqual(1, len(q))
+        self.assertEqual(Leg(1, 2, 3), q[0])
+
+    def test_returns_records(self):
+        q = ArrayQueue(max_len=5, factory=Leg)
+        q.append(Leg(123.5, -12.25, 4.5))
+        leg = q[-1]
+        self.assertIsInstance(leg, Leg)
+        self.assertEqual(123.5, leg.azimuth)
+        self.assertEqual(-12.25, leg.inclination)
+        self.assertEqual(4.5, leg.distance)
+
+    def test_default_factory(self):
+        q = ArrayQueue(max_len=3)
+        q.append((1, 2, 3))
+        q.append((4, 5, 6))
+        self.assertEqual((1, 2, 3), q[0])
+        self.assertEqual([(1, 2, 3), (4, 5, 6)], list(q))
+        self.assertEqual((1, 2, 3), q.pop())
+
+    def test_single_precision(self):
+        q = ArrayQueue(max_len=5, factory=Leg)
+        q.append(Leg(359.95, -89.95, 123.456))
+        leg = q[-1]
+        self.assertAlmostEqual(359.95, leg.azimuth, places=3)
+        self.assertAlmostEqual(-89.95, leg.inclination, places=3)
+        self.assertAlmostEqual(123.456, leg.distance, places=3)
+
+    def test_wraps_around(self):
+        q = ArrayQueue(max_len=3, factory=Leg)
+        for i in range(10):
+            q.append(Leg(i, -i, i * 2))
+        self.assertEqual(3, len(q))
+        self.assertListEqual([7, 8, 9], [leg.azimuth for leg in q])
+        self.assertEqual(Leg(9, -9, 18), q[-1])
+        self.assertEqual(Leg(7, -7, 14), q[-3])
+
+    def test_field(self):
+        q = ArrayQueue(max_len=3, factory=Leg)
+        for i in range(4):
+            q.append(Leg(i, -i, i * 2))
+        self.assertEqual(6, q.field(-1, 2))
+        self.assertEqual(-1, q.field(0, 1))
+
+    def test_pop(self):
+        q = ArrayQueue(max_len=3, factory=Leg)
+        for i in range(4):
+            q.append(Leg(i, -i, i * 2))
+        self.assertEqual(Leg(1, -1, 2), q.pop())
+        self.assertEqual(2, len(q))
+
+    def test_large_history(self):
+        q = ArrayQueue(max_len=500, factory=Leg)
+        for i in range(1200):
+            q.append(Leg(i % 360, 0, i))
+        self.assertEqual(500, len(q))
+        self.assertEqual(700, q[0].distance)
+        self.assertEqual(1199, q[-1].distance)
@@ -0,0 +1,92 @@
+import asyncio
+from unittest import TestCase
+
+from display_refresh import RefreshScheduler
+from virtual_clock import VirtualClock
+
+
+class FakeDisplay:
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.times = []
+
+    def refresh(self):
+        self.times.append(self.clock.monotonic_ns())
+
+
+class TestRefreshScheduler(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.display = FakeDisplay(self.clock)
+        self.scheduler = RefreshScheduler(self.display.refresh, frame_ms=50,
+                                          clock=self.clock.monotonic_ns, sleep=self.clock.sleep)
+
+    def run_with_scheduler(self, coro_func):
+        async def main():
+            task = asyncio.create_task(self.scheduler.run())
+            await asyncio.sleep(0)
+            try:
+                await coro_func()
+            finally:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        self.clock.run(main)
+
+    def test_refreshes_straight_away_when_not_running(self):
+        self.scheduler.request()
+        self.assertEqual(1, len(self.display.times))
+        self.assertFalse(self.scheduler.dirty)
+
+    def test_coalesces_requests(self):
+        async def busy():
+            for _ in range(3):
+                # several tasks updating at once
+                for _ in range(5):
+                    self.scheduler.request()
+                await self.clock.sleep(0.01)
+            await self.clock.sleep(0.12)
+
+        self.run_with_scheduler(busy)
+        self.assertEqual([0, 50000000], self.display.times)
+
+    def test_frame_budget(self):
+        async def steady():
+            for _ in range(30):
+                self.scheduler.request()
+                await self.clock.sleep(0.005)
+            await self.clock.sleep(0.06)
+
+        self.run_with_scheduler(steady)
+        gaps = [b - a for a, b in zip(self.display.times, self.display.times[1:])]
+        # requests for 0.15s, so a refresh at the start and after each of three frames
+        self.assertEqual(4, len(self.display.times))
+        self.assertGreaterEqual(min(gaps), 50000000)
+        # the last request was not lost
+        self.assertFalse(self.scheduler.dirty)
+
+    def test_now_is_immediate(self):
+        async def shot():
+            self.scheduler.request()
+            await self.clock.sleep(0.06)
+            self.scheduler.request()
+            self.scheduler.now()
+            self.assertEqual(2, len(self.display.times))
+            await self.clock.sleep(0.1)
+
+        self.run_with_scheduler(shot)
+        # the pending request was covered by the immediate refresh
+        self.assertEqual(2, len(self.display.times))
+
+    def test_flush_when_stopped(self):
+        async def stop():
+            await self.clock.sleep(0.001)
+            self.scheduler.now()
+            self.scheduler.request()
+
+        self.run_with_scheduler(stop)
+        self.assertEqual(2, len(self.display.times))
+        self.assertFalse(self.scheduler.running)
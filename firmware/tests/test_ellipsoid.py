@@ -0,0 +1,104 @@
+from unittest import TestCase
+
+import numpy as np
+import scipy.linalg
+from mag_cal.sensor import Sensor
+
+from ellipsoid import EllipsoidAccumulator
+from test_fused_cal import load_calib, realistic_shots
+
+
+def batch_terms(data: np.ndarray) -> np.ndarray:
+    x, y, z = data[:, 0:1], data[:, 1:2], data[:, 2:3]
+    return np.concatenate((x * x, y * y, z * z, 2 * x * y, 2 * x * z, 2 * y * z, 2 * x, 2 * y, 2 * z), axis=1)
+
+
+def cholesky_lstsq(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Same method as utils.lstsq, which the firmware uses for Sensor.fit_ellipsoid"""
+    r = np.linalg.cholesky(a.T @ a)
+    return scipy.linalg.cho_solve((r, True), a.T @ b)
+
+
+class TestEllipsoidAccumulator(TestCase):
+    def setUp(self):
+        self.calib = load_calib()
+        mags, gravs = realistic_shots(self.calib, 60)
+        self.data = {"mag": np.array(mags), "grav": np.array(gravs)}
+        self.axes = {name: self.calib.as_dict()[name]["axes"] for name in ("mag", "grav")}
+
+    def accumulate(self, name: str) -> EllipsoidAccumulator:
+        acc = EllipsoidAccumulator(self.axes[name])
+        for reading in self.data[name].tolist():
+            acc.add(reading)
+        return acc
+
+    def test_normal_equations_match_batch(self):
+        for name in ("mag", "grav"):
+            with self.subTest(sensor=name):
+                acc = self.accumulate(name)
+                fixed = getattr(self.calib, name).axes.fix_axes(self.data[name])
+                a = batch_terms(fixed)
+                ata, atb = acc.normal_equations()
+                np.testing.assert_allclose(a.T @ a, ata, rtol=1e-12)
+                np.testing.assert_allclose(a.T @ np.ones(len(a)), atb, rtol=1e-12)
+                self.assertEqual(len(a), acc.count)
+
+    def test_coefficients_match_lstsq(self):
+        for name in ("mag", "grav"):
+            with self.subTest(sensor=name):
+                acc = self.accumulate(name)
+                a = batch_terms(getattr(self.calib, name).axes.fix_axes(self.data[name]))
+                b = np.ones(len(a))
+                np.testing.assert_allclose(cholesky_lstsq(a, b), acc.solve(), rtol=1e-8)
+                np.testing.assert_allclose(np.linalg.lstsq(a, b, rcond=None)[0], acc.solve(), rtol=1e-6)
+
+    def test_fit_matches_sensor(self):
+        for name in ("mag", "grav"):
+            with self.subTest(sensor=name):
+                axes = self.axes[name]
+                expected = Sensor(axes)
+                expected.fit_ellipsoid(self.data[name])
+                actual = Sensor(axes)
+                self.accumulate(name).fit(actual)
+                np.testing.assert_allclose(expected.centre, actual.centre, rtol=1e-6, atol=1e-9)
+                np.testing.assert_allclose(expected.transform, actual.transform, rtol=1e-6, atol=1e-9)
+                # and the fit recovers the calibration the shots were made with
+                original = getattr(self.calib, name)
+                np.testing.assert_allclose(original.centre, actual.centre, atol=0.05 * np.abs(original.centre).max())
+
+    def test_add_all(self):
+        one = self.accumulate("mag")
+        many = EllipsoidAccumulator(self.axes["mag"])
+        many.add_all(self.data["mag"].tolist())
+        self.assertEqual(one.ata, many.ata)
+        self.assertEqual(one.atb, many.atb)
+
+    def test_too_few_readings(self):
+        acc = EllipsoidAccumulator()
+        for reading in self.data["mag"][:8].tolist():
+            acc.add(reading)
+        with self.assertRaises(ValueError):
+            acc.solve()
+
+    def test_estimate_matches_sensor(self):
+        for name in ("mag", "grav"):
+            with self.subTest(sensor=name):
+                sensor = Sensor(self.axes[name])
+                uniformity = sensor.fit_ellipsoid(self.data[name])
+                centre, estimate = self.accumulate(name).estimate()
+                np.testing.assert_allclose(sensor.centre, centre, rtol=1e-6, atol=1e-9)
+                self.assertAlmostEqual(uniformity, estimate, delta=uniformity * 0.05)
+
+    def test_weights(self):
+        readings = self.data["mag"].tolist()
+        weighted = EllipsoidAccumulator(self.axes["mag"])
+        repeated = EllipsoidAccumulator(self.axes["mag"])
+        for i, reading in enumerate(readings):
+            weighted.add(reading, 2.0 if i < 10 else 1.0)
+            repeated.add(reading)
+            if i < 10:
+                repeated.add(reading)
+        np.testing.assert_allclose(repeated.normal_equations()[0], weighted.normal_equations()[0], rtol=1e-12)
+        np.testing.assert_allclose(repeated.solve(), weighted.solve(), rtol=1e-9)
+        self.assertEqual(len(readings), weighted.count)
+        np.testing.assert_allclose(repeated.estimate()[1], weighted.estimate()[1], rtol=1e-6)
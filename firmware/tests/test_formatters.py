@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from formatters import azimuth_formatter, inclination_formatter, distance_formatter
+
+
+class TestFormatters(TestCase):
+    def test_azimuth(self):
+        fmt = azimuth_formatter(1, "°")
+        self.assertEqual("005.0°", fmt(5))
+        self.assertEqual("359.9°", fmt(-0.1))
+        self.assertEqual("010.0°", fmt(370))
+
+    def test_azimuth_no_decimals(self):
+        self.assertEqual("005", azimuth_formatter(0)(5.2))
+
+    def test_azimuth_grads(self):
+        self.assertEqual("399.9g", azimuth_formatter(1, "g", 400 / 360)(-0.1))
+
+    def test_inclination(self):
+        fmt = inclination_formatter(1, "°")
+        self.assertEqual("+05.0°", fmt(5))
+        self.assertEqual("-45.5°", fmt(-45.5))
+        self.assertEqual("-05", inclination_formatter(0)(-5.2))
+
+    def test_distance(self):
+        self.assertEqual("1.234m", distance_formatter(3, "m")(1.2341))
+        self.assertEqual("3.28'", distance_formatter(2, "'", 3.28084)(1.0))
+
+    def test_repeated_value_reuses_text(self):
+        fmt = distance_formatter(3, "m")
+        first = fmt(1.5)
+        self.assertIs(first, fmt(1.5))
+        self.assertEqual("2.000m", fmt(2.0))
+        self.assertEqual("1.500m", fmt(1.5))
@@ -0,0 +1,104 @@
+import json
+import os
+from unittest import TestCase
+
+import numpy as np
+from mag_cal import Calibration, Strictness, MagneticAnomalyError, GravityAnomalyError, DipAnomalyError
+
+from fused_cal import FusedCalibration
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+
+ANOMALIES = (MagneticAnomalyError, GravityAnomalyError, DipAnomalyError)
+
+
+def load_calib(non_linear: bool = True) -> Calibration:
+    with open(CONFIG_FILE) as f:
+        dct = json.load(f)["calib"]
+    if not non_linear:
+        dct["mag"]["rbfs"] = []
+        dct["grav"]["rbfs"] = []
+    return Calibration.from_dict(dct)
+
+
+def raw_reading(sensor, direction: np.ndarray) -> np.ndarray:
+    """Raw reading that the (linear part of the) calibration turns into a field along direction"""
+    target = direction * sensor.field_avg * np.mean(np.diag(sensor.transform))
+    fixed = np.linalg.solve(sensor.transform.T, target) + sensor.centre
+    raw = np.zeros(3)
+    raw[sensor.axes.indices] = fixed * sensor.axes.polarities
+    return raw
+
+
+def realistic_shots(calib: Calibration, count: int, seed: int = 0):
+    """Raw readings in random orientations, with a little noise"""
+    rng = np.random.default_rng(seed)
+    dip = np.radians(calib.dip_avg)
+    mag_world = np.array([0, np.cos(dip), -np.sin(dip)])
+    grav_world = np.array([0, 0, -1.0])
+    mags, gravs = [], []
+    for _ in range(count):
+        matrix = Calibration.angles_to_matrix(rng.uniform(0, 360), rng.uniform(-85, 85), rng.uniform(-180, 180))
+        mags.append(raw_reading(calib.mag, matrix.T @ mag_world) + rng.normal(size=3) * 0.5)
+        gravs.append(raw_reading(calib.grav, matrix.T @ grav_world) + rng.normal(size=3) * 0.1)
+    return mags, gravs
+
+
+class TestFusedCalibration(TestCase):
+    def check_matches(self, calib: Calibration):
+        fused = FusedCalibration(calib.as_dict())
+        for mag, grav in zip(*realistic_shots(calib, 200)):
+            reading = fused.measure(mag, grav)
+            azimuth, inclination, roll = calib.get_angles(mag, grav)
+            mag_field, grav_field = calib.get_field_strengths(mag, grav)
+            self.assertAlmostEqual(0, (reading.azimuth - azimuth + 180) % 360 - 180, places=3)
+            self.assertAlmostEqual(inclination, reading.inclination, places=3)
+            self.assertAlmostEqual(0, (reading.roll - roll + 180) % 360 - 180, places=3)
+            self.assertAlmostEqual(calib.get_dips(mag, grav), reading.dip, places=3)
+            self.assertAlmostEqual(mag_field, reading.mag_field, places=3)
+            self.assertAlmostEqual(grav_field, reading.grav_field, places=3)
+
+    def test_matches_calibration(self):
+        self.check_matches(load_calib())
+
+    def test_matches_linear_calibration(self):
+        self.check_matches(load_calib(non_linear=False))
+
+    def test_readings_are_realistic(self):
+        calib = load_calib()
+        mags, gravs = realistic_shots(calib, 20)
+        for mag, grav in zip(mags, gravs):
+            calib.raise_if_anomaly(mag, grav, Strictness(mag=5.0, grav=3.0, dip=5.0))
+
+    def test_outside_lookup_table(self):
+        calib = load_calib()
+        fused = FusedCalibration(calib.as_dict())
+        mag = np.array([300.0, -250.0, 100.0])
+        grav = np.array([0.1, 0.2, 9.8])
+        np.testing.assert_allclose(calib.mag.apply(mag), fused.mag.apply(mag), rtol=1e-6)
+        np.testing.assert_allclose(calib.grav.apply(grav), fused.grav.apply(grav), rtol=1e-6)
+
+    def test_anomalies_match(self):
+        calib = load_calib()
+        fused = FusedCalibration(calib.as_dict())
+        strictness = Strictness(mag=2.0, grav=1.5, dip=3.0)
+        mags, gravs = realistic_shots(calib, 100, seed=1)
+        rng = np.random.default_rng(2)
+        counts = {}
+        for mag, grav in zip(mags, gravs):
+            # disturb some readings so that every kind of anomaly occurs
+            mag = mag * rng.choice((1.0, 1.05)) + rng.choice((0, 1)) * rng.normal(size=3) * 5
+            grav = grav * rng.choice((1.0, 1.05))
+            expected = None
+            try:
+                calib.raise_if_anomaly(mag, grav, strictness)
+            except ANOMALIES as exc:
+                expected = type(exc)
+            with self.subTest(mag=mag, grav=grav):
+                if expected is None:
+                    fused.raise_if_anomaly(fused.measure(mag, grav), strictness)
+                else:
+                    with self.assertRaises(expected):
+                        fused.raise_if_anomaly(fused.measure(mag, grav), strictness)
+            counts[expected] = counts.get(expected, 0) + 1
+        self.assertEqual({None, *ANOMALIES}, set(counts))
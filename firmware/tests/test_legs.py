@@ -0,0 +1,118 @@
+import random
+from unittest import TestCase
+
+import numpy as np
+import mag_cal
+
+from legs import direction, LegDetector
+
+
+class TestDirection(TestCase):
+    def test_matches_mag_cal(self):
+        rng = random.Random(0)
+        for _ in range(50):
+            azimuth = rng.uniform(0, 360)
+            inclination = rng.uniform(-90, 90)
+            expected = mag_cal.Calibration.angles_to_matrix(azimuth, inclination, 0)[:, 1]
+            np.testing.assert_allclose(expected, direction(azimuth, inclination), atol=1e-9)
+
+
+class TestLegDetector(TestCase):
+    def test_triple_shot(self):
+        legs = LegDetector()
+        self.assertFalse(legs.add(10, 5, 3.0))
+        self.assertFalse(legs.add(10.5, 5, 3.01))
+        self.assertTrue(legs.add(10.2, 5.3, 3.02))
+
+    def test_distance_differs(self):
+        legs = LegDetector()
+        legs.add(10, 5, 3.0)
+        legs.add(10, 5, 3.0)
+        self.assertFalse(legs.add(10, 5, 3.1))
+
+    def test_direction_differs(self):
+        legs = LegDetector()
+        legs.add(10, 5, 3.0)
+        legs.add(10, 5, 3.0)
+        self.assertFalse(legs.add(12, 5, 3.0))
+
+    def test_first_and_third_must_agree(self):
+        # each shot is within 1.7° of the next but the first and third are not
+        legs = LegDetector()
+        legs.add(10, 0, 3.0)
+        legs.add(11.2, 0, 3.0)
+        self.assertFalse(legs.add(12.4, 0, 3.0))
+
+    def test_wraps_at_north(self):
+        legs = LegDetector()
+        legs.add(359.5, 0, 3.0)
+        legs.add(0.3, 0, 3.0)
+        self.assertTrue(legs.add(0.0, 0, 3.0))
+
+    def test_splay_between_shots(self):
+        legs = LegDetector()
+        legs.add(10, 5, 3.0)
+        legs.add(90, 5, 1.0)
+        legs.add(10, 5, 3.0)
+        self.assertFalse(legs.add(10, 5, 3.0))
+
+    def test_three_of_four(self):
+        legs = LegDetector(shots=3, window=4)
+        legs.add(10, 5, 3.0)
+        legs.add(90, 5, 1.0)
+        legs.add(10, 5, 3.0)
+        self.assertTrue(legs.add(10, 5, 3.0))
+
+    def test_newest_must_be_in_group(self):
+        legs = LegDetector(shots=3, window=4)
+        legs.add(10, 5, 3.0)
+        legs.add(10, 5, 3.0)
+        self.assertTrue(legs.add(10, 5, 3.0))
+        self.assertFalse(legs.add(90, 5, 1.0))
+
+    def test_two_of_two(self):
+        legs = LegDetector(shots=2, window=2)
+        self.assertFalse(legs.add(10, 5, 3.0))
+        self.assertTrue(legs.add(10, 5, 3.0))
+
+    def test_matches_pairwise_comparison(self):
+        # compare against checking every group of shots directly
+        rng = random.Random(1)
+        for shots, window in ((3, 3), (3, 5), (4, 6)):
+            legs = LegDetector(shots, window)
+            history = []
+            for _ in range(300):
+                leg = (rng.choice((10, 10.5, 11)), 0, rng.choice((3.0, 3.02)))
+                history.append((direction(leg[0], leg[1]), leg[2]))
+                result = legs.add(*leg)
+                self.assertEqual(self.brute_force(history[-window:], shots), result)
+
+    @staticmethod
+    def brute_force(history, shots):
+        from itertools import combinations
+
+        def agree(a, b):
+            return (abs(a[1] - b[1]) <= 0.05 and
+                    sum((x - y) ** 2 for x, y in zip(a[0], b[0])) < 0.03 ** 2)
+
+        newest = history[-1]
+        for group in combinations(history[:-1], shots - 1):
+            group = group + (newest,)
+            if all(agree(a, b) for a, b in combinations(group, 2)):
+                return True
+        return False
+
+    def test_configure(self):
+        legs = LegDetector()
+        legs.add(10, 5, 3.0)
+        legs.add(10, 5, 3.0)
+        legs.configure(3, 3)
+        self.assertTrue(legs.add(10, 5, 3.0))
+        legs.configure(3, 4)
+        self.assertFalse(legs.add(10, 5, 3.0))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            LegDetector(shots=4, window=3)
+        with self.assertRaises(ValueError):
+            LegDetector(shots=1, window=3)
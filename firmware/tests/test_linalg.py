@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+import numpy as np
+
+import linalg
+from linalg import LeastSquares
+
+
+class TestLeastSquares(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.a = rng.normal(size=(60, 9))
+        self.b = rng.normal(size=(60, 3))
+
+    def expected(self, a, b):
+        return np.linalg.lstsq(a, b, rcond=None)[0]
+
+    def test_single_right_hand_side(self):
+        solver = LeastSquares(self.a)
+        self.assertEqual("cholesky", solver.method)
+        np.testing.assert_allclose(self.expected(self.a, self.b[:, 0]), solver.solve(self.b[:, 0]), atol=1e-12)
+
+    def test_several_right_hand_sides(self):
+        x = LeastSquares(self.a).solve(self.b)
+        self.assertEqual((9, 3), x.shape)
+        np.testing.assert_allclose(self.expected(self.a, self.b), x, atol=1e-12)
+
+    def test_ill_conditioned_uses_qr(self):
+        # two columns almost the same, so AᵀA loses half the significant figures
+        a = self.a.copy()
+        a[:, 1] = a[:, 0] + 1e-5 * a[:, 1]
+        solver = LeastSquares(a)
+        self.assertEqual("qr", solver.method)
+        np.testing.assert_allclose(self.expected(a, self.b), solver.solve(self.b), rtol=1e-7, atol=1e-7)
+
+    def test_rank_deficient(self):
+        a = self.a.copy()
+        a[:, 1] = a[:, 0] * 2
+        with self.assertRaises(ValueError):
+            LeastSquares(a)
+
+    def test_lstsq(self):
+        x, residuals = linalg.lstsq(self.a, self.b[:, 0])
+        self.assertIsNone(residuals)
+        np.testing.assert_allclose(self.expected(self.a, self.b[:, 0]), x, atol=1e-12)
+        x, _ = linalg.lstsq(self.a, self.b)
+        np.testing.assert_allclose(self.expected(self.a, self.b), x, atol=1e-12)
+
+    def test_lstsq_keeps_nothing(self):
+        linalg.lstsq(self.a, self.b[:, 0])
+        self.assertFalse([name for name, value in vars(linalg).items() if isinstance(value, LeastSquares)])
@@ -0,0 +1,119 @@
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+import tripfile
+from tools import reprocess
+from tools.convert_trip import load_calibration
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+
+
+def random_shots(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    # raw readings roughly the size the sensors on the test device produce
+    mag = rng.normal(size=(count, 3)) * 25
+    grav = rng.normal(size=(count, 3)) * 5
+    return mag, grav
+
+
+class TestProcess(TestCase):
+    def setUp(self):
+        self.calib = load_calibration(CONFIG_FILE)
+
+    def test_matches_calibration(self):
+        mag, grav = random_shots(50)
+        result = reprocess.process(self.calib, mag, grav)
+        for i in range(len(mag)):
+            azimuth, inclination, roll = self.calib.get_angles(mag[i], grav[i])
+            mag_field, grav_field = self.calib.get_field_strengths(mag[i], grav[i])
+            dip = self.calib.get_dips(mag[i], grav[i])
+            self.assertAlmostEqual(0.0, (result["azimuth"][i] - azimuth + 180) % 360 - 180, places=6)
+            self.assertAlmostEqual(inclination, result["inclination"][i], places=6)
+            self.assertAlmostEqual(roll, result["roll"][i], places=6)
+            self.assertAlmostEqual(dip, result["dip"][i], places=6)
+            self.assertAlmostEqual(mag_field, result["mag_field"][i], places=6)
+            self.assertAlmostEqual(grav_field, result["grav_field"][i], places=6)
+
+    def test_inputs_unchanged(self):
+        mag, grav = random_shots(5)
+        original = mag.copy()
+        reprocess.process(self.calib, mag, grav)
+        np.testing.assert_array_equal(original, mag)
+
+
+class TestFiles(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calib = load_calibration(CONFIG_FILE)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_json(self, name, mag, grav):
+        fname = os.path.join(self.tmp.name, name)
+        with open(fname, "w") as f:
+            json.dump({"mag": mag.tolist(), "grav": grav.tolist()}, f)
+        return fname
+
+    def write_trip(self, name, mag, grav):
+        fname = os.path.join(self.tmp.name, name)
+        with open(fname, "wb") as f:
+            f.write(tripfile.header())
+            for i, (m, g) in enumerate(zip(mag, grav)):
+                f.write(tripfile.pack(m, g, i + 0.5, 0, 0, 0))
+        return fname
+
+    def test_load_trip(self):
+        mag, grav = random_shots(10)
+        fname = self.write_trip("Trip00001.bin", mag, grav)
+        mag_loaded, grav_loaded, distance, saturated = reprocess.load_shots(fname)
+        np.testing.assert_allclose(mag, mag_loaded, atol=0.5 / tripfile.MAG_SCALE)
+        np.testing.assert_allclose(grav, grav_loaded, atol=0.0005)
+        np.testing.assert_allclose(np.arange(10) + 0.5, distance)
+        self.assertFalse(saturated.any())
+
+    def test_saturated_trip(self):
+        mag, grav = random_shots(3)
+        mag[1, 2] = -900.0
+        fname = self.write_trip("Trip00001.bin", mag, grav)
+        _, _, _, saturated = reprocess.load_shots(fname)
+        np.testing.assert_array_equal([False, True, False], saturated)
+        _, _, (result,) = next(reprocess.reprocess([fname], [self.calib], jobs=1))
+        np.testing.assert_array_equal([False, True, False], np.isnan(result["azimuth"]))
+        out = os.path.join(self.tmp.name, "out.csv")
+        reprocess.main([fname, "-c", CONFIG_FILE, "-o", out])
+        with open(out) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines[2].endswith("1.500,,,,,,"))
+        self.assertNotIn(",,", lines[1] + lines[3])
+
+    def test_load_json(self):
+        mag, grav = random_shots(10)
+        mag_loaded, grav_loaded, distance, _ = reprocess.load_shots(self.write_json("shots.json", mag, grav))
+        np.testing.assert_allclose(mag, mag_loaded)
+        self.assertIsNone(distance)
+
+    def test_reprocess_pool(self):
+        fnames = [self.write_json(f"shots{i}.json", *random_shots(20, i)) for i in range(3)]
+        results = list(reprocess.reprocess(fnames, [self.calib, self.calib], jobs=2))
+        self.assertEqual(fnames, [r[0] for r in results])
+        for fname, distance, (first, second) in results:
+            mag, grav, _, _ = reprocess.load_shots(fname)
+            expected = reprocess.process(self.calib, mag, grav)
+            np.testing.assert_allclose(expected["azimuth"], first["azimuth"])
+            np.testing.assert_allclose(expected["azimuth"], second["azimuth"])
+
+    def test_main(self):
+        fname = self.write_json("shots.json", *random_shots(4))
+        out = os.path.join(self.tmp.name, "out.csv")
+        reprocess.main([fname, "-c", CONFIG_FILE, "-o", out, "-j", "1"])
+        with open(out) as f:
+            lines = f.read().splitlines()
+        self.assertEqual("file,calibration,shot,distance,azimuth,inclination,roll,dip,mag_field,grav_field",
+                         lines[0])
+        self.assertEqual(5, len(lines))
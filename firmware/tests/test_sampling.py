@@ -0,0 +1,249 @@
+import asyncio
+import math
+import random
+import time
+from unittest import TestCase
+
+import sampling
+from sampling import median, robust_mean, robust_stats, read_averaged, capture, measure_distance, LASER_OFF_SETTLE
+from simulated_hardware import SimulatedHardware, SimulatedSensor, RM3100_READ_TIME, IMU_READ_TIME, LASER_COMMAND_TIME
+
+
+class TestMedian(TestCase):
+    def test_odd(self):
+        self.assertEqual(2, median([3, 1, 2]))
+
+    def test_even(self):
+        self.assertEqual(2.5, median([4, 1, 2, 3]))
+
+    def test_single(self):
+        self.assertEqual(7, median([7]))
+
+
+class TestRobustMean(TestCase):
+    def test_single_sample(self):
+        mean, spread = robust_mean([(1, 2, 3)])
+        self.assertEqual((1, 2, 3), mean)
+        self.assertEqual(0.0, spread)
+
+    def test_identical_samples(self):
+        mean, spread = robust_mean([(1, 2, 3)] * 5)
+        self.assertEqual((1, 2, 3), mean)
+        self.assertEqual(0.0, spread)
+
+    def test_mean_of_clean_samples(self):
+        samples = [(1, 0, 0), (3, 0, 0), (2, 1, 0), (2, -1, 0)]
+        mean, spread = robust_mean(samples)
+        self.assertEqual((2, 0, 0), mean)
+        self.assertAlmostEqual(1.0, spread)
+
+    def test_rejects_outlier(self):
+        samples = [(1.0, 2.0, 3.0), (1.1, 2.1, 2.9), (0.9, 1.9, 3.1), (1.0, 2.0, 3.0), (1.0, 20.0, 3.0)]
+        mean, spread = robust_mean(samples)
+        for a, b in zip((1.0, 2.0, 3.0), mean):
+            self.assertAlmostEqual(a, b)
+        self.assertLess(spread, 0.2)
+
+    def test_quantised_samples(self):
+        step = sampling.GRAV_RESOLUTION
+        samples = [(0.0, 0.0, 1000 * step)] * 3 + [(step, 0.0, 1001 * step)] * 2
+        # each axis is checked against its own limit, none of which is below one step
+        mean, _ = robust_mean(samples, resolution=step)
+        for a, b in zip((0.4 * step, 0.0, 1000.4 * step), mean):
+            self.assertAlmostEqual(a, b)
+        self.assertNotAlmostEqual(mean[0], robust_mean(samples)[0][0])
+
+
+class TestRobustStats(TestCase):
+    def test_single_value(self):
+        self.assertEqual((4.0, float("inf"), 1), robust_stats([4.0]))
+
+    def test_clean_values(self):
+        mean, error, count = robust_stats([1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(3.0, mean)
+        self.assertAlmostEqual(math.sqrt(2.5 / 5), error)
+        self.assertEqual(5, count)
+
+    def test_rejects_outlier(self):
+        mean, error, count = robust_stats([1000.0, 1001.0, 999.0, 1000.0, 1250.0])
+        self.assertEqual(1000.0, mean)
+        self.assertEqual(4, count)
+        self.assertLess(error, 1.0)
+
+    def test_quantised_values(self):
+        values = [1000, 1000, 1000, 1001, 1001]
+        # without a resolution the readings one step from the others look like outliers
+        self.assertEqual(3, robust_stats(values)[2])
+        mean, error, count = robust_stats(values, resolution=1.0)
+        self.assertEqual(1000.4, mean)
+        self.assertEqual(5, count)
+        # a reading several steps out is still rejected
+        self.assertEqual(5, robust_stats(values + [1005], resolution=1.0)[2])
+
+
+class SimulatedLaser:
+    """
+    A laser with gaussian noise that sometimes measures to something other than the target
+    """
+
+    def __init__(self, distance=1000.0, noise=1.0, stray_rate=0.0, seed=0):
+        self.distance = distance
+        self.noise = noise
+        self.stray_rate = stray_rate
+        self.random = random.Random(seed)
+        self.reads = 0
+
+    async def measure(self) -> float:
+        self.reads += 1
+        await asyncio.sleep(0)
+        if self.random.random() < self.stray_rate:
+            return self.distance * self.random.uniform(0.2, 0.9)
+        return round(self.distance + self.random.gauss(0, self.noise))
+
+
+class TestMeasureDistance(TestCase):
+    def measure(self, laser: SimulatedLaser, **kwargs) -> sampling.Distance:
+        return asyncio.run(measure_distance(laser.measure, **kwargs))
+
+    def test_steady_laser_stops_early(self):
+        laser = SimulatedLaser(noise=0.0)
+        result = self.measure(laser)
+        self.assertEqual(sampling.MIN_DISTANCE_READINGS, laser.reads)
+        self.assertEqual((1000.0, 0.0, sampling.MIN_DISTANCE_READINGS, 0), tuple(result))
+
+    def test_stops_at_target(self):
+        for seed in range(20):
+            laser = SimulatedLaser(noise=1.5, seed=seed)
+            result = self.measure(laser)
+            self.assertEqual(laser.reads, result.count)
+            if result.count < sampling.MAX_DISTANCE_READINGS:
+                self.assertLessEqual(result.error, sampling.TARGET_DISTANCE_ERROR)
+            self.assertLess(abs(result.distance - 1000.0), 4 * max(result.error, 0.3))
+
+    def test_usually_faster_than_ten_readings(self):
+        counts = [self.measure(SimulatedLaser(noise=0.8, seed=seed)).count for seed in range(20)]
+        self.assertLess(sum(counts) / len(counts), 10)
+
+    def test_noisy_laser_stops_at_maximum(self):
+        laser = SimulatedLaser(noise=10.0, seed=1)
+        result = self.measure(laser)
+        self.assertEqual(sampling.MAX_DISTANCE_READINGS, laser.reads)
+        self.assertGreater(result.error, sampling.TARGET_DISTANCE_ERROR)
+        # the error estimate is about right, for 20 readings with a standard deviation of 10
+        self.assertAlmostEqual(10.0 / math.sqrt(20), result.error, delta=1.0)
+
+    def test_rejects_stray_readings(self):
+        worst = 0.0
+        rejected = 0
+        for seed in range(20):
+            result = self.measure(SimulatedLaser(noise=1.0, stray_rate=0.15, seed=seed))
+            worst = max(worst, abs(result.distance - 1000.0))
+            rejected += result.rejected
+        self.assertGreater(rejected, 0)
+        self.assertLess(worst, 2.0)
+
+    def test_quantised_laser_keeps_readings(self):
+        for seed in range(20):
+            # a low noise laser mostly gives the same reading, with some a millimetre either side
+            result = self.measure(SimulatedLaser(noise=0.4, seed=seed))
+            self.assertEqual(0, result.rejected)
+
+    def test_reports_each_reading(self):
+        seen = []
+        self.measure(SimulatedLaser(noise=0.0), on_reading=lambda count, reading: seen.append((count, reading)))
+        self.assertEqual([(i, 1000) for i in range(1, sampling.MIN_DISTANCE_READINGS + 1)], seen)
+
+
+class TestReadAveraged(TestCase):
+    TRUE_MAG = (20.0, -15.0, 40.0)
+
+    def test_reads_requested_number(self):
+        sensor = SimulatedSensor(self.TRUE_MAG, noise=0.1)
+        read_averaged(sensor.read, 7)
+        self.assertEqual(7, sensor.reads)
+
+    def test_noise_reduction(self):
+        sensor = SimulatedSensor(self.TRUE_MAG, noise=0.5, seed=1)
+        single = sum(sensor.error(sensor.read()) for _ in range(200)) / 200
+        burst = sum(sensor.error(read_averaged(sensor.read, 9)[0]) for _ in range(200)) / 200
+        # averaging 9 samples should give roughly a threefold improvement
+        self.assertLess(burst, single / 2)
+
+    def test_spike_rejection(self):
+        sensor = SimulatedSensor(self.TRUE_MAG, noise=0.2, spike_rate=0.1, spike_size=10.0, seed=2)
+        worst_single = max(sensor.error(sensor.read()) for _ in range(200))
+        worst_burst = max(sensor.error(read_averaged(sensor.read, 5)[0]) for _ in range(200))
+        self.assertGreater(worst_single, 5.0)
+        self.assertLess(worst_burst, 1.0)
+
+    def test_spread_reflects_noise(self):
+        quiet = SimulatedSensor(self.TRUE_MAG, noise=0.1, seed=3)
+        noisy = SimulatedSensor(self.TRUE_MAG, noise=1.0, seed=3)
+        self.assertLess(read_averaged(quiet.read, 9)[1], read_averaged(noisy.read, 9)[1])
+
+
+class TestCapture(TestCase):
+    SCALE = 0.25
+
+    def run_capture(self, **kwargs):
+        devices = SimulatedHardware(scale=self.SCALE)
+        start = time.perf_counter()
+        shot = asyncio.run(capture(devices, **kwargs))
+        return devices, shot, time.perf_counter() - start
+
+    def test_sequential(self):
+        devices, shot, _ = self.run_capture(samples=3)
+        self.assertEqual(2500.0, shot.distance)
+        self.assertEqual((20.0, -15.0, 40.0), shot.mag)
+        self.assertEqual((0.0, 0.0, 9.81), shot.grav)
+        self.assertEqual(3, devices.magnetometer.reads)
+        self.assertEqual([False, True], devices.laser_log)
+
+    def test_overlapped(self):
+        devices, shot, _ = self.run_capture(samples=3, guard=0.1 * self.SCALE)
+        self.assertEqual(2500.0, shot.distance)
+        self.assertEqual((20.0, -15.0, 40.0), shot.mag)
+        self.assertEqual((0.0, 0.0, 9.81), shot.grav)
+        self.assertEqual(3, devices.magnetometer.reads)
+        self.assertTrue(devices.laser)
+
+    def test_without_laser(self):
+        devices, shot, _ = self.run_capture(with_laser=False)
+        self.assertIsNone(shot.distance)
+        self.assertEqual(1, devices.magnetometer.reads)
+        self.assertEqual([False, True], devices.laser_log)
+
+    def test_overlap_is_faster(self):
+        _, _, sequential = self.run_capture(samples=5)
+        _, _, overlapped = self.run_capture(samples=5, guard=0.1 * self.SCALE)
+        # sensor reads and the laser off/settle period should be hidden behind the laser measurement
+        saving = (RM3100_READ_TIME + IMU_READ_TIME) * 5 + LASER_COMMAND_TIME + LASER_OFF_SETTLE
+        self.assertLess(overlapped, sequential - saving * self.SCALE * 0.8)
+
+    def test_laser_timeout_cancels_sensors(self):
+        devices = SimulatedHardware(scale=self.SCALE)
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(capture(devices, samples=3, guard=0.5, timeout=0.05))
+        self.assertEqual(0, devices.magnetometer.reads)
+
+
+class TestLaserInterference(TestCase):
+    SCALE = 0.1
+    TRUE_MAG = (20.0, -15.0, 40.0)
+    LASER_BIAS = (0.4, -0.25, 0.1)
+
+    def mag_bias(self, with_laser, guard):
+        devices = SimulatedHardware(scale=self.SCALE, mag=self.TRUE_MAG, laser_mag_bias=self.LASER_BIAS)
+        shot = asyncio.run(capture(devices, with_laser=with_laser, samples=3, guard=guard))
+        return tuple(round(a - b, 6) for a, b in zip(shot.mag, self.TRUE_MAG))
+
+    def test_sequential_reads_with_laser_off(self):
+        self.assertEqual((0.0, 0.0, 0.0), self.mag_bias(True, None))
+
+    def test_overlapped_reads_with_laser_on(self):
+        self.assertEqual(self.LASER_BIAS, self.mag_bias(True, 0.1 * self.SCALE))
+
+    def test_calibration_shots_match_survey_shots(self):
+        for guard in (None, 0.1 * self.SCALE):
+            with self.subTest(guard=guard):
+                self.assertEqual(self.mag_bias(True, guard), self.mag_bias(False, guard))
@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from mag_cal import Calibration
+
+import storage
+from tools.convert_trip import load_calibration, calibration_id
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+
+
+class TestAtomicFiles(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmp.name, "settings.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_and_read(self):
+        storage.write_atomic(self.fname, b"first")
+        storage.write_atomic(self.fname, b"second")
+        self.assertEqual(b"second", storage.read_atomic(self.fname))
+        self.assertFalse(os.path.exists(self.fname + storage.TEMP_SUFFIX))
+
+    def test_missing(self):
+        with self.assertRaises(OSError):
+            storage.read_atomic(self.fname)
+
+    def test_recover_after_old_file_removed(self):
+        # power lost after removing the old file but before renaming the new one
+        with open(self.fname + storage.TEMP_SUFFIX, "wb") as f:
+            f.write(b"new")
+        self.assertEqual(b"new", storage.read_atomic(self.fname))
+
+    def test_old_file_kept_if_new_one_incomplete(self):
+        storage.write_atomic(self.fname, b"old")
+        with open(self.fname + storage.TEMP_SUFFIX, "wb") as f:
+            f.write(b"ne")
+        self.assertEqual(b"old", storage.read_atomic(self.fname))
+        storage.write_atomic(self.fname, b"newer")
+        self.assertEqual(b"newer", storage.read_atomic(self.fname))
+
+    def test_remove(self):
+        storage.write_atomic(self.fname, b"data")
+        storage.remove(self.fname)
+        storage.remove(self.fname)
+        self.assertFalse(os.path.exists(self.fname))
+
+
+class TestCalibrationBlob(TestCase):
+    def setUp(self):
+        with open(CONFIG_FILE) as f:
+            self.calib = Calibration.from_dict(json.load(f)["calib"])
+
+    def test_round_trip(self):
+        blob = storage.pack_calibration(self.calib.as_dict())
+        calib = Calibration.from_dict(storage.unpack_calibration(blob))
+        expected = self.calib.as_dict()
+        actual = calib.as_dict()
+        for name in ("mag", "grav"):
+            self.assertEqual(expected[name]["axes"], actual[name]["axes"])
+            for key in ("transform", "centre", "rbfs", "field_avg", "field_std"):
+                self.assertEqual(json.dumps(expected[name][key]).count(","), json.dumps(actual[name][key]).count(","))
+        mag, grav = (20.0, -30.0, 5.0), (0.5, -0.3, 9.7)
+        for a, b in zip(self.calib.get_angles(mag, grav), calib.get_angles(mag, grav)):
+            self.assertAlmostEqual(a, b, places=3)
+
+    def test_smaller_than_json(self):
+        blob = storage.pack_calibration(self.calib.as_dict())
+        self.assertLess(len(blob), len(json.dumps(self.calib.as_dict())) / 3)
+
+    def test_stable(self):
+        blob = storage.pack_calibration(self.calib.as_dict())
+        calib = Calibration.from_dict(storage.unpack_calibration(blob))
+        self.assertEqual(blob, storage.pack_calibration(calib.as_dict()))
+
+    def test_damaged(self):
+        blob = storage.pack_calibration(self.calib.as_dict())
+        for data in (b"", b"rubbish", blob[:40], b"XXXX" + blob[4:]):
+            with self.subTest(data=data):
+                with self.assertRaises(storage.StorageError):
+                    storage.unpack_calibration(data)
+
+    def test_converter_loads_blob(self):
+        blob = storage.pack_calibration(self.calib.as_dict())
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, "calib.bin")
+            with open(fname, "wb") as f:
+                f.write(blob)
+            calib = load_calibration(fname)
+        self.assertEqual(blob, storage.pack_calibration(calib.as_dict()))
+        self.assertEqual(calibration_id(calib), calibration_id(self.calib))
@@ -0,0 +1,116 @@
+import asyncio
+import tracemalloc
+from unittest import TestCase
+
+from display_refresh import RefreshScheduler
+from text_console import TextConsole
+from virtual_clock import VirtualClock
+
+COLUMNS = 21
+ROWS = 5
+
+TEMPLATE = ("Raw  Accel  Mag\r\n"
+            "X   {: 06.3f} {: 06.2f}\r\n"
+            "Y   {: 06.3f} {: 06.2f}\r\n"
+            "Z   {: 06.3f} {: 06.2f}\r\n"
+            "Voltage: {:4.2f}V")
+
+
+def tile(c):
+    return ord(c) - 32 if " " <= c <= "~" else None
+
+
+class FakeGrid:
+    def __init__(self):
+        self.tiles = {}
+        self.writes = 0
+
+    def __setitem__(self, index, value):
+        self.tiles[index] = value
+        self.writes += 1
+
+    def text(self):
+        rows = []
+        for y in range(ROWS):
+            rows.append("".join(chr(self.tiles[y * COLUMNS + x] + 32) for x in range(COLUMNS)).rstrip())
+        return rows
+
+
+def readings(i):
+    return TEMPLATE.format(9.81, 30 + i * 0.01, 0.01, -12.5, -0.02, 41.25, 3.9)
+
+
+class TestTextConsole(TestCase):
+    def setUp(self):
+        self.grid = FakeGrid()
+        self.console = TextConsole(self.grid, COLUMNS, ROWS, tile)
+        self.grid.writes = 0
+
+    def test_layout(self):
+        self.console.write("Compass: 123°\r\nRoll: 4")
+        self.assertEqual(["Compass: 123", "Roll: 4", "", "", ""], self.grid.text())
+
+    def test_wraps_long_lines(self):
+        self.console.write("a" * 25 + "\nb")
+        self.assertEqual(["a" * 21, "aaaa", "b", "", ""], self.grid.text())
+
+    def test_shows_last_rows(self):
+        self.console.write("\r\n".join(str(i) for i in range(8)))
+        self.assertEqual(["3", "4", "5", "6", "7"], self.grid.text())
+
+    def test_only_changed_cells_written(self):
+        self.assertEqual(len("Waiting"), self.console.write("Waiting"))
+        self.assertEqual(0, self.console.write("Waiting"))
+        self.assertEqual(2, self.console.write("Waitong!"))
+        # shorter text clears what is left over
+        self.assertEqual(4, self.console.write("Wait"))
+        self.assertEqual(len("Waiting") + 2 + 4, self.grid.writes)
+
+    def test_update_allocations(self):
+        texts = [readings(i) for i in range(10)]
+        self.console.write(texts[-1])
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            for text in texts * 5:
+                self.console.write(text)
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLessEqual(after - before, 0)
+        self.assertLess(peak - before, 1024)
+
+    def test_refreshes_per_update(self):
+        refreshes = []
+        clock = VirtualClock()
+        scheduler = RefreshScheduler(lambda: refreshes.append(clock.monotonic()), frame_ms=50,
+                                     clock=clock.monotonic_ns, sleep=clock.sleep)
+        writes = []
+
+        def show(text):
+            grid_writes = self.grid.writes
+            if self.console.write(text):
+                scheduler.request()
+            writes.append(self.grid.writes - grid_writes)
+
+        async def live_screen():
+            task = asyncio.create_task(scheduler.run())
+            await asyncio.sleep(0)
+            try:
+                # 8 updates a second, with the reading changing on every other one
+                for i in range(16):
+                    show(readings(i // 2))
+                    await clock.sleep(0.125)
+            finally:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        clock.run(live_screen)
+        self.assertEqual(8, len(refreshes))
+        self.assertEqual([0] * 8, writes[1::2])
+        # only the changed digits of the magnetometer X reading
+        self.assertTrue(all(0 < count <= 2 for count in writes[2::2]))
@@ -0,0 +1,73 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import timing
+from timing import Histogram, ShotTimer
+
+
+class TestHistogram(TestCase):
+    def test_empty(self):
+        hist = Histogram()
+        self.assertEqual(0, hist.count)
+        self.assertIsNone(hist.mean)
+        self.assertIsNone(hist.percentile(0.5))
+
+    def test_add(self):
+        hist = Histogram()
+        for ms in (0.5, 3, 3, 15, 5000):
+            hist.add(ms)
+        self.assertEqual(5, hist.count)
+        self.assertEqual([1, 0, 2, 0, 1, 0, 0, 0, 0, 0, 0, 1], hist.counts)
+        self.assertAlmostEqual(1004.3, hist.mean)
+        self.assertEqual(0.5, hist.min)
+        self.assertEqual(5000, hist.max)
+
+    def test_percentile(self):
+        hist = Histogram()
+        for _ in range(9):
+            hist.add(30)
+        hist.add(150)
+        self.assertEqual(50, hist.percentile(0.5))
+        self.assertEqual(50, hist.percentile(0.9))
+        self.assertEqual(150, hist.percentile(1.0))
+
+
+class TestShotTimer(TestCase):
+    def test_disabled(self):
+        timer = ShotTimer()
+        mark = timer.start()
+        self.assertEqual(0, mark)
+        timer.lap(timing.LASER, mark)
+        self.assertEqual(0, timer.histograms[timing.LASER].count)
+
+    def test_enabled(self):
+        timer = ShotTimer()
+        timer.enabled = True
+        mark = timer.start()
+        mark = timer.lap(timing.ANGLES, mark)
+        timer.lap(timing.STORE, mark)
+        self.assertEqual(1, timer.histograms[timing.ANGLES].count)
+        self.assertEqual(1, timer.histograms[timing.STORE].count)
+        self.assertEqual(0, timer.histograms[timing.LASER].count)
+
+    def test_summary(self):
+        timer = ShotTimer()
+        timer.histograms[timing.LASER].add(640)
+        lines = timer.summary()
+        self.assertEqual(len(timing.STAGE_NAMES), len(lines))
+        self.assertEqual("Laser     1  640  640", lines[0])
+        self.assertEqual("Mag       0    -    -", lines[1])
+
+    def test_save(self):
+        timer = ShotTimer()
+        timer.histograms[timing.LASER].add(640)
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, "timing.csv")
+            timer.save(fname, header="SW: 1.6.0")
+            with open(fname) as f:
+                lines = f.read().splitlines()
+        self.assertEqual("# SW: 1.6.0", lines[0])
+        self.assertTrue(lines[1].startswith("stage,count,mean,min,max,<1,"))
+        self.assertEqual("Laser,1,640.0,640.0,640.0,0,0,0,0,0,0,0,0,0,1,0,0", lines[2])
+        self.assertEqual(2 + len(timing.STAGE_NAMES), len(lines))
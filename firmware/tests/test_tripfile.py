@@ -0,0 +1,123 @@
+import io
+import os
+from unittest import TestCase
+
+import numpy as np
+
+import tripfile
+from tools import convert_trip
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+
+
+def make_trip(*shots) -> io.BytesIO:
+    data = tripfile.header()
+    for distance, azimuth, inclination in shots:
+        data += tripfile.pack((10.0, 20.0, 30.0), (0.0, 0.0, 9.81), distance, azimuth, inclination, 0x1234)
+    return io.BytesIO(data)
+
+
+class TestTripFile(TestCase):
+    def test_record_smaller_than_csv_line(self):
+        self.assertLess(tripfile.RECORD_SIZE, len(b"12.345, 123.4, +12.3\n") + 2)
+
+    def test_round_trip(self):
+        data = tripfile.pack((12.345, -23.456, 45.678), (-0.123, 9.806, 0.456), 12.3456, 359.996, -45.678, 0xBEEF)
+        self.assertEqual(tripfile.RECORD_SIZE, len(data))
+        record = tripfile.unpack(data)
+        np.testing.assert_allclose((12.345, -23.456, 45.678), record.mag, atol=0.5 / tripfile.MAG_SCALE)
+        np.testing.assert_allclose((-0.123, 9.806, 0.456), record.grav, atol=0.0005)
+        self.assertAlmostEqual(12.346, record.distance)
+        self.assertAlmostEqual(0.0, record.azimuth)
+        self.assertAlmostEqual(-45.68, record.inclination)
+        self.assertEqual(0xBEEF, record.calib_id)
+
+        self.assertFalse(record.saturated)
+
+    def test_full_magnetometer_range(self):
+        record = tripfile.unpack(tripfile.pack((800, -800, 400), (0, 0, 9.81), 1, 0, 0, 0))
+        self.assertEqual((800, -800, 400), record.mag)
+        self.assertFalse(record.saturated)
+
+    def test_out_of_range_values_clipped(self):
+        record = tripfile.unpack(tripfile.pack((1000, -1000, 0), (0, 0, 0), -1, 0, 0, 0))
+        self.assertEqual((32767 / 40, -32768 / 40, 0), record.mag)
+        self.assertEqual(0, record.distance)
+        self.assertTrue(record.saturated)
+
+    def test_read_records(self):
+        f = make_trip((1.0, 10, 5), (2.0, 20, -5))
+        records = list(tripfile.read_records(f))
+        self.assertEqual([1.0, 2.0], [r.distance for r in records])
+
+    def test_partial_record_ignored(self):
+        f = make_trip((1.0, 10, 5), (2.0, 20, -5))
+        f = io.BytesIO(f.getvalue()[:-1])
+        self.assertEqual(1, len(list(tripfile.read_records(f))))
+
+    def test_bad_header(self):
+        for data in (b"", b"Distance, Compass, Clino\n", tripfile.header()[:4] + b"\x09" + tripfile.header()[5:]):
+            with self.subTest(data=data):
+                with self.assertRaises(tripfile.TripFileError):
+                    list(tripfile.read_records(io.BytesIO(data)))
+
+
+class TestConvertTrip(TestCase):
+    def convert(self, f, fmt, **kwargs):
+        out = io.StringIO()
+        convert_trip.convert(f, out, fmt, "Trip00001", **kwargs)
+        return out.getvalue().splitlines()
+
+    def test_csv(self):
+        lines = self.convert(make_trip((1.5, 10, 5), (2.0, 200, -5)), "csv")
+        self.assertEqual(["Distance, Compass, Clino", "1.500, 010.0, +05.0", "2.000, 200.0, -05.0"], lines)
+
+    def test_csv_raw(self):
+        lines = self.convert(make_trip((1.5, 10, 5)), "csv", raw=True)
+        self.assertEqual("1.500, 010.0, +05.0, 10.000, 20.000, 30.000, 0.000, 0.000, 9.810, 1234", lines[1])
+
+    def test_survex_legs_and_splays(self):
+        f = make_trip((1.0, 90, 0),
+                      (5.0, 359.8, 10), (5.01, 0.2, 10), (5.0, 0, 10.1),
+                      (2.0, 180, 0), (3.0, 270, 0))
+        lines = self.convert(f, "survex")
+        self.assertEqual("*begin Trip00001", lines[0])
+        self.assertEqual("*data normal from to tape compass clino", lines[1])
+        self.assertEqual("*end Trip00001", lines[-1])
+        shots = [line.split("\t") for line in lines[2:-1]]
+        # splays go to Survex's anonymous station, as it does not accept "-"
+        self.assertEqual([("0", ".."), ("0", "1"), ("1", ".."), ("1", "..")], [tuple(s[:2]) for s in shots])
+        distance, azimuth, inclination = (float(x) for x in shots[1][2:])
+        self.assertAlmostEqual(5.003, distance, places=3)
+        self.assertAlmostEqual(0.0, azimuth % 360, places=1)
+        self.assertAlmostEqual(10.0, inclination, places=1)
+
+    def test_leg_shots(self):
+        f = make_trip((1.0, 90, 0), (5.0, 10, 10), (5.0, 10, 10), (2.0, 180, 0))
+        lines = self.convert(f, "survex")
+        self.assertEqual(["0\t..", "0\t..", "0\t..", "0\t.."], [line[:4] for line in lines[2:-1]])
+        lines = self.convert(make_trip((1.0, 90, 0), (5.0, 10, 10), (5.0, 10, 10), (2.0, 180, 0)), "survex",
+                             leg_shots=2)
+        self.assertEqual(["0\t..", "0\t1\t", "1\t.."], [line[:4] for line in lines[2:-1]])
+
+    def test_therion(self):
+        lines = self.convert(make_trip((1.0, 90, 0)), "therion")
+        self.assertEqual("centreline", lines[0])
+        self.assertEqual("0\t-\t1.000\t90.0\t0.0", lines[-2])
+        self.assertEqual("endcentreline", lines[-1])
+
+    def test_recalculate(self):
+        calib = convert_trip.load_calibration(CONFIG_FILE)
+        mag, grav = (20.0, -30.0, 5.0), (0.5, -0.3, 9.7)
+        expected = calib.get_angles(mag, grav)
+        f = io.BytesIO(tripfile.header() + tripfile.pack(mag, grav, 1.0, 0, 0, 0))
+        record = next(convert_trip.recalculate(tripfile.read_records(f), calib))
+        self.assertAlmostEqual(expected[0] % 360, record.azimuth, delta=0.05)
+        self.assertAlmostEqual(expected[1], record.inclination, delta=0.05)
+        self.assertEqual(convert_trip.calibration_id(calib), record.calib_id)
+
+    def test_recalculate_leaves_saturated_records(self):
+        calib = convert_trip.load_calibration(CONFIG_FILE)
+        f = io.BytesIO(tripfile.header() + tripfile.pack((900.0, -30.0, 5.0), (0.5, -0.3, 9.7), 1.0, 123.4, 5.6, 7))
+        record = next(convert_trip.recalculate(tripfile.read_records(f), calib))
+        self.assertEqual((123.4, 5.6, 7), (record.azimuth, record.inclination, record.calib_id))
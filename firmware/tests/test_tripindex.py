@@ -0,0 +1,108 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import tripfile
+from tripindex import TripIndex, Trip, INDEX_NAME
+
+
+class TestTripIndex(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name + "/"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_trip(self, index: TripIndex, shots: int) -> str:
+        index.new_trip().close()
+        path = index.path(index.trips[-1])
+        for _ in range(shots):
+            record = tripfile.pack((1, 2, 3), (0, 0, 9.8), 1.0, 10, 5, 0)
+            with open(path, "ab") as f:
+                f.write(record)
+            index.record(len(record))
+        return path
+
+    def test_empty(self):
+        index = TripIndex(self.dir)
+        self.assertEqual([], index.trips)
+        self.assertEqual(1, index.next_number())
+
+    def test_new_trips(self):
+        index = TripIndex(self.dir)
+        self.assertEqual(self.dir + "Trip00001.bin", self.write_trip(index, 2))
+        self.assertEqual(self.dir + "Trip00002.bin", self.write_trip(index, 3))
+        self.assertEqual([2, 3], [t.shots for t in index.trips])
+
+    def test_persisted(self):
+        index = TripIndex(self.dir)
+        self.write_trip(index, 2)
+        self.write_trip(index, 3)
+        index = TripIndex(self.dir)
+        expected = [Trip(1, True, 2, tripfile.HEADER_SIZE + 2 * tripfile.RECORD_SIZE),
+                    Trip(2, True, 3, tripfile.HEADER_SIZE + 3 * tripfile.RECORD_SIZE)]
+        self.assertEqual(expected, index.trips)
+        self.assertEqual(3, index.next_number())
+
+    def test_next_number_does_not_list_directory(self):
+        TripIndex(self.dir).rebuild()
+        index = TripIndex(self.dir)
+        index.scan = None  # would fail if called
+        self.assertEqual(1, index.next_number())
+
+    def test_rebuilt_from_directory(self):
+        with open(self.dir + "Trip00003.csv", "w") as f:
+            f.write("Distance, Compass, Clino\n1.000, 010.0, +05.0\n2.000, 020.0, +05.0\n")
+        with open(self.dir + "Trip00007.bin", "wb") as f:
+            f.write(tripfile.header() + tripfile.pack((1, 2, 3), (0, 0, 9.8), 1.0, 10, 5, 0))
+        with open(self.dir + "notes.txt", "w") as f:
+            f.write("not a trip\n")
+        index = TripIndex(self.dir)
+        self.assertEqual([(3, False, 2), (7, True, 1)], [t[:3] for t in index.trips])
+        self.assertEqual(self.dir + "Trip00003.csv", index.path(index.trips[0]))
+        self.assertEqual(8, index.next_number())
+        self.assertTrue(os.path.exists(self.dir + INDEX_NAME))
+
+    def test_corrupt_index_rebuilt(self):
+        self.write_trip(TripIndex(self.dir), 2)
+        with open(self.dir + INDEX_NAME, "wb") as f:
+            f.write(b"rubbish")
+        self.assertEqual([2], [t.shots for t in TripIndex(self.dir).trips])
+
+    def test_stale_index_does_not_overwrite(self):
+        index = TripIndex(self.dir)
+        self.write_trip(index, 1)
+        # simulate a trip file created without the index being updated
+        with open(self.dir + "Trip00002.bin", "wb") as f:
+            f.write(tripfile.header())
+        self.assertEqual(3, TripIndex(self.dir).next_number())
+
+    def test_last_trip_size_recovered(self):
+        index = TripIndex(self.dir)
+        path = self.write_trip(index, 1)
+        # simulate power lost after writing the data but before updating the index
+        with open(path, "ab") as f:
+            f.write(tripfile.pack((1, 2, 3), (0, 0, 9.8), 1.0, 10, 5, 0))
+        self.assertEqual(2, TripIndex(self.dir).trips[-1].shots)
+        self.assertEqual(2, TripIndex(self.dir).trips[-1].shots)
+
+    def test_failed_trip_not_indexed(self):
+        index = TripIndex(self.dir)
+        self.write_trip(index, 1)
+        trip_path = self.dir + "Trip00002.bin"
+        real_open = open
+
+        def failing_open(path, *args, **kwargs):
+            if path == trip_path:
+                raise OSError(30, "Read-only filesystem")
+            return real_open(path, *args, **kwargs)
+
+        with mock.patch("builtins.open", failing_open):
+            for _ in range(3):
+                # each flush retries
+                with self.assertRaises(OSError):
+                    index.new_trip()
+        self.assertEqual([1], [t.number for t in index.trips])
+        self.assertEqual([1], [t.number for t in TripIndex(self.dir).trips])
+        self.assertEqual(trip_path, index.path(Trip(index.next_number(), True, 0, 0)))
@@ -0,0 +1,125 @@
+import asyncio
+import io
+from unittest import TestCase
+
+from triplog import TripLog
+
+
+class RecordingFile(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+
+class TestTripLog(TestCase):
+    def setUp(self):
+        self.file = RecordingFile()
+        self.opens = 0
+
+    def opener(self):
+        self.opens += 1
+        return self.file
+
+    def test_write_does_not_touch_file(self):
+        log = TripLog(self.opener)
+        log.write(b"1.000, 2.0, +3.0\n")
+        self.assertEqual(0, self.opens)
+        self.assertEqual(17, log.pending)
+
+    def test_flush(self):
+        log = TripLog(self.opener)
+        log.write(b"abc\n")
+        log.write(b"def\n")
+        log.flush()
+        self.assertEqual(b"abc\ndef\n", self.file.getvalue())
+        self.assertEqual(1, self.file.flushes)
+        self.assertEqual(0, log.pending)
+
+    def test_flush_without_data_does_not_open(self):
+        log = TripLog(self.opener)
+        log.flush()
+        self.assertEqual(0, self.opens)
+
+    def test_opens_once(self):
+        log = TripLog(self.opener)
+        for i in range(3):
+            log.write(b"abc\n")
+            log.flush()
+        self.assertEqual(1, self.opens)
+
+    def test_flush_due(self):
+        log = TripLog(self.opener, flush_size=10, idle_time=1.0)
+        self.assertFalse(log.flush_due(1e9))
+        log.write(b"abc\n")
+        now = log._last_write
+        self.assertFalse(log.flush_due(now + 0.5))
+        self.assertTrue(log.flush_due(now + 1.0))
+
+    def test_flush_due_when_large(self):
+        log = TripLog(self.opener, flush_size=10, idle_time=1.0)
+        log.write(b"0123456789")
+        self.assertTrue(log.flush_due(log._last_write))
+
+    def test_flush_due_on_commit(self):
+        log = TripLog(self.opener, flush_size=100, idle_time=1.0)
+        log.write(b"abc\n")
+        log.write(b"def\n", commit=True)
+        # a later shot in a rapid series does not hold back the committed data
+        log.write(b"ghi\n")
+        self.assertTrue(log.flush_due(log._last_write))
+        log.flush()
+        self.assertEqual(b"abc\ndef\nghi\n", self.file.getvalue())
+        log.write(b"jkl\n")
+        self.assertFalse(log.flush_due(log._last_write))
+
+    def test_full_buffer_flushes(self):
+        log = TripLog(self.opener, buffer_size=8)
+        log.write(b"abcdef")
+        log.write(b"ghijkl")
+        self.assertEqual(b"abcdef", self.file.getvalue())
+        self.assertEqual(6, log.pending)
+
+    def test_open_failure(self):
+        log = TripLog(lambda: None)
+        log.write(b"abc\n")
+        log.flush()
+        self.assertEqual(4, log.dropped)
+        self.assertEqual(0, log.pending)
+
+    def test_on_flush(self):
+        flushed = []
+        log = TripLog(self.opener, on_flush=flushed.append)
+        log.write(b"abc\n")
+        log.write(b"def\n")
+        log.flush()
+        log.flush()
+        self.assertEqual([8], flushed)
+
+    def test_on_flush_not_called_on_failure(self):
+        flushed = []
+        log = TripLog(lambda: None, on_flush=flushed.append)
+        log.write(b"abc\n")
+        log.flush()
+        self.assertEqual([], flushed)
+
+    def test_background_task(self):
+        log = TripLog(self.opener, idle_time=0.1)
+
+        async def run():
+            task = asyncio.create_task(log.background_task())
+            log.write(b"abc\n")
+            await asyncio.sleep(0.6)
+            task.cancel()
+
+        asyncio.run(run())
+        self.assertEqual(b"abc\n", self.file.getvalue())
+
+    def test_close(self):
+        log = TripLog(self.opener)
+        log.write(b"abc\n")
+        log.close()
+        self.assertTrue(self.file.closed)
@@ -0,0 +1,58 @@
+"""
+A clock for tests of code that waits, so that they do not depend on how busy the host is. Time only
+moves on when every task is waiting for it, and then jumps straight to the next task due to wake.
+"""
+import asyncio
+import heapq
+
+IDLE_PASSES = 20
+"""Times round the event loop before deciding that every task is waiting for the clock"""
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now_ns = 0
+        self._sleepers = []
+        self._count = 0
+
+    def monotonic_ns(self) -> int:
+        return self.now_ns
+
+    def monotonic(self) -> float:
+        return self.now_ns / 1000000000
+
+    async def sleep(self, seconds: float):
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now_ns + round(seconds * 1000000000), self._count, future))
+        self._count += 1
+        await future
+
+    def run(self, coro_func):
+        """
+        Run a coroutine function, and any tasks it starts, to completion
+
+        :return: Result of the coroutine
+        """
+        async def main():
+            task = asyncio.create_task(coro_func())
+            while True:
+                for _ in range(IDLE_PASSES):
+                    await asyncio.sleep(0)
+                if task.done():
+                    return task.result()
+                while self._sleepers and self._sleepers[0][2].done():
+                    # cancelled while sleeping
+                    heapq.heappop(self._sleepers)
+                if not self._sleepers:
+                    raise RuntimeError("Every task is waiting, but not for the clock")
+                wake = self._sleepers[0][0]
+                self.now_ns = max(self.now_ns, wake)
+                while self._sleepers and self._sleepers[0][0] == wake:
+                    future = heapq.heappop(self._sleepers)[2]
+                    if not future.done():
+                        future.set_result(None)
+
+        return asyncio.run(main())
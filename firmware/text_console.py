@@ -0,0 +1,104 @@
+"""
+A screen of text that stays on the display, for information screens that are updated several times
+a second. Rather than building a new terminal for each update, the text is laid out as
+``terminalio.Terminal`` would and only the character cells that have changed are written to the
+TileGrid.
+"""
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Callable, Dict, Optional
+except ImportError:
+    pass
+
+
+class TextConsole:
+    """
+    Lays out text on a grid of character cells. Lines longer than the grid wrap onto the next row,
+    and if there are more rows than fit, the last ones are shown, as the terminal would scroll
+    """
+
+    def __init__(self, grid, columns: int, rows: int, tile: Callable[[str], Optional[int]]):
+        """
+        :param grid: TileGrid of ``columns`` by ``rows`` cells, or anything that can be indexed in
+          the same way
+        :param columns: Width of the grid in characters
+        :param rows: Height of the grid in characters
+        :param tile: Returns the tile index for a character, or None if the font does not have it
+        """
+        self.grid = grid
+        self.columns = columns
+        self.rows = rows
+        self._tile = tile
+        self._tiles: Dict[str, int] = {}
+        self.blank = self._tile_for(" ")
+        self.cells = [self.blank] * (columns * rows)
+        for i in range(columns * rows):
+            grid[i] = self.blank
+
+    def _tile_for(self, c: str) -> int:
+        tile = self._tiles.get(c)
+        if tile is None:
+            tile = self._tile(c)
+            if tile is None:
+                tile = self.blank
+            self._tiles[c] = tile
+        return tile
+
+    def _set(self, index: int, tile: int) -> int:
+        if self.cells[index] == tile:
+            return 0
+        self.cells[index] = tile
+        self.grid[index] = tile
+        return 1
+
+    def _clear(self, start: int, end: int) -> int:
+        changed = 0
+        for index in range(start, end):
+            changed += self._set(index, self.blank)
+        return changed
+
+    def _count_rows(self, text: str) -> int:
+        row = col = 0
+        for c in text:
+            if c == "\r":
+                col = 0
+            elif c == "\n":
+                row += 1
+                col = 0
+            else:
+                if col >= self.columns:
+                    row += 1
+                    col = 0
+                col += 1
+        return row + 1
+
+    def write(self, text: str) -> int:
+        """
+        Replace the text on the grid
+
+        :param text: Text to show, with lines ending in ``"\\r\\n"`` or ``"\\n"``
+        :return: Number of cells that changed
+        """
+        skip = max(self._count_rows(text) - self.rows, 0)
+        changed = 0
+        filled = 0
+        row = col = 0
+        for c in text:
+            if c == "\r":
+                col = 0
+                continue
+            if c == "\n":
+                row += 1
+                col = 0
+                continue
+            if col >= self.columns:
+                row += 1
+                col = 0
+            if row >= skip:
+                index = (row - skip) * self.columns + col
+                changed += self._clear(filled, index)
+                changed += self._set(index, self._tile_for(c))
+                filled = index + 1
+            col += 1
+        changed += self._clear(filled, self.columns * self.rows)
+        return changed
@@ -0,0 +1,158 @@
+import time
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import List, Optional
+except ImportError:
+    pass
+
+LASER = 0
+MAG = 1
+GRAV = 2
+ANGLES = 3
+ANOMALY = 4
+STORE = 5
+BLUETOOTH = 6
+DISPLAY = 7
+
+STAGE_NAMES = ("Laser", "Mag", "Grav", "Angles", "Anomaly", "Store", "BT", "Display")
+
+BIN_EDGES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+"""Upper edges of histogram bins in ms. There is a final bin for anything slower"""
+
+TIMING_FILE = "/shot_timing.csv"
+
+
+class Histogram:
+    """
+    Fixed size histogram of durations in milliseconds
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BIN_EDGES) + 1)
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, ms: float):
+        """
+        Record a duration
+
+        :param ms: Duration in milliseconds
+        """
+        i = 0
+        for edge in BIN_EDGES:
+            if ms < edge:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total += ms
+        if self.min is None or ms < self.min:
+            self.min = ms
+        if self.max is None or ms > self.max:
+            self.max = ms
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def mean(self) -> Optional[float]:
+        count = self.count
+        if count == 0:
+            return None
+        return self.total / count
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        Estimate a percentile from the histogram
+
+        :param fraction: Fraction of readings that are faster than the result, e.g. 0.9
+        :return: Upper edge of the bin containing that percentile (or `max` if in the final bin)
+        """
+        count = self.count
+        if count == 0:
+            return None
+        target = fraction * count
+        running = 0
+        for edge, bin_count in zip(BIN_EDGES, self.counts):
+            running += bin_count
+            if running >= target:
+                return min(edge, self.max)
+        return self.max
+
+
+class ShotTimer:
+    """
+    Collects the time taken by each stage of a shot. Does nothing unless `enabled` is set.
+
+    Usage::
+
+        mark = timer.start()
+        do_something()
+        mark = timer.lap(timing.ANGLES, mark)
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms: List[Histogram] = [Histogram() for _ in STAGE_NAMES]
+
+    def start(self) -> int:
+        """
+        :return: Time marker to pass to `lap`, or 0 if not enabled
+        """
+        if not self.enabled:
+            return 0
+        return time.monotonic_ns()
+
+    def lap(self, stage: int, mark: int) -> int:
+        """
+        Record the time since ``mark`` against ``stage``
+
+        :param stage: Stage to record, e.g. `ANGLES`
+        :param mark: Marker from `start` or a previous `lap`
+        :return: New time marker
+        """
+        if not self.enabled:
+            return 0
+        now = time.monotonic_ns()
+        self.histograms[stage].add((now - mark) / 1000000)
+        return now
+
+    def reset(self):
+        self.histograms = [Histogram() for _ in STAGE_NAMES]
+
+    def summary(self) -> List[str]:
+        """
+        :return: One line of text per stage: name, count, mean and 90th percentile in ms
+        """
+        lines = []
+        for name, hist in zip(STAGE_NAMES, self.histograms):
+            if hist.count:
+                lines.append(f"{name:7} {hist.count:3} {hist.mean:4.0f} {hist.percentile(0.9):4.0f}")
+            else:
+                lines.append(f"{name:7}   0    -    -")
+        return lines
+
+    def save(self, fname: str = TIMING_FILE, header: str = ""):
+        """
+        Write all the histograms to a CSV file
+
+        :param fname: File to write to
+        :param header: Text to put at the top of the file e.g. firmware version
+        """
+        with open(fname, "w") as f:
+            if header:
+                f.write(f"# {header}\n")
+            edges = ",".join(f"<{x}" for x in BIN_EDGES)
+            f.write(f"stage,count,mean,min,max,{edges},>={BIN_EDGES[-1]}\n")
+            for name, hist in zip(STAGE_NAMES, self.histograms):
+                if hist.count:
+                    stats = f"{hist.mean:.1f},{hist.min:.1f},{hist.max:.1f}"
+                else:
+                    stats = ",,"
+                counts = ",".join(str(x) for x in hist.counts)
+                f.write(f"{name},{hist.count},{stats},{counts}\n")
+
+
+shot_timer = ShotTimer()
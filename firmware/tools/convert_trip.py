@@ -0,0 +1,248 @@
+"""
+Convert binary trip files (``TripXXXXX.bin``) saved by the device to CSV, Survex or Therion.
+
+Run from the ``firmware`` directory::
+
+    python -m tools.convert_trip Trip00001.bin --format survex -o Trip00001.svx
+
+Records are streamed from the input, so files of any size can be converted. If ``--config`` is
+given, the angles are recalculated from the raw sensor readings using that calibration (the
+device's ``calib.bin``), so an old trip can be reprocessed after the device has been recalibrated.
+"""
+import argparse
+import binascii
+import json
+import math
+import os
+import sys
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+except ImportError:
+    pass
+
+import legs
+import storage
+import tripfile
+
+FORMATS = ("csv", "survex", "therion")
+
+LEG_SHOTS = 3
+"""Default number of shots to the same point that make a leg, as ``leg_shots`` on the device"""
+
+Shot = Tuple[float, float, float]  # distance, azimuth, inclination
+
+
+def recalculate(records: Iterable[tripfile.Record], calib) -> Iterator[tripfile.Record]:
+    """
+    Recalculate angles from the raw readings in each record. Records whose readings were clipped
+    are left as they are, as the angles the device worked out from the full readings are better
+
+    :param records: Records from a trip file
+    :param calib: `mag_cal.Calibration` to use
+    :return: Records with new azimuth, inclination and calibration id
+    """
+    calib_id = calibration_id(calib)
+    for record in records:
+        if record.saturated:
+            yield record
+            continue
+        azimuth, inclination, _ = calib.get_angles(record.mag, record.grav)
+        yield record._replace(azimuth=float(azimuth) % 360, inclination=float(inclination), calib_id=calib_id)
+
+
+def calibration_id(calib) -> int:
+    """
+    :return: The same identifier the device stores for this calibration, see `Config.calib_id`
+    """
+    return binascii.crc32(storage.pack_calibration(calib.as_dict())) & 0xFFFF
+
+
+def load_calibration(fname: str):
+    """
+    Load a calibration from a device ``calib.bin``, a device ``config.json`` from older firmware,
+    or a JSON file holding just the calibration
+
+    :param fname: Path to file
+    :return: `mag_cal.Calibration`
+    """
+    from mag_cal import Calibration
+    if fname.endswith(".bin"):
+        with open(fname, "rb") as f:
+            return Calibration.from_dict(storage.unpack_calibration(f.read()))
+    with open(fname) as f:
+        dct = json.load(f)
+    if "calib" in dct:
+        dct = dct["calib"]
+    if not dct:
+        raise ValueError(f"No calibration found in {fname}")
+    return Calibration.from_dict(dct)
+
+
+def average(shots: List[Shot]) -> Shot:
+    """
+    Average several shots to the same point, averaging direction as a vector so that azimuths
+    either side of north are handled properly
+    """
+    count = len(shots)
+    distance = sum(s[0] for s in shots) / count
+    x, y, z = (sum(axis) / count for axis in zip(*(legs.direction(s[1], s[2]) for s in shots)))
+    azimuth = math.degrees(math.atan2(x, y)) % 360
+    inclination = math.degrees(math.atan2(z, math.hypot(x, y)))
+    return distance, azimuth, inclination
+
+
+def survey_shots(records: Iterable[tripfile.Record], shots: int = LEG_SHOTS) -> Iterator[Tuple[bool, Shot]]:
+    """
+    Group records into legs and splays, in the same way as the device: ``shots`` consecutive
+    shots to the same point are a leg, anything else is a splay
+
+    :param records: Records from a trip file
+    :param shots: Number of shots that make up a leg
+    :return: Iterator of (is_leg, (distance, azimuth, inclination)); legs are averaged
+    """
+    detector = legs.LegDetector(shots, shots)
+    pending: List[Shot] = []
+    for record in records:
+        shot = (record.distance, record.azimuth, record.inclination)
+        pending.append(shot)
+        if detector.add(record.azimuth, record.inclination, record.distance):
+            yield True, average(pending[-shots:])
+            pending.clear()
+            detector.clear()
+        elif len(pending) >= shots:
+            yield False, pending.pop(0)
+    for shot in pending:
+        yield False, shot
+
+
+class CSVWriter:
+    """
+    Writes one line per shot, in the same format as the CSV files from older firmware
+    """
+
+    def __init__(self, out: TextIO, name: str, raw: bool = False, leg_shots: int = LEG_SHOTS):
+        self.out = out
+        self.raw = raw
+        header = "Distance, Compass, Clino"
+        if raw:
+            header += ", Mag X, Mag Y, Mag Z, Grav X, Grav Y, Grav Z, Calib ID"
+        out.write(header + "\n")
+
+    def convert(self, records: Iterable[tripfile.Record]):
+        for record in records:
+            line = f"{record.distance:.3f}, {record.azimuth:05.1f}, {record.inclination:+05.1f}"
+            if self.raw:
+                values = record.mag + record.grav
+                line += "".join(f", {x:.3f}" for x in values) + f", {record.calib_id:04x}"
+            self.out.write(line + "\n")
+
+    def close(self):
+        pass
+
+
+class CentrelineWriter:
+    """
+    Base class for survey data formats: legs join numbered stations in turn, splays are written
+    from the most recent station
+    """
+
+    SPLAY = "-"
+    """Station name for the far end of a splay"""
+
+    def __init__(self, out: TextIO, name: str, raw: bool = False, leg_shots: int = LEG_SHOTS):
+        self.out = out
+        self.name = name
+        self.leg_shots = leg_shots
+        self.station = 0
+        self.start()
+
+    def start(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def convert(self, records: Iterable[tripfile.Record]):
+        for is_leg, (distance, azimuth, inclination) in survey_shots(records, self.leg_shots):
+            data = f"{distance:.3f}\t{azimuth:.1f}\t{inclination:.1f}"
+            if is_leg:
+                self.out.write(f"{self.station}\t{self.station + 1}\t{data}\n")
+                self.station += 1
+            else:
+                self.out.write(f"{self.station}\t{self.SPLAY}\t{data}\n")
+
+
+class SurvexWriter(CentrelineWriter):
+    # Survex's anonymous station, which it treats as a splay
+    SPLAY = ".."
+
+    def start(self):
+        self.out.write(f"*begin {self.name}\n")
+        self.out.write("*data normal from to tape compass clino\n")
+
+    def close(self):
+        self.out.write(f"*end {self.name}\n")
+
+
+class TherionWriter(CentrelineWriter):
+    def start(self):
+        self.out.write("centreline\n")
+        self.out.write(f"  # {self.name}\n")
+        self.out.write("  data normal from to length compass clino\n")
+
+    def close(self):
+        self.out.write("endcentreline\n")
+
+
+WRITERS = {
+    "csv": CSVWriter,
+    "survex": SurvexWriter,
+    "therion": TherionWriter,
+}
+
+
+def convert(infile, out: TextIO, fmt: str = "csv", name: str = "trip", calib=None, raw: bool = False,
+            leg_shots: int = LEG_SHOTS):
+    """
+    Convert a binary trip file
+
+    :param infile: Trip file, opened in binary mode
+    :param out: Text file to write to
+    :param fmt: One of `FORMATS`
+    :param name: Name of the survey, used by Survex and Therion
+    :param calib: If given, a `mag_cal.Calibration` to recalculate angles with
+    :param raw: Include raw sensor readings (CSV only)
+    :param leg_shots: Number of shots to the same point that make a leg (Survex and Therion only)
+    """
+    records = tripfile.read_records(infile)
+    if calib is not None:
+        records = recalculate(records, calib)
+    writer = WRITERS[fmt](out, name, raw, leg_shots)
+    writer.convert(records)
+    writer.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Convert a SAP trip file to CSV, Survex or Therion")
+    parser.add_argument("trip", help="TripXXXXX.bin file from the device's readings directory")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="csv")
+    parser.add_argument("-o", "--output", help="File to write, default is standard output")
+    parser.add_argument("-c", "--config", help="calib.bin or config.json with a calibration to recalculate angles with")
+    parser.add_argument("--raw", action="store_true", help="Include raw sensor readings in CSV output")
+    parser.add_argument("-l", "--leg-shots", type=int, default=LEG_SHOTS,
+                        help=f"Shots to the same point that make a leg, as set on the device (default {LEG_SHOTS})")
+    args = parser.parse_args(argv)
+    calib = load_calibration(args.config) if args.config else None
+    name = os.path.splitext(os.path.basename(args.trip))[0]
+    with open(args.trip, "rb") as infile:
+        if args.output:
+            with open(args.output, "w") as out:
+                convert(infile, out, args.format, name, calib, args.raw, args.leg_shots)
+        else:
+            convert(infile, sys.stdout, args.format, name, calib, args.raw, args.leg_shots)
+
+
+if __name__ == "__main__":
+    main()
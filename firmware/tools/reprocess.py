@@ -0,0 +1,182 @@
+"""
+Apply one or more calibrations to whole files of recorded shots at once.
+
+Run from the ``firmware`` directory::
+
+    python -m tools.reprocess Trip00001.bin debug_shots.json -c calib.bin -c old_config.json -o out.csv
+
+Input files can be binary trip files (``TripXXXXX.bin``) or JSON files with ``mag`` and ``grav``
+lists, such as ``debug_shots.json`` and ``calibration_data.json``. Each calibration can be a device
+``calib.bin``, a ``config.json`` from older firmware, or a JSON file holding just a calibration.
+For every shot in every file, and every calibration, the output has azimuth, inclination, roll,
+dip and field strengths. Shots from trip files whose readings were clipped (see
+`tripfile.Record`) are left blank, as angles worked out from them would be wrong.
+
+Calculations are done on whole arrays with NumPy rather than shot by shot, and files are spread
+across a pool of processes, so tens of thousands of shots take a few seconds.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Dict, List, Optional, Sequence, Tuple
+except ImportError:
+    pass
+
+import tripfile
+from tools.convert_trip import load_calibration
+
+COLUMNS = ("azimuth", "inclination", "roll", "dip", "mag_field", "grav_field")
+
+
+def _trip_dtype(record_size: int) -> np.dtype:
+    return np.dtype({
+        "names": ("mag", "grav", "distance", "azimuth", "inclination", "calib_id"),
+        "formats": (("<i2", 3), ("<i2", 3), "<u4", "<u2", "<i2", "<u2"),
+        "offsets": (0, 6, 12, 16, 18, 20),
+        "itemsize": record_size,
+    })
+
+
+def _saturated(readings: np.ndarray) -> np.ndarray:
+    return np.any((readings == tripfile.INT16_MIN) | (readings == tripfile.INT16_MAX), axis=1)
+
+
+def load_shots(fname: str) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """
+    Load raw readings from a file
+
+    :param fname: Binary trip file, or JSON file with ``mag`` and ``grav`` entries
+    :return: mag, grav, distance and saturated arrays; mag and grav have shape (N, 3). distance is
+      None for JSON files. saturated is True for each shot with a clipped reading, as
+      ``tripfile.Record.saturated``
+    """
+    if fname.endswith("." + tripfile.EXTENSION):
+        with open(fname, "rb") as f:
+            record_size = tripfile.read_header(f).record_size
+            data = f.read()
+        count = len(data) // record_size
+        records = np.frombuffer(data, dtype=_trip_dtype(record_size), count=count)
+        return (records["mag"] / tripfile.MAG_SCALE,
+                records["grav"] / tripfile.GRAV_SCALE,
+                records["distance"] / tripfile.DISTANCE_SCALE,
+                _saturated(records["mag"]) | _saturated(records["grav"]))
+    with open(fname) as f:
+        dct = json.load(f)
+    mag = np.array(dct["mag"], dtype=float).reshape((-1, 3))
+    grav = np.array(dct["grav"], dtype=float).reshape((-1, 3))
+    return mag, grav, None, np.zeros(len(mag), dtype=bool)
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+
+
+def process(calib, mag: np.ndarray, grav: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Apply a calibration to many shots. Results match ``Calibration.get_angles``,
+    ``get_dips`` and ``get_field_strengths``, but are calculated for all shots together
+
+    :param calib: `mag_cal.Calibration` to use
+    :param mag: Raw magnetometer readings, shape (N, 3)
+    :param grav: Raw accelerometer readings, shape (N, 3)
+    :return: Dict of arrays of length N, with keys from `COLUMNS`
+    """
+    mag = calib.mag.apply(np.array(mag, dtype=float))
+    grav = calib.grav.apply(np.array(grav, dtype=float))
+    mag_field = np.linalg.norm(mag, axis=1) / np.mean(np.diag(calib.mag.transform))
+    grav_field = np.linalg.norm(grav, axis=1) / np.mean(np.diag(calib.grav.transform))
+    mag = _normalise(mag)
+    down = _normalise(grav)
+    up = -down
+    east = _normalise(np.cross(mag, up))
+    north = _normalise(np.cross(up, east))
+    # rows of the orientation matrix are east, north and up
+    theta1 = np.arctan2(east[:, 1], north[:, 1])
+    theta2 = np.arctan2(up[:, 1] * np.cos(theta1), north[:, 1])
+    theta3 = np.arctan2(-up[:, 0], up[:, 2])
+    dots = np.clip(np.einsum("ij,ij->i", mag, down), -1.0, 1.0)
+    return {
+        "azimuth": np.degrees(theta1) % 360,
+        "inclination": ((np.degrees(theta2) + 90) % 180) - 90,
+        "roll": np.degrees(theta3),
+        "dip": 90 - np.degrees(np.arccos(dots)),
+        "mag_field": mag_field,
+        "grav_field": grav_field,
+    }
+
+
+_worker_calibs = []
+
+
+def _init_worker(calib_dicts: List[dict]):
+    from mag_cal import Calibration
+    global _worker_calibs
+    _worker_calibs = [Calibration.from_dict(dct) for dct in calib_dicts]
+
+
+def _process_file(fname: str) -> Tuple[str, Optional[np.ndarray], List[Dict[str, np.ndarray]]]:
+    mag, grav, distance, saturated = load_shots(fname)
+    results = [process(calib, mag, grav) for calib in _worker_calibs]
+    for result in results:
+        for values in result.values():
+            values[saturated] = np.nan
+    return fname, distance, results
+
+
+def reprocess(fnames: Sequence[str], calibs: Sequence, jobs: Optional[int] = None):
+    """
+    Apply every calibration to every file
+
+    :param fnames: Files to load, see `load_shots`
+    :param calibs: `mag_cal.Calibration` objects to apply
+    :param jobs: Number of worker processes. Default is one per CPU; 1 processes in this process
+    :return: Iterator of (fname, distance, results) in the same order as ``fnames``, where
+      results has one dict from `process` per calibration. Results for saturated shots are NaN
+    """
+    calib_dicts = [calib.as_dict() for calib in calibs]
+    if jobs == 1 or len(fnames) < 2:
+        _init_worker(calib_dicts)
+        for fname in fnames:
+            yield _process_file(fname)
+        return
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(calib_dicts,)) as pool:
+        yield from pool.map(_process_file, fnames)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Apply calibrations to recorded shots")
+    parser.add_argument("files", nargs="+", help="Trip files (.bin) or JSON shot files")
+    parser.add_argument("-c", "--config", action="append", required=True,
+                        help="calib.bin, config.json or calibration file to apply; may be given more than once")
+    parser.add_argument("-o", "--output", help="CSV file to write, default is standard output")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of processes, default one per CPU")
+    args = parser.parse_args(argv)
+    calibs = [load_calibration(fname) for fname in args.config]
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(("file", "calibration", "shot", "distance") + COLUMNS)
+        for fname, distance, results in reprocess(args.files, calibs, args.jobs):
+            name = os.path.basename(fname)
+            for calib_name, result in zip(args.config, results):
+                columns = [result[k] for k in COLUMNS]
+                for i, values in enumerate(zip(*columns)):
+                    dist = "" if distance is None else f"{distance[i]:.3f}"
+                    # saturated shots are left blank
+                    writer.writerow([name, calib_name, i, dist] +
+                                    ["" if np.isnan(x) else f"{x:.2f}" for x in values])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
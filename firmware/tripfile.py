@@ -0,0 +1,139 @@
+"""
+Binary trip file format. A trip file starts with an 8 byte header: ``b"SAPT"``, a version byte, the
+record size and two reserved bytes. This is followed by one fixed size record per shot, all
+little-endian:
+
+=========== ========== =====================================
+Field       Type       Units
+=========== ========== =====================================
+mag         3 x int16  0.025 µT, raw magnetometer reading
+grav        3 x int16  0.001 m/s², raw accelerometer reading
+distance    uint32     mm, including laser offset
+azimuth     uint16     0.01°
+inclination int16      0.01°
+calib_id    uint16     identifies calibration used for angles
+=========== ========== =====================================
+
+The magnetometer scale covers the whole range of the RM3100, ±800 µT. Readings that do not fit are
+clipped, and such records are read back with ``saturated`` set.
+"""
+import struct
+from collections import namedtuple
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import BinaryIO, Iterator, Sequence
+except ImportError:
+    pass
+
+MAGIC = b"SAPT"
+VERSION = 1
+HEADER_FORMAT = "<4sBBH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = "<3h3hIHhH"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+EXTENSION = "bin"
+
+MAG_SCALE = 40
+GRAV_SCALE = 1000
+DISTANCE_SCALE = 1000
+ANGLE_SCALE = 100
+
+Record = namedtuple("Record", ("mag", "grav", "distance", "azimuth", "inclination", "calib_id", "saturated"))
+
+Header = namedtuple("Header", ("version", "record_size"))
+
+
+class TripFileError(Exception):
+    """
+    File is not a trip file, or is from an unknown version
+    """
+
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+
+def _to_int16(value: float, scale: int) -> int:
+    return max(INT16_MIN, min(INT16_MAX, round(value * scale)))
+
+
+def header() -> bytes:
+    """
+    :return: Header to write at start of a trip file
+    """
+    return struct.pack(HEADER_FORMAT, MAGIC, VERSION, RECORD_SIZE, 0)
+
+
+def pack(mag: Sequence[float], grav: Sequence[float], distance: float,
+         azimuth: float, inclination: float, calib_id: int) -> bytes:
+    """
+    Convert a shot to a binary record
+
+    :param mag: Raw magnetometer reading in µT
+    :param grav: Raw accelerometer reading in m/s²
+    :param distance: Distance in metres
+    :param azimuth: Azimuth in degrees
+    :param inclination: Inclination in degrees
+    :param calib_id: Calibration identifier, see `Config.calib_id`
+    :return: Record as bytes
+    """
+    values = (tuple(_to_int16(x, MAG_SCALE) for x in mag) +
+              tuple(_to_int16(x, GRAV_SCALE) for x in grav) +
+              (max(0, round(distance * DISTANCE_SCALE)),
+               round((azimuth % 360) * ANGLE_SCALE) % (360 * ANGLE_SCALE),
+               _to_int16(inclination, ANGLE_SCALE),
+               calib_id & 0xFFFF))
+    return struct.pack(RECORD_FORMAT, *values)
+
+
+def unpack(data: bytes) -> Record:
+    """
+    Convert a binary record back to a shot
+
+    :param data: Record of `RECORD_SIZE` bytes
+    :return: `Record`, in the same units as given to `pack`, with ``saturated`` True if any sensor
+      reading was clipped
+    """
+    values = struct.unpack(RECORD_FORMAT, data)
+    return Record(mag=tuple(x / MAG_SCALE for x in values[0:3]),
+                  grav=tuple(x / GRAV_SCALE for x in values[3:6]),
+                  distance=values[6] / DISTANCE_SCALE,
+                  azimuth=values[7] / ANGLE_SCALE,
+                  inclination=values[8] / ANGLE_SCALE,
+                  calib_id=values[9],
+                  saturated=any(x in (INT16_MIN, INT16_MAX) for x in values[0:6]))
+
+
+def read_header(f: BinaryIO) -> Header:
+    """
+    Read and check the header of a trip file
+
+    :param f: File opened in binary mode, positioned at the start
+    :return: `Header` with the file's version and the size of each record
+    :raises TripFileError: if not a trip file
+    """
+    data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise TripFileError("File too short")
+    magic, version, record_size, _ = struct.unpack(HEADER_FORMAT, data)
+    if magic != MAGIC:
+        raise TripFileError("Not a trip file")
+    if version > VERSION or record_size < RECORD_SIZE:
+        raise TripFileError(f"Unknown trip file version {version}")
+    return Header(version, record_size)
+
+
+def read_records(f: BinaryIO) -> Iterator[Record]:
+    """
+    Read each shot in turn from a trip file. Any incomplete final record is ignored
+
+    :param f: File opened in binary mode, positioned at the start
+    :return: Iterator of `Record`
+    """
+    record_size = read_header(f).record_size
+    while True:
+        data = f.read(record_size)
+        if len(data) < record_size:
+            return
+        yield unpack(data[:RECORD_SIZE])
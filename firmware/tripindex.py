@@ -0,0 +1,230 @@
+"""
+Index of the trip files in the readings directory, so that the next trip number can be found, and
+trips listed, without listing the directory. The index file starts with an 8 byte header:
+``b"SAPI"``, a version byte, the entry size and two reserved bytes. This is followed by one fixed
+size entry per trip, in trip order: trip number (uint16), whether it is a binary trip file
+(uint8), number of shots (uint32) and size of the file in bytes (uint32), all little-endian.
+
+If the index is missing or unreadable it is rebuilt by scanning the directory, so deleting it is
+always safe.
+"""
+import os
+import re
+import struct
+from collections import namedtuple
+
+try:
+    from . import tripfile
+except ImportError:
+    # running on the host, not as part of the firmware package
+    import tripfile
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import BinaryIO, List, Optional
+except ImportError:
+    pass
+
+INDEX_NAME = "index.bin"
+MAGIC = b"SAPI"
+VERSION = 1
+HEADER_FORMAT = "<4sBBH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ENTRY_FORMAT = "<HBII"
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+
+Trip = namedtuple("Trip", ("number", "binary", "shots", "size"))
+
+_TRIP_PATTERN = re.compile(r"Trip(\d\d\d\d\d)\.(csv|bin)")
+
+
+class TripIndex:
+    """
+    Keeps track of the trips in a directory. The index is read the first time it is needed, and
+    updated in place as trips are created and written to.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory holding the trip files, with a trailing ``/``
+        """
+        self.directory = directory
+        self._fname = directory + INDEX_NAME
+        self._trips: Optional[List[Trip]] = None
+        self._writable = True
+
+    @property
+    def trips(self) -> List[Trip]:
+        """All known trips, oldest first"""
+        self._load()
+        return self._trips
+
+    def path(self, trip: Trip) -> str:
+        """
+        :return: Path of the file for a trip
+        """
+        ext = tripfile.EXTENSION if trip.binary else "csv"
+        return f"{self.directory}Trip{trip.number:05}.{ext}"
+
+    def next_number(self) -> int:
+        """
+        :return: Number to use for the next trip
+        """
+        self._load()
+        number = self._trips[-1].number + 1 if self._trips else 1
+        # the index may be behind if it could not be written last time: never overwrite a trip
+        while self._exists(self.path(Trip(number, True, 0, 0))):
+            number += 1
+        return number
+
+    def new_trip(self) -> BinaryIO:
+        """
+        Create a new binary trip file and write its header, then add it to the index. Nothing is
+        added to the index if the file cannot be created
+
+        :return: The new trip file, open for writing after the header
+        :raises OSError: if the file cannot be created
+        """
+        trip = Trip(self.next_number(), True, 0, tripfile.HEADER_SIZE)
+        path = self.path(trip)
+        f = open(path, "wb")
+        try:
+            f.write(tripfile.header())
+        except OSError:
+            f.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise
+        self._trips.append(trip)
+        if self._writable:
+            try:
+                with open(self._fname, "ab") as index:
+                    index.write(self._pack(trip))
+            except OSError:
+                self._discard()
+        return f
+
+    def record(self, size: int):
+        """
+        Note that data has been written to the newest trip
+
+        :param size: Number of bytes appended to the trip file
+        """
+        self._load()
+        if self._trips:
+            self._set_size(self._trips[-1].size + size)
+
+    def _set_size(self, size: int):
+        trip = self._binary_trip(self._trips[-1].number, size)
+        self._trips[-1] = trip
+        if not self._writable:
+            return
+        try:
+            with open(self._fname, "r+b") as f:
+                f.seek(HEADER_SIZE + (len(self._trips) - 1) * ENTRY_SIZE)
+                f.write(self._pack(trip))
+        except OSError:
+            self._discard()
+
+    def scan(self) -> List[Trip]:
+        """
+        Find all trips by listing the directory. This is only needed if the index is missing
+
+        :return: All trips, oldest first
+        """
+        trips = []
+        for fname in os.listdir(self.directory):
+            match = _TRIP_PATTERN.match(fname)
+            if not match:
+                continue
+            path = self.directory + fname
+            size = os.stat(path)[6]
+            if match.group(2) == "csv":
+                trips.append(Trip(int(match.group(1)), False, self._count_lines(path) - 1, size))
+            else:
+                trips.append(self._binary_trip(int(match.group(1)), size))
+        trips.sort()
+        return trips
+
+    def rebuild(self):
+        """
+        Recreate the index from the directory contents
+        """
+        self._trips = self.scan()
+        try:
+            with open(self._fname, "wb") as f:
+                f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, ENTRY_SIZE, 0))
+                for trip in self._trips:
+                    f.write(self._pack(trip))
+        except OSError:
+            self._discard()
+
+    def _load(self):
+        if self._trips is not None:
+            return
+        try:
+            self._trips = self._read()
+        except (OSError, ValueError):
+            self.rebuild()
+            return
+        if self._trips and self._trips[-1].binary:
+            # the last flush may not have reached the index before power was lost
+            last = self._trips[-1]
+            try:
+                size = os.stat(self.path(last))[6]
+            except OSError:
+                return
+            if size != last.size:
+                self._set_size(size)
+
+    def _read(self) -> List[Trip]:
+        with open(self._fname, "rb") as f:
+            data = f.read(HEADER_SIZE)
+            if len(data) < HEADER_SIZE:
+                raise ValueError("Index too short")
+            magic, version, entry_size, _ = struct.unpack(HEADER_FORMAT, data)
+            if magic != MAGIC or version != VERSION or entry_size != ENTRY_SIZE:
+                raise ValueError("Not a trip index")
+            trips = []
+            while True:
+                data = f.read(ENTRY_SIZE)
+                if len(data) < ENTRY_SIZE:
+                    return trips
+                number, binary, shots, size = struct.unpack(ENTRY_FORMAT, data)
+                trips.append(Trip(number, bool(binary), shots, size))
+
+    def _discard(self):
+        # index is out of date and can't be fixed, remove it so it is rebuilt next time
+        self._writable = False
+        try:
+            os.remove(self._fname)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _pack(trip: Trip) -> bytes:
+        return struct.pack(ENTRY_FORMAT, trip.number, int(trip.binary), trip.shots, trip.size)
+
+    @staticmethod
+    def _binary_trip(number: int, size: int) -> Trip:
+        return Trip(number, True, max(0, size - tripfile.HEADER_SIZE) // tripfile.RECORD_SIZE, size)
+
+    @staticmethod
+    def _exists(path: str) -> bool:
+        try:
+            os.stat(path)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _count_lines(path: str) -> int:
+        count = 0
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(256)
+                if not data:
+                    return count
+                count += data.count(b"\n")
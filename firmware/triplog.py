@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+try:
+    # noinspection PyUnresolvedReferences
+    from typing import Callable, Optional, BinaryIO
+except ImportError:
+    pass
+
+BUFFER_SIZE = 1024
+"""Size of RAM buffer for data waiting to be written"""
+
+FLUSH_SIZE = 512
+"""Write to flash once this much data is waiting"""
+
+IDLE_TIME = 1.0
+"""Write to flash once nothing has been logged for this many seconds"""
+
+POLL_TIME = 0.25
+"""How often the background task checks whether to write"""
+
+
+class TripLog:
+    """
+    Write-behind log for trip data. `write` only copies data into a fixed RAM buffer, so it
+    never touches the flash; `background_task` writes the buffer out at its next poll once a shot
+    is written with ``commit`` set (the shot that completes a leg), otherwise once shots stop for
+    `IDLE_TIME` seconds or the buffer is filling up.
+
+    A power loss therefore never loses a completed leg, but can lose the splays and the shots of a
+    leg in progress taken in the last `IDLE_TIME` seconds, or in a series of shots with no pause
+    that long.
+    """
+
+    def __init__(self, opener: Callable[[], Optional[BinaryIO]], buffer_size: int = BUFFER_SIZE,
+                 flush_size: int = FLUSH_SIZE, idle_time: float = IDLE_TIME,
+                 on_flush: Optional[Callable[[int], None]] = None):
+        """
+        :param opener: Function to call to open the file the first time data is written. Should
+          return None if the file cannot be opened
+        :param on_flush: Function to call with the number of bytes written, each time data is
+          successfully written to the file
+        """
+        self._opener = opener
+        self._on_flush = on_flush
+        self._file: Optional[BinaryIO] = None
+        self._buffer = bytearray(buffer_size)
+        self._used = 0
+        self.flush_size = flush_size
+        self.idle_time = idle_time
+        self._last_write = 0.0
+        self._commit = False
+        self.dropped = 0
+        """Number of bytes that could not be saved"""
+
+    @property
+    def pending(self) -> int:
+        """Number of bytes waiting to be written"""
+        return self._used
+
+    def write(self, data: bytes, commit: bool = False):
+        """
+        Queue data to be written to the file
+
+        :param data: Data to write
+        :param commit: Write this and everything before it at the next poll, rather than waiting
+          for shots to stop
+        """
+        now = time.monotonic()
+        if self._used + len(data) > len(self._buffer):
+            # background task has not kept up: this should not happen in normal use
+            self.flush()
+            if len(data) > len(self._buffer):
+                self.dropped += len(data)
+                return
+        self._buffer[self._used:self._used + len(data)] = data
+        self._used += len(data)
+        self._last_write = now
+        self._commit = self._commit or commit
+
+    def flush_due(self, now: float) -> bool:
+        """
+        :param now: Current time from ``time.monotonic()``
+        :return: True if waiting data should be written now
+        """
+        if self._used == 0:
+            return False
+        return (self._commit or
+                self._used >= self.flush_size or
+                now - self._last_write >= self.idle_time)
+
+    def flush(self):
+        """
+        Write any waiting data to flash
+        """
+        if self._used == 0:
+            return
+        self._commit = False
+        if self._file is None:
+            self._file = self._opener()
+            if self._file is None:
+                self.dropped += self._used
+                self._used = 0
+                return
+        try:
+            self._file.write(memoryview(self._buffer)[:self._used])
+            self._file.flush()
+        except OSError:
+            self.dropped += self._used
+        else:
+            if self._on_flush is not None:
+                self._on_flush(self._used)
+        self._used = 0
+
+    async def background_task(self):
+        """
+        Write waiting data to flash whenever `flush_due`
+        """
+        while True:
+            await asyncio.sleep(POLL_TIME)
+            if self.flush_due(time.monotonic()):
+                self.flush()
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
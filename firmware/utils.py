@@ -5,6 +5,9 @@ import microcontroller
 import memorymap
 import sys
 
+# kept in linalg so it can be run on the host; calibrate patches utils.lstsq into mag_cal
+from .linalg import lstsq  # noqa: F401
+
 try:
     import typing
     # noinspection PyUnresolvedReferences
@@ -120,23 +123,6 @@ def check_mem(text: str):
     logger.debug(f"{text} mem: {gc.mem_free()}")
 
 
-# noinspection PyPep8Naming
-def lstsq(A, B):
-    from mag_cal.utils import np, ULAB_PRESENT
-    if ULAB_PRESENT:
-        from ulab import scipy
-    else:
-        import scipy
-
-    A_sq = np.dot(A.transpose(), A)
-    R = np.linalg.cholesky(A_sq)
-    if ULAB_PRESENT:
-        x = scipy.linalg.cho_solve(R, np.dot(A.transpose(), B))
-    else:
-        x = scipy.linalg.cho_solve((R, True), np.dot(A.transpose(), B))
-    return x, None
-
-
 def disk_free():
     """
     :return: Disk space available in kB
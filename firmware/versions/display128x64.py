@@ -5,10 +5,12 @@ try:
 except ImportError:
     pass
 
+import bitmaptools
 import displayio
 import terminalio
 from adafruit_bitmap_font import bitmap_font
 from adafruit_display_text import label
+from adafruit_progressbar.horizontalprogressbar import HorizontalProgressBar
 from adafruit_progressbar.verticalprogressbar import VerticalProgressBar
 from displayio import TileGrid, Bitmap
 try:
@@ -22,11 +24,124 @@ from ..config import Config
 from ..data import Leg
 from ..debug import logger
 from ..display import DisplayBase
+from ..display_refresh import RefreshScheduler
+from ..text_console import TextConsole
 from ..utils import convert_voltage_to_progress, clean_block_text
 
 WIDTH = 128
 HEIGHT = 64
 
+MEASUREMENT_GLYPHS = " 0123456789+-.°gm'\"EHVxtens:"
+"""Characters the measurement screen can show without rendering text, space must come first"""
+
+MEASUREMENT_LINES = (9, 31, 53)
+"""Vertical centre of each line of the measurement screen, as for ``label.Label``"""
+
+MEASUREMENT_COLUMNS = 8
+"""Characters per line of the measurement screen, leaving room for the icons"""
+
+# drawn when the font has no degree sign
+DEGREE_SIGN = (
+    "0110",
+    "1001",
+    "1001",
+    "0110",
+)
+
+
+def create_sprite_sheet(font, glyphs: str):
+    """
+    Draw the glyphs of a monospaced font side by side in one bitmap, so that text can be shown by
+    setting the tiles of a TileGrid instead of rendering each glyph
+
+    :param font: Font from ``bitmap_font.load_font``
+    :param glyphs: Characters to include, each becomes the tile with the same index
+    :return: (bitmap, tile width, tile height, ascent) where ascent is the height of the tiles above
+      the baseline
+    """
+    font.load_glyphs(glyphs)
+    found = [font.get_glyph(ord(c)) for c in glyphs]
+    found = [glyph for glyph in found if glyph is not None]
+    tile_width = max(glyph.shift_x for glyph in found)
+    ascent = max(glyph.height + glyph.dy for glyph in found)
+    descent = max(-glyph.dy for glyph in found)
+    tile_height = ascent + descent
+    sheet = Bitmap(tile_width * len(glyphs), tile_height, 2)
+    for i, c in enumerate(glyphs):
+        glyph = font.get_glyph(ord(c))
+        if glyph is not None:
+            x = i * tile_width + max(glyph.dx, 0)
+            y = ascent - glyph.height - glyph.dy
+            bitmaptools.blit(sheet, glyph.bitmap, x, y)
+        elif c == "°":
+            x = i * tile_width + (tile_width - len(DEGREE_SIGN[0])) // 2
+            y = ascent - font.get_glyph(ord("0")).height
+            for row, pixels in enumerate(DEGREE_SIGN):
+                for col, pixel in enumerate(pixels):
+                    sheet[x + col, y + row] = int(pixel)
+    # the glyphs are no longer needed once drawn
+    font._glyphs = {}
+    return sheet, tile_width, tile_height, ascent
+
+
+class MeasurementWidget(displayio.Group):
+    """
+    Three lines of large text for the measurement screen, and the reading index, that stays on the
+    display between shots. Showing a new reading only changes tile indices
+    """
+
+    def __init__(self, font):
+        super().__init__()
+        sheet, tile_width, tile_height, ascent = create_sprite_sheet(font, MEASUREMENT_GLYPHS)
+        shader = displayio.Palette(2)
+        shader[0] = 0x000000
+        shader[1] = 0xffffff
+        # lines overlap slightly, so the background must not hide the line above
+        shader.make_transparent(0)
+        # place the baseline where label.Label would put it for a line centred on each y
+        half_height = font.get_bounding_box()[1] // 2
+        self._tiles = {c: i for i, c in enumerate(MEASUREMENT_GLYPHS)}
+        self._lines = []
+        self._texts = [""] * len(MEASUREMENT_LINES)
+        for y in MEASUREMENT_LINES:
+            grid = TileGrid(sheet, pixel_shader=shader, width=MEASUREMENT_COLUMNS, height=1,
+                            tile_width=tile_width, tile_height=tile_height,
+                            default_tile=0, x=1, y=y + half_height - ascent)
+            self._lines.append(grid)
+            self.append(grid)
+        self._index = label.Label(terminalio.FONT, text="", color=0xffffff)
+        self._index.anchored_position = (127, 32)
+        self._index.anchor_point = (1.0, 0.5)
+        self.append(self._index)
+
+    def can_show(self, texts: Sequence[str]) -> bool:
+        """
+        :return: True if every line fits and uses only glyphs in the sprite sheet
+        """
+        return len(texts) == len(self._lines) and all(
+            len(text) <= MEASUREMENT_COLUMNS and all(c in self._tiles for c in text) for text in texts)
+
+    def show(self, texts: Sequence[str], index_text: str):
+        """
+        Show new text, which `can_show` must allow
+
+        :param texts: Text for each line
+        :param index_text: Reading index to show at the right
+        """
+        for i, text in enumerate(texts):
+            old = self._texts[i]
+            if text == old:
+                continue
+            grid = self._lines[i]
+            for col in range(max(len(text), len(old))):
+                tile = self._tiles[text[col]] if col < len(text) else 0
+                old_tile = self._tiles[old[col]] if col < len(old) else 0
+                if tile != old_tile:
+                    grid[col] = tile
+            self._texts[i] = text
+        if self._index.text != index_text:
+            self._index.text = index_text
+
 
 class Display(DisplayBase):
     MEASURE = 0
@@ -52,6 +167,13 @@ class Display(DisplayBase):
         self._icon_group.append(self._bt_pending_tile)
         self._current_group = None
         self._inverted = False
+        self._progress_text = None
+        self._progress_group = None
+        self._progress_bar = None
+        self._measurement = None
+        self._console = None
+        self._console_group = None
+        self._scheduler = RefreshScheduler(self.oled.refresh)
 
     @staticmethod
     def create_big_text_group(big_text: Sequence[str], index_txt):
@@ -78,6 +200,8 @@ class Display(DisplayBase):
         return measurement_group
 
     def _set_group_with_icons(self, group):
+        if group is self._current_group and self.oled.root_group is self._icon_group:
+            return
         if self._current_group:
             self._icon_group.remove(self._current_group)
         self._current_group = group
@@ -104,9 +228,17 @@ class Display(DisplayBase):
             index_text = ""
         else:
             index_text = str(index)
-        group = self.create_big_text_group((azimuth_text, inclination_text, distance_text), index_text)
+        texts = (azimuth_text, inclination_text, distance_text)
+        if self._measurement is None:
+            self._measurement = MeasurementWidget(font_20)
+        if self._measurement.can_show(texts):
+            self._measurement.show(texts, index_text)
+            group = self._measurement
+        else:
+            group = self.create_big_text_group(texts, index_text)
         self._set_group_with_icons(group)
-        self.refresh()
+        # shot results go straight to the display
+        self.refresh_now()
 
     def set_bt_connected(self, connected: bool):
         currently_connected = self._bt_icon[0] == 1
@@ -134,49 +266,87 @@ class Display(DisplayBase):
         self.refresh()
 
     def refresh(self):
-        self.oled.refresh()
+        self._scheduler.request()
+
+    def refresh_now(self):
+        self._scheduler.now()
+
+    def refresh_task(self):
+        return self._scheduler.run()
 
-    def show_info(self, text, clean=False):
+    def show_info(self, text, clean=False, live=False):
         if clean:
             text = clean_block_text(text)
         logger.debug(f"show_info: text: {repr(text)}")
-        splash = displayio.Group()
-        fontx, fonty = terminalio.FONT.get_bounding_box()
-        term_palette = displayio.Palette(2)
-        term_palette[0] = 0x000000
-        term_palette[1] = 0xffffff
-        logbox = displayio.TileGrid(terminalio.FONT.bitmap,
-                                    x=0,
-                                    y=0,
-                                    width=self.oled.width // fontx,
-                                    height=self.oled.height // fonty,
-                                    tile_width=fontx,
-                                    tile_height=fonty,
-                                    pixel_shader=term_palette)
-        splash.append(logbox)
-        logterm = terminalio.Terminal(logbox, terminalio.FONT)
-
-        self.oled.root_group = splash
-        logterm.write(text)
-        self.oled.refresh()
+        if self._console is None:
+            self._console_group = displayio.Group()
+            fontx, fonty = terminalio.FONT.get_bounding_box()
+            term_palette = displayio.Palette(2)
+            term_palette[0] = 0x000000
+            term_palette[1] = 0xffffff
+            columns = self.oled.width // fontx
+            rows = self.oled.height // fonty
+            logbox = displayio.TileGrid(terminalio.FONT.bitmap,
+                                        x=0,
+                                        y=0,
+                                        width=columns,
+                                        height=rows,
+                                        tile_width=fontx,
+                                        tile_height=fonty,
+                                        pixel_shader=term_palette)
+            self._console_group.append(logbox)
+            self._console = TextConsole(logbox, columns, rows, self._console_tile)
+        changed = self._console.write(text)
+        if self.oled.root_group is not self._console_group:
+            self.oled.root_group = self._console_group
+            changed = True
+        if not changed:
+            return
+        if live:
+            # updated several times a second, share frames with anything else changing
+            self.refresh()
+        else:
+            # the user may be about to press a button in response to this
+            self.refresh_now()
+
+    @staticmethod
+    def _console_tile(c: str) -> Optional[int]:
+        glyph = terminalio.FONT.get_glyph(ord(c))
+        return None if glyph is None else glyph.tile_index
 
     def show_big_info(self, text):
         group = self.create_big_text_group(text.splitlines(), "")
         logger.debug("show_big_info tvo")
         try:
-            self.show_group(group)
+            # used for errors in place of a shot result
+            self.oled.root_group = group
+            self.refresh_now()
         except MemoryError:
             # spic17: do nothing when memory is spent. We may still recover when gc occurs.
             pass
 
+    def show_progress(self, text, fraction):
+        # only build the screen when the text changes, after that just move the bar
+        if text != self._progress_text or self.oled.root_group is not self._progress_group:
+            group = displayio.Group()
+            group.append(label.Label(terminalio.FONT, text=text, color=0xffffff, x=0, y=20))
+            self._progress_bar = HorizontalProgressBar((0, 36), (WIDTH, 10), max_value=100)
+            group.append(self._progress_bar)
+            self._progress_group = group
+            self._progress_text = text
+            self.oled.root_group = group
+        self._progress_bar.value = min(max(int(fraction * 100), 0), 100)
+        self.refresh()
+
     def show_bitmap_info(self, bitmap_name):
         group = displayio.Group()
         info_bmp = bitmaps[bitmap_name]
         info_tile = displayio.TileGrid(info_bmp, pixel_shader=palette, x=0, y=0)
         group.append(info_tile)
         try:
+            # used for errors in place of a shot result
             self._set_group_with_icons(group)
-            self.refresh()
+            self.refresh_now()
         except MemoryError:
             # spic17: do nothing. Doing anything here may lead to an outer memory error.
             # hopefully, we recover - otherwise we are off no worse than when crashing directly.
@@ -189,6 +359,9 @@ class Display(DisplayBase):
         if self._current_group:
             self._icon_group.remove(self._current_group)
             self._current_group = None
+        self._progress_text = None
+        self._progress_group = None
+        self._progress_bar = None
         font_20._glyphs = {}
         self.oled.group = None
 
@@ -209,6 +382,7 @@ class Display(DisplayBase):
         self.refresh()
 
     def sleep(self, wake=False):
+        self._scheduler.flush()
         if wake:
             if hasattr(self.oled, "wake"):
                 self.oled.wake()
@@ -217,6 +391,7 @@ class Display(DisplayBase):
                 self.oled.sleep()
 
     def deinit(self):
+        self._scheduler.flush()
         if self._current_group:
             self._icon_group.remove(self._current_group)
 